@@ -0,0 +1,78 @@
+# Copyright (c) 2014, The Linux Foundation. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 and
+# only version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import hashlib
+import json
+import os
+
+# Bump this whenever what's stored in the sidecar changes.
+INFO_VERSION = 1
+
+# What RamDump works out about a dump when it's first opened (hardware,
+# memory layout, MMU, Linux version, kernel configuration) is saved next
+# to the dump as <first dump file>.ramparse.json so later runs can skip
+# all of that. The file records a fingerprint of everything the results
+# depend on; one with a different fingerprint or INFO_VERSION is
+# ignored and replaced.
+INFO_SUFFIX = '.ramparse.json'
+
+
+def inputs_fingerprint(paths, extra=()):
+    """Returns a hash of the paths, sizes and modification times of the
+    files in `paths' that exist, plus the values in `extra'."""
+    h = hashlib.sha1()
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except EnvironmentError:
+            continue
+        h.update('{0} {1} {2}\n'.format(os.path.abspath(path), st.st_size,
+                                        int(st.st_mtime)))
+    h.update(repr(tuple(extra)))
+    return h.hexdigest()
+
+
+def load_dump_info(path, fingerprint):
+    """Returns the dictionary saved at `path' by save_dump_info, or None
+    if there isn't one that matches `fingerprint'."""
+    try:
+        with open(path, 'rb') as f:
+            info = json.load(f)
+    except (EnvironmentError, ValueError):
+        return None
+    if not isinstance(info, dict):
+        return None
+    if info.get('version') != INFO_VERSION:
+        return None
+    if info.get('fingerprint') != fingerprint:
+        return None
+    return info
+
+
+def save_dump_info(path, fingerprint, info):
+    """Saves the dictionary `info' at `path'. Returns False if it can't
+    be written (e.g. the dump is on a read-only share), which isn't an
+    error."""
+    info = dict(info)
+    info['version'] = INFO_VERSION
+    info['fingerprint'] = fingerprint
+    tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp, 'wb') as f:
+            json.dump(info, f, indent=1, sort_keys=True)
+        os.rename(tmp, path)
+    except (EnvironmentError, TypeError, ValueError):
+        try:
+            os.remove(tmp)
+        except EnvironmentError:
+            pass
+        return False
+    return True
@@ -0,0 +1,920 @@
+# Copyright (c) 2014, The Linux Foundation. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 and
+# only version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import re
+import mmap
+import struct
+import bisect
+
+from elf import ElfFile, STB_GLOBAL, SHF_COMPRESSED
+
+# tags
+DW_TAG_array_type = 0x01
+DW_TAG_enumeration_type = 0x04
+DW_TAG_member = 0x0d
+DW_TAG_pointer_type = 0x0f
+DW_TAG_reference_type = 0x10
+DW_TAG_structure_type = 0x13
+DW_TAG_typedef = 0x16
+DW_TAG_union_type = 0x17
+DW_TAG_subrange_type = 0x21
+DW_TAG_base_type = 0x24
+DW_TAG_const_type = 0x26
+DW_TAG_enumerator = 0x28
+DW_TAG_variable = 0x34
+DW_TAG_volatile_type = 0x35
+DW_TAG_restrict_type = 0x37
+DW_TAG_atomic_type = 0x47
+
+# attributes
+DW_AT_sibling = 0x01
+DW_AT_name = 0x03
+DW_AT_byte_size = 0x0b
+DW_AT_bit_size = 0x0d
+DW_AT_const_value = 0x1c
+DW_AT_lower_bound = 0x22
+DW_AT_upper_bound = 0x2f
+DW_AT_count = 0x37
+DW_AT_data_member_location = 0x38
+DW_AT_declaration = 0x3c
+DW_AT_specification = 0x47
+DW_AT_type = 0x49
+DW_AT_data_bit_offset = 0x6b
+DW_AT_str_offsets_base = 0x72
+
+# forms
+DW_FORM_addr = 0x01
+DW_FORM_block2 = 0x03
+DW_FORM_block4 = 0x04
+DW_FORM_data2 = 0x05
+DW_FORM_data4 = 0x06
+DW_FORM_data8 = 0x07
+DW_FORM_string = 0x08
+DW_FORM_block = 0x09
+DW_FORM_block1 = 0x0a
+DW_FORM_data1 = 0x0b
+DW_FORM_flag = 0x0c
+DW_FORM_sdata = 0x0d
+DW_FORM_strp = 0x0e
+DW_FORM_udata = 0x0f
+DW_FORM_ref_addr = 0x10
+DW_FORM_ref1 = 0x11
+DW_FORM_ref2 = 0x12
+DW_FORM_ref4 = 0x13
+DW_FORM_ref8 = 0x14
+DW_FORM_ref_udata = 0x15
+DW_FORM_indirect = 0x16
+DW_FORM_sec_offset = 0x17
+DW_FORM_exprloc = 0x18
+DW_FORM_flag_present = 0x19
+DW_FORM_strx = 0x1a
+DW_FORM_addrx = 0x1b
+DW_FORM_ref_sup4 = 0x1c
+DW_FORM_strp_sup = 0x1d
+DW_FORM_data16 = 0x1e
+DW_FORM_line_strp = 0x1f
+DW_FORM_ref_sig8 = 0x20
+DW_FORM_implicit_const = 0x21
+DW_FORM_loclistx = 0x22
+DW_FORM_rnglistx = 0x23
+DW_FORM_ref_sup8 = 0x24
+DW_FORM_strx1 = 0x25
+DW_FORM_strx2 = 0x26
+DW_FORM_strx3 = 0x27
+DW_FORM_strx4 = 0x28
+DW_FORM_addrx1 = 0x29
+DW_FORM_addrx2 = 0x2a
+DW_FORM_addrx3 = 0x2b
+DW_FORM_addrx4 = 0x2c
+
+DW_UT_compile = 0x01
+DW_UT_partial = 0x03
+
+DW_OP_constu = 0x10
+DW_OP_plus_uconst = 0x23
+
+# forms whose size doesn't depend on the unit or the data
+_FIXED_FORM_SIZES = {
+    DW_FORM_data1: 1, DW_FORM_ref1: 1, DW_FORM_flag: 1, DW_FORM_strx1: 1,
+    DW_FORM_addrx1: 1,
+    DW_FORM_data2: 2, DW_FORM_ref2: 2, DW_FORM_strx2: 2, DW_FORM_addrx2: 2,
+    DW_FORM_strx3: 3, DW_FORM_addrx3: 3,
+    DW_FORM_data4: 4, DW_FORM_ref4: 4, DW_FORM_ref_sup4: 4,
+    DW_FORM_strx4: 4, DW_FORM_addrx4: 4,
+    DW_FORM_data8: 8, DW_FORM_ref8: 8, DW_FORM_ref_sig8: 8,
+    DW_FORM_ref_sup8: 8,
+    DW_FORM_data16: 16,
+    DW_FORM_flag_present: 0, DW_FORM_implicit_const: 0,
+}
+_OFFSET_FORMS = (DW_FORM_strp, DW_FORM_sec_offset, DW_FORM_line_strp,
+                 DW_FORM_strp_sup)
+_REF_FORMS = (DW_FORM_ref1, DW_FORM_ref2, DW_FORM_ref4, DW_FORM_ref8,
+              DW_FORM_ref_udata)
+
+# the top level DIEs we keep an index of
+_INDEX_TAGS = {
+    DW_TAG_structure_type: 'struct',
+    DW_TAG_union_type: 'union',
+    DW_TAG_enumeration_type: 'enum',
+    DW_TAG_typedef: 'typedef',
+    DW_TAG_base_type: 'base',
+}
+_CV_TAGS = (DW_TAG_typedef, DW_TAG_const_type, DW_TAG_volatile_type,
+            DW_TAG_restrict_type, DW_TAG_atomic_type)
+_C_INT_WORDS = frozenset(['unsigned', 'signed', 'short', 'long', 'int',
+                          'char'])
+
+_path_re = re.compile(r'\s*(?:\.?\s*([A-Za-z_]\w*)|\[\s*(\d+)\s*\])')
+
+
+class DwarfException(Exception):
+    pass
+
+
+class _Abbrev(object):
+
+    __slots__ = ('tag', 'has_children', 'specs', 'fixed_size', 'sibling')
+
+    def __init__(self, tag, has_children, specs):
+        self.tag = tag
+        self.has_children = has_children
+        # list of (attribute, form, implicit_const) tuples
+        self.specs = specs
+        self.fixed_size = None
+        self.sibling = any(a == DW_AT_sibling for a, f, c in specs)
+
+
+class _Unit(object):
+
+    __slots__ = ('offset', 'end', 'version', 'address_size', 'offset_size',
+                 'abbrevs', 'die_start', 'str_offsets_base')
+
+
+class Die(object):
+
+    __slots__ = ('offset', 'tag', 'attrs', 'has_children', 'unit', 'end',
+                 '_children')
+
+    def __init__(self, offset, tag, attrs, has_children, unit, end):
+        self.offset = offset
+        self.tag = tag
+        self.attrs = attrs
+        self.has_children = has_children
+        self.unit = unit
+        self.end = end
+        self._children = None
+
+    @property
+    def name(self):
+        return self.attrs.get(DW_AT_name)
+
+
+class DwarfInfo(object):
+
+    """Answers type layout and symbol questions about an ELF file straight
+    from its .symtab and DWARF .debug_info, without gdb.
+
+    Walking every DIE of a vmlinux is slow, so the index of named types,
+    variables and enumerators is built one compilation unit at a time,
+    only as far as needed to find what's being looked up. Everything
+    that's been parsed is kept in memory.
+
+    Anything this can't answer (unsupported expressions, DWARF
+    constructs it doesn't know about, ambiguous names) raises
+    DwarfException so the caller can fall back to gdb.
+
+    """
+
+    def __init__(self, path):
+        self.elf = ElfFile(path)
+        info = self.elf.get_section('.debug_info')
+        if info is None or self.elf.get_section('.debug_abbrev') is None:
+            self.elf.close()
+            raise DwarfException('{0} has no debug info'.format(path))
+        for section in self.elf.sections:
+            if section.name.startswith('.debug_') and \
+                    section.flags & SHF_COMPRESSED:
+                self.elf.close()
+                raise DwarfException(
+                    '{0} has compressed debug info'.format(path))
+        self.endian = self.elf.endian
+        self.buf = mmap.mmap(self.elf.fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.info_base = info.offset
+        self.info_end = info.offset + info.size
+        self.abbrev_base = self.elf.get_section('.debug_abbrev').offset
+        self.str_base = self._section_offset('.debug_str')
+        self.line_str_base = self._section_offset('.debug_line_str')
+        self.str_offsets_base = self._section_offset('.debug_str_offsets')
+        self._u16 = struct.Struct(self.endian + 'H')
+        self._u32 = struct.Struct(self.endian + 'I')
+        self._u64 = struct.Struct(self.endian + 'Q')
+        self._abbrev_tables = {}
+        self._dies = {}
+        self._symbols = None
+        self._index = {}
+        self._enum_values = {}
+        self._enumerators = {}
+        self._units = []
+        self._unit_offsets = []
+        self._parse_unit_headers()
+        self._next_unit = 0
+
+    def close(self):
+        self.buf.close()
+        self.elf.close()
+
+    def reopen(self):
+        """See ElfFile.reopen. The mapping of the file and everything
+        indexed so far are kept."""
+        self.elf.reopen()
+
+    def _section_offset(self, name):
+        section = self.elf.get_section(name)
+        if section is None:
+            return None
+        return section.offset
+
+    # low level decoding
+
+    def _uleb(self, pos):
+        buf = self.buf
+        b = ord(buf[pos])
+        if b < 0x80:
+            return b, pos + 1
+        result = b & 0x7f
+        shift = 7
+        while True:
+            pos += 1
+            b = ord(buf[pos])
+            result |= (b & 0x7f) << shift
+            if b < 0x80:
+                return result, pos + 1
+            shift += 7
+
+    def _sleb(self, pos):
+        buf = self.buf
+        result = 0
+        shift = 0
+        while True:
+            b = ord(buf[pos])
+            pos += 1
+            result |= (b & 0x7f) << shift
+            shift += 7
+            if b < 0x80:
+                if b & 0x40:
+                    result -= 1 << shift
+                return result, pos
+
+    def _uint(self, pos, size):
+        if size == 4:
+            return self._u32.unpack_from(self.buf, pos)[0]
+        if size == 8:
+            return self._u64.unpack_from(self.buf, pos)[0]
+        if size == 2:
+            return self._u16.unpack_from(self.buf, pos)[0]
+        if size == 1:
+            return ord(self.buf[pos])
+        data = self.buf[pos:pos + size]
+        if self.endian == '>':
+            data = data[::-1]
+        value = 0
+        for i in xrange(size - 1, -1, -1):
+            value = (value << 8) | ord(data[i])
+        return value
+
+    def _cstring(self, pos):
+        end = self.buf.find('\0', pos)
+        return self.buf[pos:end], end + 1
+
+    def _str_at(self, base, offset):
+        if base is None:
+            raise DwarfException('string section missing')
+        return self._cstring(base + offset)[0]
+
+    def _strx(self, unit, index):
+        if self.str_offsets_base is None:
+            raise DwarfException('.debug_str_offsets missing')
+        base = unit.str_offsets_base
+        if base is None:
+            # default to just past the header of the first contribution
+            base = 8 if unit.offset_size == 4 else 16
+        pos = self.str_offsets_base + base + index * unit.offset_size
+        return self._str_at(self.str_base, self._uint(pos, unit.offset_size))
+
+    def _form_size(self, form, unit):
+        size = _FIXED_FORM_SIZES.get(form)
+        if size is not None:
+            return size
+        if form == DW_FORM_addr:
+            return unit.address_size
+        if form in _OFFSET_FORMS:
+            return unit.offset_size
+        if form == DW_FORM_ref_addr:
+            if unit.version == 2:
+                return unit.address_size
+            return unit.offset_size
+        return None
+
+    def _read_form(self, form, pos, unit, implicit):
+        """Returns (value, new_pos) for an attribute of form `form' at
+        `pos'. References are returned as .debug_info offsets."""
+        if form == DW_FORM_ref4:
+            return unit.offset + self._u32.unpack_from(self.buf, pos)[0], pos + 4
+        if form == DW_FORM_strp:
+            off = self._uint(pos, unit.offset_size)
+            return self._str_at(self.str_base, off), pos + unit.offset_size
+        if form == DW_FORM_data1 or form == DW_FORM_flag:
+            return ord(self.buf[pos]), pos + 1
+        if form == DW_FORM_data2:
+            return self._u16.unpack_from(self.buf, pos)[0], pos + 2
+        if form == DW_FORM_data4:
+            return self._u32.unpack_from(self.buf, pos)[0], pos + 4
+        if form == DW_FORM_flag_present:
+            return True, pos
+        if form == DW_FORM_implicit_const:
+            return implicit, pos
+        if form == DW_FORM_string:
+            return self._cstring(pos)
+        if form == DW_FORM_sec_offset:
+            return self._uint(pos, unit.offset_size), pos + unit.offset_size
+        if form == DW_FORM_exprloc or form == DW_FORM_block:
+            length, pos = self._uleb(pos)
+            return self.buf[pos:pos + length], pos + length
+        if form == DW_FORM_block1:
+            length = ord(self.buf[pos])
+            return self.buf[pos + 1:pos + 1 + length], pos + 1 + length
+        if form == DW_FORM_block2:
+            length = self._uint(pos, 2)
+            return self.buf[pos + 2:pos + 2 + length], pos + 2 + length
+        if form == DW_FORM_block4:
+            length = self._uint(pos, 4)
+            return self.buf[pos + 4:pos + 4 + length], pos + 4 + length
+        if form == DW_FORM_addr:
+            return self._uint(pos, unit.address_size), pos + unit.address_size
+        if form == DW_FORM_data8:
+            return self._uint(pos, 8), pos + 8
+        if form == DW_FORM_udata:
+            return self._uleb(pos)
+        if form == DW_FORM_sdata:
+            return self._sleb(pos)
+        if form == DW_FORM_line_strp:
+            off = self._uint(pos, unit.offset_size)
+            return self._str_at(self.line_str_base, off), pos + unit.offset_size
+        if form in _REF_FORMS:
+            if form == DW_FORM_ref_udata:
+                value, pos = self._uleb(pos)
+                return unit.offset + value, pos
+            size = _FIXED_FORM_SIZES[form]
+            return unit.offset + self._uint(pos, size), pos + size
+        if form == DW_FORM_ref_addr:
+            size = self._form_size(form, unit)
+            return self._uint(pos, size), pos + size
+        if form == DW_FORM_strx:
+            index, pos = self._uleb(pos)
+            return self._strx(unit, index), pos
+        if DW_FORM_strx1 <= form <= DW_FORM_strx4:
+            size = _FIXED_FORM_SIZES[form]
+            return self._strx(unit, self._uint(pos, size)), pos + size
+        if form == DW_FORM_indirect:
+            form, pos = self._uleb(pos)
+            return self._read_form(form, pos, unit, implicit)
+        if form in (DW_FORM_addrx, DW_FORM_loclistx, DW_FORM_rnglistx):
+            # we never need the value of these, only to skip them
+            return self._uleb(pos)
+        size = self._form_size(form, unit)
+        if size is None:
+            raise DwarfException('Unknown DWARF form 0x{0:x}'.format(form))
+        return None, pos + size
+
+    def _skip_form(self, form, pos, unit):
+        size = self._form_size(form, unit)
+        if size is not None:
+            return pos + size
+        return self._read_form(form, pos, unit, None)[1]
+
+    # units and abbreviations
+
+    def _abbrev_table(self, offset, unit):
+        key = (offset, unit.version, unit.address_size, unit.offset_size)
+        table = self._abbrev_tables.get(key)
+        if table is not None:
+            return table
+        table = {}
+        pos = self.abbrev_base + offset
+        while True:
+            code, pos = self._uleb(pos)
+            if code == 0:
+                break
+            tag, pos = self._uleb(pos)
+            has_children = ord(self.buf[pos]) != 0
+            pos += 1
+            specs = []
+            while True:
+                attr, pos = self._uleb(pos)
+                form, pos = self._uleb(pos)
+                if attr == 0 and form == 0:
+                    break
+                implicit = None
+                if form == DW_FORM_implicit_const:
+                    implicit, pos = self._sleb(pos)
+                specs.append((attr, form, implicit))
+            abbrev = _Abbrev(tag, has_children, specs)
+            fixed = 0
+            for attr, form, implicit in specs:
+                size = self._form_size(form, unit)
+                if size is None:
+                    fixed = None
+                    break
+                fixed += size
+            abbrev.fixed_size = fixed
+            table[code] = abbrev
+        self._abbrev_tables[key] = table
+        return table
+
+    def _parse_unit_headers(self):
+        pos = self.info_base
+        while pos + 11 <= self.info_end:
+            unit = _Unit()
+            unit.offset = pos - self.info_base
+            length = self._uint(pos, 4)
+            pos += 4
+            unit.offset_size = 4
+            if length == 0xffffffff:
+                length = self._uint(pos, 8)
+                pos += 8
+                unit.offset_size = 8
+            unit.end = pos + length
+            unit.version = self._uint(pos, 2)
+            pos += 2
+            unit_type = DW_UT_compile
+            if unit.version >= 5:
+                unit_type = ord(self.buf[pos])
+                unit.address_size = ord(self.buf[pos + 1])
+                abbrev_offset = self._uint(pos + 2, unit.offset_size)
+                pos += 2 + unit.offset_size
+            else:
+                abbrev_offset = self._uint(pos, unit.offset_size)
+                unit.address_size = ord(self.buf[pos + unit.offset_size])
+                pos += unit.offset_size + 1
+            unit.die_start = pos
+            unit.str_offsets_base = None
+            if unit.version < 2 or unit.version > 5 or \
+                    unit_type not in (DW_UT_compile, DW_UT_partial):
+                # type units and split units aren't supported
+                pos = unit.end
+                continue
+            unit.abbrevs = self._abbrev_table(abbrev_offset, unit)
+            self._units.append(unit)
+            self._unit_offsets.append(unit.offset)
+            pos = unit.end
+
+    def _unit_at(self, offset):
+        i = bisect.bisect_right(self._unit_offsets, offset) - 1
+        if i < 0:
+            raise DwarfException('Bad DIE offset 0x{0:x}'.format(offset))
+        return self._units[i]
+
+    # DIEs
+
+    def _parse_attrs(self, abbrev, pos, unit):
+        attrs = {}
+        for attr, form, implicit in abbrev.specs:
+            attrs[attr], pos = self._read_form(form, pos, unit, implicit)
+        return attrs, pos
+
+    def _skip_attrs(self, abbrev, pos, unit):
+        if abbrev.fixed_size is not None:
+            return pos + abbrev.fixed_size
+        for attr, form, implicit in abbrev.specs:
+            pos = self._skip_form(form, pos, unit)
+        return pos
+
+    def die(self, offset):
+        """Returns the Die at .debug_info offset `offset'."""
+        die = self._dies.get(offset)
+        if die is not None:
+            return die
+        unit = self._unit_at(offset)
+        pos = self.info_base + offset
+        code, pos = self._uleb(pos)
+        if code == 0:
+            raise DwarfException('Null DIE at 0x{0:x}'.format(offset))
+        abbrev = unit.abbrevs[code]
+        attrs, pos = self._parse_attrs(abbrev, pos, unit)
+        die = Die(offset, abbrev.tag, attrs, abbrev.has_children, unit, pos)
+        self._dies[offset] = die
+        return die
+
+    def children(self, die):
+        """Returns the list of the direct children of `die'."""
+        if die._children is not None:
+            return die._children
+        children = []
+        if die.has_children:
+            unit = die.unit
+            pos = die.end
+            while True:
+                offset = pos - self.info_base
+                code, pos = self._uleb(pos)
+                if code == 0:
+                    break
+                child = self.die(offset)
+                children.append(child)
+                pos = child.end
+                if child.has_children:
+                    sibling = child.attrs.get(DW_AT_sibling)
+                    if sibling is not None:
+                        pos = self.info_base + sibling
+                    else:
+                        pos = self._skip_children(pos, unit)
+        die._children = children
+        return children
+
+    def _skip_children(self, pos, unit):
+        depth = 1
+        abbrevs = unit.abbrevs
+        while depth:
+            code, pos = self._uleb(pos)
+            if code == 0:
+                depth -= 1
+                continue
+            abbrev = abbrevs[code]
+            pos = self._skip_attrs(abbrev, pos, unit)
+            if abbrev.has_children:
+                depth += 1
+        return pos
+
+    # the index
+
+    def _index_unit(self, unit):
+        """Adds the named top level types, variables and enumerators of
+        `unit' to the index."""
+        abbrevs = unit.abbrevs
+        pos = unit.die_start
+        code, pos = self._uleb(pos)
+        if code == 0:
+            return
+        abbrev = abbrevs[code]
+        attrs, pos = self._parse_attrs(abbrev, pos, unit)
+        unit.str_offsets_base = attrs.get(DW_AT_str_offsets_base)
+        if not abbrev.has_children:
+            return
+        depth = 1
+        enum = None
+        while depth and pos < unit.end:
+            offset = pos - self.info_base
+            code, pos = self._uleb(pos)
+            if code == 0:
+                depth -= 1
+                enum = None
+                continue
+            abbrev = abbrevs[code]
+            tag = abbrev.tag
+            if depth == 1 and (tag in _INDEX_TAGS or tag == DW_TAG_variable):
+                die = self.die(offset)
+                pos = die.end
+                self._index_die(die)
+                if abbrev.has_children:
+                    if tag == DW_TAG_enumeration_type:
+                        enum = die
+                        depth += 1
+                    elif DW_AT_sibling in die.attrs:
+                        pos = self.info_base + die.attrs[DW_AT_sibling]
+                    else:
+                        depth += 1
+                continue
+            if enum is not None and tag == DW_TAG_enumerator:
+                attrs, pos = self._parse_attrs(abbrev, pos, unit)
+                name = attrs.get(DW_AT_name)
+                if name is not None and name not in self._enumerators:
+                    self._enumerators[name] = attrs.get(DW_AT_const_value)
+                continue
+            if depth == 1 and abbrev.has_children and abbrev.sibling:
+                attrs, pos = self._parse_attrs(abbrev, pos, unit)
+                pos = self.info_base + attrs[DW_AT_sibling]
+                continue
+            pos = self._skip_attrs(abbrev, pos, unit)
+            if abbrev.has_children:
+                depth += 1
+
+    def _index_die(self, die):
+        index = self._index
+        if die.tag == DW_TAG_variable:
+            name = die.name
+            spec = die.attrs.get(DW_AT_specification)
+            if name is None and spec is not None:
+                name = self.die(spec).name
+            if name is None:
+                return
+            if die.attrs.get(DW_AT_declaration):
+                index.setdefault(('var_decl', name), die.offset)
+            else:
+                index.setdefault(('var', name), die.offset)
+            return
+        name = die.name
+        if name is None:
+            return
+        key = (_INDEX_TAGS[die.tag], name)
+        if die.attrs.get(DW_AT_declaration):
+            index.setdefault(('decl',) + key, die.offset)
+        else:
+            index.setdefault(key, die.offset)
+
+    def _lookup(self, key):
+        """Returns the offset of the DIE indexed under `key', indexing
+        more units until it's found. Returns None if there isn't one."""
+        index = self._index
+        while key not in index and self._next_unit < len(self._units):
+            self._next_unit += 1
+            self._index_unit(self._units[self._next_unit - 1])
+        return index.get(key)
+
+    def _lookup_enumerator(self, name):
+        while name not in self._enumerators and \
+                self._next_unit < len(self._units):
+            self._next_unit += 1
+            self._index_unit(self._units[self._next_unit - 1])
+        return self._enumerators.get(name)
+
+    def symbols(self):
+        if self._symbols is None:
+            self._symbols = self.elf.symbols()
+        return self._symbols
+
+    # types
+
+    def _base_type_name(self, name):
+        """Converts a C integer type spelling to the name gcc uses for it
+        in DWARF (e.g. `unsigned long' -> `long unsigned int')."""
+        words = name.split()
+        if not words or not _C_INT_WORDS.issuperset(words):
+            return name
+        unsigned = 'unsigned' in words
+        if 'char' in words:
+            if unsigned:
+                return 'unsigned char'
+            if 'signed' in words:
+                return 'signed char'
+            return 'char'
+        if 'short' in words:
+            base = 'short'
+        elif words.count('long') == 2:
+            base = 'long long'
+        elif 'long' in words:
+            base = 'long'
+        else:
+            return 'unsigned int' if unsigned else 'int'
+        return base + (' unsigned int' if unsigned else ' int')
+
+    def _named_type(self, kind, name):
+        offset = self._lookup((kind, name))
+        if offset is None:
+            offset = self._index.get(('decl', kind, name))
+        if offset is None:
+            return None
+        return self.die(offset)
+
+    def find_type(self, name):
+        """Returns the Die for the C type `name' (e.g. `struct page',
+        `atomic_t', `unsigned long') or None. Pointer types aren't
+        handled here."""
+        name = ' '.join(name.split())
+        for kind in ('struct', 'union', 'enum'):
+            if name.startswith(kind + ' '):
+                return self._named_type(kind, name[len(kind) + 1:].strip())
+        words = [w for w in name.split() if w not in ('const', 'volatile')]
+        name = ' '.join(words)
+        if _C_INT_WORDS.issuperset(words):
+            return self._named_type('base', self._base_type_name(name))
+        die = self._named_type('typedef', name)
+        if die is None:
+            die = self._named_type('base', name)
+        return die
+
+    def _complete(self, die):
+        """Returns the full definition of `die' if it's only a declaration
+        of a struct, union or enum."""
+        if not die.attrs.get(DW_AT_declaration) or die.name is None:
+            return die
+        kind = _INDEX_TAGS.get(die.tag)
+        if kind is None:
+            return die
+        offset = self._lookup((kind, die.name))
+        if offset is None:
+            raise DwarfException('No definition of {0} {1}'.format(
+                kind, die.name))
+        return self.die(offset)
+
+    def _strip_cv(self, die):
+        """Follows typedefs and qualifiers down to the real type."""
+        while die.tag in _CV_TAGS:
+            target = die.attrs.get(DW_AT_type)
+            if target is None:
+                raise DwarfException('void type')
+            die = self.die(target)
+        return self._complete(die)
+
+    def _array_dims(self, die):
+        dims = []
+        for child in self.children(die):
+            if child.tag != DW_TAG_subrange_type:
+                continue
+            count = child.attrs.get(DW_AT_count)
+            if count is None:
+                upper = child.attrs.get(DW_AT_upper_bound)
+                if upper is None or not isinstance(upper, (int, long)) or \
+                        upper >= 0xffffffff:
+                    raise DwarfException('Array of unknown size')
+                count = upper + 1 - child.attrs.get(DW_AT_lower_bound, 0)
+            if not isinstance(count, (int, long)):
+                raise DwarfException('Variable length array')
+            dims.append(count)
+        return dims
+
+    def type_size(self, die):
+        """Returns sizeof() the type described by `die'."""
+        die = self._strip_cv(die)
+        size = die.attrs.get(DW_AT_byte_size)
+        if isinstance(size, (int, long)):
+            return size
+        if die.tag == DW_TAG_pointer_type or \
+                die.tag == DW_TAG_reference_type:
+            return die.unit.address_size
+        if die.tag == DW_TAG_array_type:
+            size = self.type_size(self.die(die.attrs[DW_AT_type]))
+            for count in self._array_dims(die):
+                size *= count
+            return size
+        raise DwarfException('Unknown size for DIE 0x{0:x}'.format(
+            die.offset))
+
+    def _element(self, die, index):
+        """Returns (offset, element type) of element `index' of the array
+        type `die'."""
+        die = self._strip_cv(die)
+        if die.tag != DW_TAG_array_type:
+            raise DwarfException('Not an array')
+        dims = self._array_dims(die)
+        elem = self.die(die.attrs[DW_AT_type])
+        if len(dims) > 1:
+            # indexing a multidimensional array leaves an array
+            raise DwarfException('Multidimensional arrays not supported')
+        return index * self.type_size(elem), elem
+
+    def _member_location(self, member):
+        if DW_AT_bit_size in member.attrs or \
+                DW_AT_data_bit_offset in member.attrs:
+            raise DwarfException("Can't take the address of a bitfield")
+        loc = member.attrs.get(DW_AT_data_member_location, 0)
+        if isinstance(loc, (int, long)):
+            return loc
+        # DWARF 2 style location expression
+        op = ord(loc[0])
+        if op in (DW_OP_plus_uconst, DW_OP_constu):
+            value = 0
+            shift = 0
+            for c in loc[1:]:
+                b = ord(c)
+                value |= (b & 0x7f) << shift
+                shift += 7
+                if b < 0x80:
+                    break
+            return value
+        raise DwarfException('Unsupported member location')
+
+    def _find_member(self, die, name):
+        """Returns (offset, type) of member `name' of the struct or union
+        `die', looking inside anonymous structs and unions too."""
+        die = self._strip_cv(die)
+        if die.tag not in (DW_TAG_structure_type, DW_TAG_union_type):
+            raise DwarfException('Not a struct or union')
+        for member in self.children(die):
+            if member.tag != DW_TAG_member:
+                continue
+            if member.name == name:
+                return (self._member_location(member),
+                        self.die(member.attrs[DW_AT_type]))
+        for member in self.children(die):
+            if member.tag != DW_TAG_member or member.name is not None:
+                continue
+            mtype = self._strip_cv(self.die(member.attrs[DW_AT_type]))
+            if mtype.tag not in (DW_TAG_structure_type, DW_TAG_union_type):
+                continue
+            found = self._find_member(mtype, name)
+            if found is not None:
+                return (self._member_location(member) + found[0], found[1])
+        return None
+
+    def _walk_path(self, die, path, offset=0):
+        """Applies a field path like `a.b[2].c' to the type `die'. Returns
+        (offset, type)."""
+        pos = 0
+        path = path.strip()
+        while pos < len(path):
+            m = _path_re.match(path, pos)
+            if m is None or m.end() == pos:
+                raise DwarfException('Unsupported expression ' + path)
+            pos = m.end()
+            if m.group(1) is not None:
+                found = self._find_member(die, m.group(1))
+                if found is None:
+                    raise DwarfException('No member ' + m.group(1))
+                offset += found[0]
+                die = found[1]
+            else:
+                elem_offset, die = self._element(die, int(m.group(2)))
+                offset += elem_offset
+        return offset, die
+
+    # variables and symbols
+
+    def _variable_type(self, name):
+        offset = self._lookup(('var', name))
+        if offset is None:
+            offset = self._index.get(('var_decl', name))
+        if offset is None:
+            raise DwarfException('No variable ' + name)
+        die = self.die(offset)
+        while DW_AT_type not in die.attrs:
+            spec = die.attrs.get(DW_AT_specification)
+            if spec is None:
+                raise DwarfException('Variable without a type')
+            die = self.die(spec)
+        return self.die(die.attrs[DW_AT_type])
+
+    def _is_symbol(self, name):
+        return name in self.symbols()
+
+    def field_offset(self, the_type, field):
+        """Offset of `field' (which may be a path like `a.b[2]') in
+        `the_type'."""
+        die = self.find_type(the_type)
+        if die is None:
+            raise DwarfException('No type ' + the_type)
+        return self._walk_path(die, field)[0]
+
+    def sizeof(self, expr):
+        """sizeof(`expr') where `expr' is a type or a (possibly indexed)
+        global variable."""
+        expr = ' '.join(expr.split())
+        if expr.endswith('*'):
+            base = expr.rstrip('* ')
+            if base != 'void' and self.find_type(base) is None:
+                raise DwarfException('No type ' + base)
+            # all the pointers in a kernel image have the same size
+            return self._units[0].address_size
+        m = re.match(r'([A-Za-z_]\w*)(.*)$', expr)
+        if m is not None and self._is_symbol(m.group(1)):
+            die = self._variable_type(m.group(1))
+            return self.type_size(self._walk_path(die, m.group(2))[1])
+        die = self.find_type(expr)
+        if die is None:
+            raise DwarfException('No type ' + expr)
+        return self.type_size(die)
+
+    def address_of(self, symbol):
+        """Address of the global `symbol'. Names that are ambiguous (e.g.
+        several static variables called the same) raise."""
+        syms = self.symbols().get(symbol)
+        if not syms:
+            raise DwarfException('No symbol ' + symbol)
+        if len(syms) > 1:
+            syms = [s for s in syms if s.bind == STB_GLOBAL]
+            if len(syms) != 1:
+                raise DwarfException('Ambiguous symbol ' + symbol)
+        return syms[0].value
+
+    def enumerator_value(self, name):
+        """Value of the enumerator `name'."""
+        if self._is_symbol(name):
+            raise DwarfException(name + ' is a symbol')
+        value = self._lookup_enumerator(name)
+        if not isinstance(value, (int, long)):
+            raise DwarfException('No enumerator ' + name)
+        return value
+
+    def enum_values(self, enum):
+        """Dictionary mapping the values of `enum enum' to the names of
+        its enumerators."""
+        values = self._enum_values.get(enum)
+        if values is not None:
+            return values
+        die = self._named_type('enum', enum)
+        if die is None:
+            raise DwarfException('No enum ' + enum)
+        die = self._complete(die)
+        values = {}
+        for child in self.children(die):
+            if child.tag == DW_TAG_enumerator:
+                values.setdefault(child.attrs.get(DW_AT_const_value),
+                                  child.name)
+        self._enum_values[enum] = values
+        return values
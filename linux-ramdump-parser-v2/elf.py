@@ -0,0 +1,270 @@
+# Copyright (c) 2014, The Linux Foundation. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 and
+# only version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import struct
+import hashlib
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+SHF_COMPRESSED = 0x800
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+SHT_NOTE = 7
+PT_LOAD = 1
+NT_GNU_BUILD_ID = 3
+
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STT_SECTION = 3
+STT_FILE = 4
+
+
+class ElfException(Exception):
+    pass
+
+
+class ElfSection(object):
+
+    def __init__(self, name, sh_type, flags, addr, offset, size):
+        self.name = name
+        self.sh_type = sh_type
+        self.flags = flags
+        self.addr = addr
+        self.offset = offset
+        self.size = size
+
+
+class ElfSegment(object):
+
+    def __init__(self, p_type, offset, vaddr, paddr, filesz, memsz, flags):
+        self.p_type = p_type
+        self.offset = offset
+        self.vaddr = vaddr
+        self.paddr = paddr
+        self.filesz = filesz
+        self.memsz = memsz
+        self.flags = flags
+
+
+class ElfSymbol(object):
+
+    def __init__(self, name, value, size, bind, sym_type, shndx):
+        self.name = name
+        self.value = value
+        self.size = size
+        self.bind = bind
+        self.sym_type = sym_type
+        self.shndx = shndx
+
+
+class ElfFile(object):
+
+    """Minimal ELF reader. Only parses the file header, section headers
+    and program headers; section contents are read on demand.
+
+    Example:
+
+        with ElfFile('vmlinux') as elf:
+            print elf.build_id()
+            data = elf.read_section('.rodata')
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = open(path, 'rb')
+        try:
+            self._parse_header()
+            self._parse_sections()
+            self._parse_segments()
+        except ElfException:
+            self.fd.close()
+            raise
+        except (struct.error, IndexError, ValueError):
+            self.fd.close()
+            raise ElfException('{0} is not a valid ELF file'.format(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_value, ex_traceback):
+        self.close()
+
+    def close(self):
+        self.fd.close()
+
+    def reopen(self):
+        """Opens the file again, for a process forked from the one that
+        made this ElfFile (the two would share the file offset
+        otherwise)."""
+        self.fd.close()
+        self.fd = open(self.path, 'rb')
+
+    def _read(self, offset, length):
+        self.fd.seek(offset)
+        return self.fd.read(length)
+
+    def _parse_header(self):
+        ident = self._read(0, 16)
+        if ident[:4] != '\x7fELF':
+            raise ElfException('{0} is not an ELF file'.format(self.path))
+        self.elfclass = ord(ident[4])
+        self.endian = '<' if ord(ident[5]) == ELFDATA2LSB else '>'
+        if self.elfclass == ELFCLASS32:
+            hdr_fmt = 'HHIIIIIHHHHHH'
+            self.shdr_fmt = self.endian + 'IIIIIIIIII'
+            self.phdr_fmt = self.endian + 'IIIIIIII'
+        elif self.elfclass == ELFCLASS64:
+            hdr_fmt = 'HHIQQQIHHHHHH'
+            self.shdr_fmt = self.endian + 'IIQQQQIIQQ'
+            self.phdr_fmt = self.endian + 'IIQQQQQQ'
+        else:
+            raise ElfException('Unknown ELF class {0}'.format(self.elfclass))
+        hdr_fmt = self.endian + hdr_fmt
+        (self.e_type, self.e_machine, _, self.e_entry, self.e_phoff,
+         self.e_shoff, self.e_flags, _, self.e_phentsize, self.e_phnum,
+         self.e_shentsize, self.e_shnum, self.e_shstrndx) = struct.unpack(
+            hdr_fmt, self._read(16, struct.calcsize(hdr_fmt)))
+
+    def _parse_sections(self):
+        self.sections = []
+        self._sections_by_name = {}
+        if self.e_shoff == 0 or self.e_shnum == 0:
+            return
+        raw = self._read(self.e_shoff, self.e_shentsize * self.e_shnum)
+        headers = []
+        for i in xrange(self.e_shnum):
+            headers.append(struct.unpack_from(
+                self.shdr_fmt, raw, i * self.e_shentsize))
+        strtab = headers[self.e_shstrndx]
+        names = self._read(strtab[4], strtab[5])
+        for h in headers:
+            name = names[h[0]:names.index('\0', h[0])]
+            # sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size
+            # are laid out the same way for both classes
+            section = ElfSection(name, h[1], h[2], h[3], h[4], h[5])
+            self.sections.append(section)
+            self._sections_by_name.setdefault(name, section)
+
+    def _parse_segments(self):
+        self.segments = []
+        if self.e_phoff == 0 or self.e_phnum == 0:
+            return
+        raw = self._read(self.e_phoff, self.e_phentsize * self.e_phnum)
+        for i in xrange(self.e_phnum):
+            p = struct.unpack_from(self.phdr_fmt, raw, i * self.e_phentsize)
+            if self.elfclass == ELFCLASS32:
+                # p_type, p_offset, p_vaddr, p_paddr, p_filesz,
+                # p_memsz, p_flags, p_align
+                seg = ElfSegment(p[0], p[1], p[2], p[3], p[4], p[5], p[6])
+            else:
+                # p_type, p_flags, p_offset, p_vaddr, p_paddr,
+                # p_filesz, p_memsz, p_align
+                seg = ElfSegment(p[0], p[2], p[3], p[4], p[5], p[6], p[1])
+            self.segments.append(seg)
+
+    def get_section(self, name):
+        """Returns the ElfSection called `name' or None."""
+        return self._sections_by_name.get(name)
+
+    def read_section(self, name):
+        """Returns the contents of section `name' or None if there is no
+        such section."""
+        section = self.get_section(name)
+        if section is None:
+            return None
+        if section.sh_type == SHT_NOBITS:
+            return '\0' * section.size
+        return self._read(section.offset, section.size)
+
+    def read_segment(self, segment):
+        """Returns the file contents of the ElfSegment `segment'."""
+        return self._read(segment.offset, segment.filesz)
+
+    def load_segments(self):
+        """Returns the PT_LOAD segments."""
+        return [s for s in self.segments if s.p_type == PT_LOAD]
+
+    def symbols(self):
+        """Returns a dictionary mapping symbol names to lists of ElfSymbols
+        from .symtab (a name can appear more than once, e.g. for static
+        symbols). Section and file symbols are left out."""
+        symtab = self.get_section('.symtab')
+        strtab = self.read_section('.strtab')
+        table = {}
+        if symtab is None or strtab is None:
+            return table
+        data = self._read(symtab.offset, symtab.size)
+        if self.elfclass == ELFCLASS32:
+            fmt = struct.Struct(self.endian + 'IIIBBH')
+        else:
+            fmt = struct.Struct(self.endian + 'IBBHQQ')
+        for off in xrange(fmt.size, len(data) - fmt.size + 1, fmt.size):
+            if self.elfclass == ELFCLASS32:
+                name, value, size, info, _, shndx = fmt.unpack_from(data, off)
+            else:
+                name, info, _, shndx, value, size = fmt.unpack_from(data, off)
+            sym_type = info & 0xf
+            if name == 0 or sym_type == STT_SECTION or sym_type == STT_FILE:
+                continue
+            name = strtab[name:strtab.index('\0', name)]
+            sym = ElfSymbol(name, value, size, info >> 4, sym_type, shndx)
+            table.setdefault(name, []).append(sym)
+        return table
+
+    def build_id(self):
+        """Returns the GNU build-id as a hex string or None if the file
+        doesn't have one."""
+        for section in self.sections:
+            if section.sh_type != SHT_NOTE:
+                continue
+            data = self._read(section.offset, section.size)
+            off = 0
+            while off + 12 <= len(data):
+                namesz, descsz, n_type = struct.unpack_from(
+                    self.endian + 'III', data, off)
+                off += 12
+                name = data[off:off + namesz]
+                off += (namesz + 3) & ~3
+                desc = data[off:off + descsz]
+                off += (descsz + 3) & ~3
+                if n_type == NT_GNU_BUILD_ID and name.rstrip('\0') == 'GNU':
+                    return desc.encode('hex')
+        return None
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Returns the sha1 of the contents of `path' as a hex string."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def elf_identity(path):
+    """Returns a string identifying the ELF file at `path': its build-id
+    when it has one, otherwise a hash of its contents."""
+    try:
+        with ElfFile(path) as elf:
+            build_id = elf.build_id()
+        if build_id is not None:
+            return 'buildid-' + build_id
+    except (ElfException, EnvironmentError):
+        pass
+    return 'sha1-' + file_digest(path)
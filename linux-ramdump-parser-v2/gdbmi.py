@@ -13,9 +13,14 @@ import sys
 import re
 import subprocess
 
+from dwarf import DwarfInfo, DwarfException
+from elf import ElfException
+
 GDB_SENTINEL = '(gdb) '
 GDB_DATA_LINE = '~'
 GDB_OOB_LINE = '^'
+# how many commands run_many writes to gdb before reading the replies
+GDB_BATCH_SIZE = 64
 
 
 def gdb_hex_to_dec(val):
@@ -23,6 +28,30 @@ def gdb_hex_to_dec(val):
     return int(match.group(1), 16)
 
 
+def _hex_line(value):
+    """Formats `value' the way gdb prints it with `print /x'."""
+    return '$1 = 0x{0:x}'.format(value)
+
+
+def _field_offset_cmd(the_type, field):
+    return 'print /x (int)&(({0} *)0)->{1}'.format(the_type, field)
+
+
+def _field_offset_native(the_type, field):
+    return lambda d: _hex_line(d.field_offset(the_type, field))
+
+
+def _enum_native(enum, i):
+    def native(d):
+        values = d.enum_values(enum)
+        if i not in values:
+            # gdb prints something more elaborate for values that
+            # aren't enumerators, leave those to it
+            raise DwarfException('No enumerator with value {0}'.format(i))
+        return '$1 = ' + values[i]
+    return native
+
+
 class GdbSymbol(object):
 
     def __init__(self, symbol, section, addr):
@@ -49,13 +78,34 @@ class GdbMIException(Exception):
 
 class GdbMI(object):
 
-    def __init__(self, gdb_path, elf):
+    """Runs queries against `elf'.
+
+    Queries are answered, in order of preference, from:
+
+    - the in-memory cache and the `symcache.SymbolCache' given as
+      `persistent_cache' (if any)
+
+    - the ELF symbol table and DWARF debug info of `elf', read
+      directly with `dwarf.DwarfInfo' (unless use_dwarf=False)
+
+    - a gdb subprocess, which is only started the first time a query
+      can't be answered any other way.
+
+    """
+
+    def __init__(self, gdb_path, elf, persistent_cache=None, use_dwarf=True):
         self.gdb_path = gdb_path
         self.elf = elf
         self._cache = {}
+        self._persistent_cache = persistent_cache
+        self._dwarf = None if use_dwarf else False
+        self._opened = False
         self._gdbmi = None
 
     def open(self):
+        self._opened = True
+
+    def _start(self):
         self._gdbmi = subprocess.Popen(
             [self.gdb_path, '--interpreter=mi2', self.elf],
             stdin=subprocess.PIPE,
@@ -63,8 +113,28 @@ class GdbMI(object):
         )
         self._flush_gdbmi()
 
+    def reopen(self, persistent_cache=None):
+        """For a process forked from the one that opened this GdbMI:
+        switches to `persistent_cache' and leaves the parent's gdb alone,
+        starting another one if it's needed. The answers and the DWARF
+        index worked out so far are kept."""
+        # the pipe is the parent's, so just forget about it
+        self._gdbmi = None
+        self._persistent_cache = persistent_cache
+        if self._dwarf:
+            self._dwarf.reopen()
+        self._opened = True
+
     def close(self):
-        self._gdbmi.communicate('quit')
+        self._opened = False
+        if self._persistent_cache is not None:
+            self._persistent_cache.flush()
+        if self._gdbmi is not None:
+            self._gdbmi.communicate('quit')
+            self._gdbmi = None
+        if self._dwarf:
+            self._dwarf.close()
+            self._dwarf = None
 
     def __enter__(self):
         self.open()
@@ -79,29 +149,113 @@ class GdbMI(object):
             if line == GDB_SENTINEL:
                 break
 
-    def _run(self, cmd, skip_cache=False, save_in_cache=True):
+    def _native(self):
+        """Returns the DwarfInfo for our ELF, or None if we can't read its
+        debug info ourselves."""
+        if self._dwarf is None:
+            try:
+                self._dwarf = DwarfInfo(self.elf)
+            except (DwarfException, ElfException, EnvironmentError):
+                self._dwarf = False
+        return self._dwarf or None
+
+    def _run(self, cmd, skip_cache=False, save_in_cache=True, native=None):
         """Runs a gdb command and returns a GdbMIResult of the result. Results
         are cached (unless skip_cache=True) for quick future lookups.
 
         - cmd: Command to run (e.g. "show version")
         - skip_cache: Don't use a previously cached result
         - save_in_cache: Whether we should save this result in the cache
+        - native: Function taking a DwarfInfo and returning the line gdb
+          would print for `cmd'. It's tried before going to gdb and may
+          raise DwarfException if it can't answer.
 
         """
-        if self._gdbmi is None:
+        natives = None if native is None else [native]
+        return self.run_many([cmd], skip_cache, save_in_cache, natives)[0]
+
+    def run_many(self, cmds, skip_cache=False, save_in_cache=True,
+                 natives=None):
+        """Runs a list of gdb commands and returns a list with a GdbMIResult
+        for each of them.
+
+        Commands that can't be answered from the caches or natively are
+        written to gdb GDB_BATCH_SIZE at a time and the replies read back
+        in order, rather than waiting for each reply before sending the
+        next command.
+
+        - natives: Optional list holding a `native' function (see _run)
+          or None for each command
+
+        """
+        if not self._opened:
             raise Exception(
                 'BUG: GdbMI not initialized. ' +
                 'Please use GdbMI.open or a context manager.')
 
-        if not skip_cache:
-            if cmd in self._cache:
-                return GdbMIResult(self._cache[cmd], [])
+        results = [None] * len(cmds)
+        pending = []
+        for i, cmd in enumerate(cmds):
+            if not skip_cache:
+                result = self._cached(cmd)
+                if result is not None:
+                    results[i] = result
+                    continue
+            line = None
+            if natives is not None and natives[i] is not None:
+                line = self._run_native(natives[i])
+            if line is not None:
+                results[i] = self._save(cmd, [line], [], save_in_cache)
+            else:
+                pending.append(i)
+
+        for start in xrange(0, len(pending), GDB_BATCH_SIZE):
+            batch = pending[start:start + GDB_BATCH_SIZE]
+            self._write_cmds([cmds[i] for i in batch])
+            for i in batch:
+                oob_output = []
+                output = self._read_reply(oob_output)
+                results[i] = self._save(cmds[i], output, oob_output,
+                                        save_in_cache)
+
+        return results
+
+    def _cached(self, cmd):
+        if cmd in self._cache:
+            return GdbMIResult(self._cache[cmd], [])
+        if self._persistent_cache is not None:
+            cached = self._persistent_cache.get_gdb(cmd)
+            if cached is not None:
+                self._cache[cmd] = cached[0]
+                return GdbMIResult(cached[0], cached[1])
+        return None
+
+    def _run_native(self, native):
+        dwarf = self._native()
+        if dwarf is None:
+            return None
+        try:
+            return native(dwarf)
+        except DwarfException:
+            return None
+
+    def _save(self, cmd, output, oob_output, save_in_cache):
+        if save_in_cache:
+            self._cache[cmd] = output
+            if self._persistent_cache is not None:
+                self._persistent_cache.put_gdb(cmd, output, oob_output)
+        return GdbMIResult(output, oob_output)
+
+    def _write_cmds(self, cmds):
+        if self._gdbmi is None:
+            self._start()
 
-        self._gdbmi.stdin.write(cmd.rstrip('\n') + '\n')
+        self._gdbmi.stdin.write(
+            ''.join(cmd.rstrip('\n') + '\n' for cmd in cmds))
         self._gdbmi.stdin.flush()
 
+    def _read_reply(self, oob_output):
         output = []
-        oob_output = []
         while True:
             line = self._gdbmi.stdout.readline().rstrip('\r\n')
             if line == GDB_SENTINEL:
@@ -120,20 +274,17 @@ class GdbMI(object):
             if line.startswith(GDB_OOB_LINE):
                 oob_output.append(line[1:])
 
-        if save_in_cache:
-            self._cache[cmd] = output
-
-        return GdbMIResult(output, oob_output)
+        return output
 
-    def _run_for_one(self, cmd):
-        result = self._run(cmd)
+    def _run_for_one(self, cmd, native=None):
+        result = self._run(cmd, native=native)
         if len(result.lines) != 1:
             raise GdbMIException(
                 cmd, '\n'.join(result.lines + result.oob_lines))
         return result.lines[0]
 
-    def _run_for_first(self, cmd):
-        return self._run(cmd).lines[0]
+    def _run_for_first(self, cmd, native=None):
+        return self._run(cmd, native=native).lines[0]
 
     def version(self):
         """Return GDB version"""
@@ -154,18 +305,44 @@ class GdbMI(object):
         - `field': the field whose offset we want to return
 
         """
-        cmd = 'print /x (int)&(({0} *)0)->{1}'.format(the_type, field)
-        result = self._run_for_one(cmd)
+        result = self._run_for_one(_field_offset_cmd(the_type, field),
+                                   _field_offset_native(the_type, field))
         return gdb_hex_to_dec(result)
 
+    def field_offsets(self, the_type, fields):
+        """Returns a list with the offset of each field in `fields' in
+        `the_type' (see `field_offset'), looking them all up in one
+        batch. Fields that can't be found are None in the list.
+
+        Example:
+
+        gdbmi.field_offsets("struct ion_buffer", ["heap", "size"])
+        -> [20, 28]
+
+        """
+        results = self.run_many(
+            [_field_offset_cmd(the_type, f) for f in fields],
+            natives=[_field_offset_native(the_type, f) for f in fields])
+        offsets = []
+        for result in results:
+            if len(result.lines) != 1:
+                offsets.append(None)
+            else:
+                offsets.append(gdb_hex_to_dec(result.lines[0]))
+        return offsets
+
     def sizeof(self, the_type):
         """Returns the size of the type specified by `the_type'."""
-        result = self._run_for_one('print /x sizeof({0})'.format(the_type))
+        result = self._run_for_one(
+            'print /x sizeof({0})'.format(the_type),
+            lambda d: _hex_line(d.sizeof(the_type)))
         return gdb_hex_to_dec(result)
 
     def address_of(self, symbol):
         """Returns the address of the specified symbol."""
-        result = self._run_for_one('print /x &{0}'.format(symbol))
+        result = self._run_for_one(
+            'print /x &{0}'.format(symbol),
+            lambda d: _hex_line(d.address_of(symbol)))
         return int(result.split(' ')[-1], 16)
 
     def get_symbol_info(self, address):
@@ -185,14 +362,16 @@ class GdbMI(object):
 
     def get_enum_lookup_table(self, enum, upperbound):
         """Return a table translating enum values to human readable strings."""
+        cmds = ['print ((enum {0}){1})'.format(enum, i)
+                for i in xrange(0, upperbound)]
+        natives = [_enum_native(enum, i) for i in xrange(0, upperbound)]
         table = []
-        for i in xrange(0, upperbound):
-            result = self._run_for_first(
-                'print ((enum {0}){1})'.format(enum, i))
-            parts = result.split(' ')
+        for i, result in enumerate(self.run_many(cmds, natives=natives)):
+            parts = result.lines[0].split(' ')
             if len(parts) < 3:
                 raise GdbMIException(
-                    "can't parse enum {0} {1}\n".format(enum, i), result)
+                    "can't parse enum {0} {1}\n".format(enum, i),
+                    result.lines[0])
             table.append(parts[2].rstrip())
 
         return table
@@ -209,7 +388,9 @@ class GdbMI(object):
 
     def get_value_of(self, symbol):
         """Returns the value of a symbol (in decimal)"""
-        result = self._run_for_one('print /d {0}'.format(symbol))
+        result = self._run_for_one(
+            'print /d {0}'.format(symbol),
+            lambda d: '$1 = {0}'.format(d.enumerator_value(symbol)))
         return int(result.split(' ')[-1], 10)
 
 if __name__ == '__main__':
@@ -0,0 +1,101 @@
+# Copyright (c) 2014, The Linux Foundation. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 and
+# only version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import re
+import zlib
+
+_SET_RE = re.compile(r'^(CONFIG_\w+)=(.*)$')
+_NOT_SET_RE = re.compile(r'^# (CONFIG_\w+) is not set$')
+
+
+class KernelConfig(object):
+
+    """A parsed .config (e.g. the one saved in the kernel with
+    CONFIG_IKCONFIG).
+
+    `lines' has the file line by line and `values' maps each option
+    to its value as written in the file, with options that are "not
+    set" mapped to 'n'. The typed getters return `default' for options
+    that aren't in the config at all:
+
+        config.tristate('CONFIG_MODULES')      # 'y', 'm' or 'n'
+        config.integer('CONFIG_NR_CPUS')       # 4
+        config.string('CONFIG_CMDLINE')        # 'console=ttyHSL0,...'
+
+    """
+
+    def __init__(self, lines=()):
+        self.lines = []
+        self.values = {}
+        for line in lines:
+            self.add_line(line)
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(text.splitlines())
+
+    @classmethod
+    def from_gzip(cls, data):
+        """Builds a KernelConfig from the gzip'd config saved in the
+        kernel. Raises zlib.error if `data' can't be decompressed."""
+        # 16 + MAX_WBITS: expect a gzip header. A decompressobj is used
+        # since there may be padding after the end of the stream.
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return cls.from_text(d.decompress(data))
+
+    def add_line(self, line):
+        line = line.rstrip().decode('ascii', 'ignore')
+        self.lines.append(line)
+        m = _SET_RE.match(line)
+        if m is not None:
+            self.values[m.group(1)] = m.group(2)
+            return
+        m = _NOT_SET_RE.match(line)
+        if m is not None:
+            self.values[m.group(1)] = 'n'
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+    def __contains__(self, name):
+        return name in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, name, default=None):
+        """Returns the value of `name' as written in the config."""
+        return self.values.get(name, default)
+
+    def is_defined(self, name):
+        """True if `name' is built in (=y)."""
+        return self.values.get(name) == 'y'
+
+    def tristate(self, name, default='n'):
+        value = self.values.get(name)
+        if value in ('y', 'm', 'n'):
+            return value
+        return default
+
+    def integer(self, name, default=None):
+        """Returns the value of an int or hex option."""
+        try:
+            return int(self.values[name], 0)
+        except (KeyError, ValueError):
+            return default
+
+    def string(self, name, default=None):
+        """Returns the value of a string option without the quotes."""
+        value = self.values.get(name)
+        if value is None or len(value) < 2 or value[0] != '"' or value[-1] != '"':
+            return default
+        return value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+
@@ -9,24 +9,191 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
-from bitops import bm, bvalsel
+import bisect
+
 from register import Register
 
+# bits 39:12 of an LPAE descriptor, the address of the next-level table
+# or of a page
+LPAE_ADDR_MASK = ((1 << 40) - 1) & ~0xfff
+
+# memory types of short-descriptor TEX[2:0], C, B
+_ARMV7_MEMORY_TYPES = {
+    (0, 0, 0): 'strongly-ordered',
+    (0, 0, 1): 'device',
+    (0, 1, 0): 'normal-wt',
+    (0, 1, 1): 'normal-wb',
+    (1, 0, 0): 'normal-uncached',
+    (1, 1, 1): 'normal-wbwa',
+    (2, 0, 0): 'device',
+}
+
+
+def armv7_attrs(apx, ap, xn, tex, cb):
+    """Describes a short descriptor with APX in bit 0 of `apx', AP[1:0]
+    in bits 1:0 of `ap', XN in bit 0 of `xn', TEX in bits 2:0 of `tex'
+    and C and B in bits 3 and 2 of `cb'."""
+    ap &= 3
+    if ap == 0:
+        perm = 'NA'
+    elif apx & 1:
+        perm = 'RO'
+    else:
+        perm = 'RW'
+    if ap & 2:
+        perm += '-USR'
+    memtype = (tex & 7, (cb >> 3) & 1, (cb >> 2) & 1)
+    return (perm, 'NX' if xn & 1 else 'X',
+            _ARMV7_MEMORY_TYPES.get(memtype, 'TEX{0}C{1}B{2}'.format(*memtype)))
+
+
+def lpae_attrs(desc):
+    """Describes the attributes of an LPAE block or page descriptor."""
+    perm = 'RO' if desc & (1 << 7) else 'RW'
+    if desc & (1 << 6):
+        perm += '-USR'
+    xn = desc & ((1 << 54) | (1 << 53))
+    return (perm, 'NX' if xn else 'X', 'attr{0}'.format((desc >> 2) & 7))
+
+
+class PageTableMap(object):
+
+    """The mappings in a set of page tables, as runs of virtual addresses
+    mapped to contiguous physical addresses with the same attributes.
+
+    `runs' is the list of (virt_start, virt_end, phys_start, attrs)
+    tuples sorted by virt_start, with virt_end exclusive. Runs are also
+    indexed by physical address so that the virtual addresses a
+    physical address is mapped at can be found.
+
+    """
+
+    def __init__(self, mappings):
+        """`mappings' gives (virt, size, phys, attrs) for each mapping in
+        the tables (section, page, block, ...) in increasing virtual
+        address order. Adjacent mappings are merged into one run if
+        they're physically contiguous and have the same attrs."""
+        runs = []
+        for virt, size, phys, attrs in mappings:
+            if runs:
+                start, end, run_phys, run_attrs = runs[-1]
+                if (end == virt and run_phys + (end - start) == phys and
+                        run_attrs == attrs):
+                    runs[-1] = (start, virt + size, run_phys, attrs)
+                    continue
+            runs.append((virt, virt + size, phys, attrs))
+        self.runs = runs
+        self.virt_starts = [r[0] for r in runs]
+
+        # runs by physical address, with the highest end address of
+        # the runs so far for the backwards scan in phys_to_virt
+        self.phys_runs = sorted(runs, key=lambda r: r[2])
+        self.phys_starts = [r[2] for r in self.phys_runs]
+        self.phys_max_ends = []
+        max_end = 0
+        for start, end, phys, attrs in self.phys_runs:
+            max_end = max(max_end, phys + end - start)
+            self.phys_max_ends.append(max_end)
+
+    def find(self, virt):
+        """Returns the run containing `virt', or None."""
+        i = bisect.bisect_right(self.virt_starts, virt) - 1
+        if i >= 0 and virt < self.runs[i][1]:
+            return self.runs[i]
+        return None
+
+    def virt_to_phys(self, virt):
+        """Returns the physical address `virt' is mapped to, or None."""
+        run = self.find(virt)
+        if run is None:
+            return None
+        return run[2] + virt - run[0]
+
+    def phys_to_virt(self, phys):
+        """Returns the sorted list of virtual addresses `phys' is mapped
+        at (empty if it isn't mapped)."""
+        aliases = []
+        i = bisect.bisect_right(self.phys_starts, phys) - 1
+        while i >= 0 and self.phys_max_ends[i] > phys:
+            start, end, run_phys, attrs = self.phys_runs[i]
+            if phys < run_phys + end - start:
+                aliases.append(start + phys - run_phys)
+            i -= 1
+        aliases.sort()
+        return aliases
+
+    def phys_to_virt_many(self, phys_addrs):
+        """Like `phys_to_virt' for every address in `phys_addrs'. Returns
+        a list of the alias lists in the same order, each distinct
+        address only being looked up once."""
+        found = {}
+        for phys in phys_addrs:
+            if phys not in found:
+                found[phys] = self.phys_to_virt(phys)
+        return [found[phys] for phys in phys_addrs]
+
+    def phys_range_to_virt(self, phys, size):
+        """Returns the sorted list of (virt, phys, size) for the parts of
+        [phys, phys + size) that are mapped, one per virtual alias of
+        each part."""
+        end = phys + size
+        pieces = []
+        i = bisect.bisect_left(self.phys_starts, end) - 1
+        while i >= 0 and self.phys_max_ends[i] > phys:
+            start, virt_end, run_phys, attrs = self.phys_runs[i]
+            lo = max(phys, run_phys)
+            hi = min(end, run_phys + virt_end - start)
+            if lo < hi:
+                pieces.append((start + lo - run_phys, lo, hi - lo))
+            i -= 1
+        pieces.sort()
+        return pieces
+
+    def dump(self, f):
+        """Writes one line per run to `f'."""
+        lines = []
+        for start, end, phys, attrs in self.runs:
+            lines.append(
+                '[0x{0:08x}--0x{1:08x}) -> [0x{2:09x}--0x{3:09x}) {4:>8}K {5}\n'.format(
+                    start, end, phys, phys + end - start, (end - start) >> 10,
+                    ' '.join(attrs)))
+        f.writelines(lines)
+
 
 class MMU(object):
 
     """Represents an MMU. Does virtual-to-physical address lookups,
     caching the results in a TLB.
 
+    The TLB is a dict keyed by 4K page number, so every address in an
+    already-translated page hits with a single lookup (pages in a larger
+    mapping get an entry each as they're used). It's emptied when it
+    holds `tlb_size' pages, which is much cheaper than keeping track of
+    which entry was used least recently on every hit. `tlb_hits' and
+    `tlb_misses' count lookups.
+
+    Addresses in the kernel's linear map (lowmem), where most reads go,
+    skip the TLB and the page tables altogether: the first time an
+    address from PAGE_OFFSET up is translated, the tables are walked
+    from PAGE_OFFSET for as long as they map virtual addresses to
+    physical ones at a fixed offset. Addresses in that window are then
+    translated with a subtraction. Everything else (vmalloc, modules,
+    fixmap, highmem) goes through the TLB.
+
     This is an abstract class that should not be used
     directly. Concrete subclasses should override the following
     methods:
 
     - load_page_tables()
 
-    - page_table_walk(addr)
+    - translate_page(addr)
+
+    - iter_mappings()
 
-    - dump_page_tables(file_object)
+    The first use of page_table_map (by dump_page_tables or
+    phys_to_virt, say) walks all of the tables once and builds a
+    PageTableMap. From then on TLB misses are looked up in it before
+    walking the tables.
 
 
     Interesting properties that will be set for usage in derived
@@ -36,10 +203,20 @@ class MMU(object):
 
     """
 
-    def __init__(self, ramdump):
+    def __init__(self, ramdump, tlb_size=4096):
         self._tlb = {}
+        self.tlb_size = tlb_size
+        self.tlb_hits = 0
+        self.tlb_misses = 0
         self.ramdump = ramdump
         self.ttbr = None
+        # the linear map window, [linear_start, linear_end) -> linear_phys,
+        # empty until find_linear_map has been run
+        self.linear_known = False
+        self.linear_start = 0
+        self.linear_end = 0
+        self.linear_phys = 0
+        self._map = None
         self.load_page_tables()
 
     def virt_to_phys(self, addr, skip_tlb=False, save_in_tlb=True):
@@ -47,100 +224,225 @@ class MMU(object):
             return None
 
         if not skip_tlb:
-            if addr in self._tlb:
-                return self._tlb[addr]
-
-        phys_addr = self.page_table_walk(addr)
+            if self.linear_start <= addr < self.linear_end:
+                return addr - self.linear_start + self.linear_phys
+            if not self.linear_known and addr >= self.ramdump.page_offset:
+                self.find_linear_map()
+                return self.virt_to_phys(addr, skip_tlb, save_in_tlb)
+
+            entry = self._tlb.get(addr >> 12)
+            if entry is not None:
+                self.tlb_hits += 1
+                page_phys, fault = entry
+                if page_phys is None:
+                    return fault
+                return page_phys + (addr & 0xfff)
+            self.tlb_misses += 1
+            if self._map is not None:
+                phys_addr = self._map.virt_to_phys(addr)
+                if phys_addr is not None:
+                    return phys_addr
+
+        phys_base, shift = self.translate_page(addr)
+        if shift is None:
+            # not mapped, phys_base is what we hand back to the caller
+            entry = (None, phys_base)
+            phys_addr = phys_base
+        else:
+            phys_addr = phys_base + (addr & ((1 << shift) - 1))
+            entry = (phys_addr & ~0xfff, None)
 
         if save_in_tlb:
-            self._tlb[addr] = phys_addr
+            self.tlb_insert(addr >> 12, entry)
 
         return phys_addr
 
+    def tlb_insert(self, page, entry):
+        if len(self._tlb) >= self.tlb_size:
+            self._tlb.clear()
+        self._tlb[page] = entry
+
+    def flush_tlb(self):
+        self._tlb.clear()
+
+    def find_linear_map(self):
+        """Works out the linear map window by walking the page tables
+        from PAGE_OFFSET, one mapping at a time, up to the first address
+        that isn't mapped at the same offset as PAGE_OFFSET. Since every
+        mapping in the window is checked, addresses in it translate the
+        same with or without the shortcut."""
+        start = self.ramdump.page_offset
+        end = start
+        offset = None
+        phys, shift = self.translate_page(start)
+        if shift is not None:
+            offset = phys - (start & ~((1 << shift) - 1))
+            while end <= 0xffffffff:
+                phys, shift = self.translate_page(end)
+                if shift is None:
+                    break
+                base = end & ~((1 << shift) - 1)
+                if phys - base != offset:
+                    break
+                end = base + (1 << shift)
+            end = min(end, 0x100000000)
+        self.linear_known = True
+        self.linear_start = start
+        self.linear_end = end
+        if offset is not None:
+            self.linear_phys = start + offset
+
     def load_page_tables(self):
         raise NotImplementedError
 
+    def translate_page(self, virt):
+        """Looks up the page (or section/block) containing `virt'.
+
+        Returns a (phys_base, shift) tuple, where phys_base is the
+        physical address the mapping starts at and 1 << shift is the
+        size of the mapping. If `virt' isn't mapped shift is None and
+        the first element is the value virt_to_phys should return.
+
+        """
+        raise NotImplementedError
+
     def page_table_walk(self, virt):
+        phys_base, shift = self.translate_page(virt)
+        if shift is None:
+            return phys_base
+        return phys_base + (virt & ((1 << shift) - 1))
+
+    def iter_mappings(self):
+        """Yields (virt, size, phys, attrs) for every valid mapping in the
+        page tables in increasing virtual address order, where `attrs'
+        is a tuple of strings describing the mapping."""
         raise NotImplementedError
 
+    def page_table_map(self):
+        """Returns the PageTableMap of the page tables, walking them the
+        first time it's asked for."""
+        if self._map is None:
+            self._map = PageTableMap(self.iter_mappings())
+        return self._map
+
+    def phys_to_virt(self, phys):
+        """Returns the sorted list of virtual addresses the physical
+        address `phys' is mapped at."""
+        return self.page_table_map().phys_to_virt(phys)
+
+    def phys_to_virt_many(self, phys_addrs):
+        return self.page_table_map().phys_to_virt_many(phys_addrs)
+
+    def phys_range_to_virt(self, phys, size):
+        return self.page_table_map().phys_range_to_virt(phys, size)
+
     def dump_page_tables(self, f):
-        raise NotImplementedError
+        self.page_table_map().dump(f)
 
 
 class Armv7MMU(MMU):
 
-    """An MMU for ARMv7 (no LPAE)."""
+    """An MMU for ARMv7 (no LPAE).
 
-    def load_page_tables(self):
-        self.global_page_table = [0 for i in range(4096)]
-        self.secondary_page_tables = [
-            [0 for col in range(256)] for row in range(4096)]
+    The first-level table is read with a single read when the MMU is
+    set up. Second-level tables are only read the first time an address
+    they map is translated, each with a single read, and are kept by
+    their base address.
+
+    """
 
+    def load_page_tables(self):
         msm_ttbr0 = self.ramdump.phys_offset + 0x4000
         self.ttbr = msm_ttbr0
-        virt_address = 0x0
-        gb_i = 0
-        se_i = 0
-        for l1_pte_ptr in range(msm_ttbr0, msm_ttbr0 + (4096 * 4), 4):
-            l1_pte = self.ramdump.read_word(l1_pte_ptr, False)
-            self.global_page_table[gb_i] = l1_pte
+        self.global_page_table = self.read_table(msm_ttbr0, 4096)
+        self.secondary_page_tables = {}
+
+    def read_table(self, base, count):
+        """Returns the `count' words of the table at physical address
+        `base' as an array('I'), or as a list with None for the words
+        that aren't in the dump."""
+        words = self.ramdump.read_words(base, count, False)
+        if words is None:
+            words = [self.ramdump.read_word(base + 4 * i, False)
+                     for i in range(count)]
+        return words
+
+    def second_level_table(self, l1_pte):
+        """Returns the 256 entries of the second-level table pointed to
+        by `l1_pte', reading it if it hasn't been read yet."""
+        l2_pt_base = l1_pte & ~0x3ff
+        table = self.secondary_page_tables.get(l2_pt_base)
+        if table is None:
+            table = self.read_table(l2_pt_base, 256)
+            self.secondary_page_tables[l2_pt_base] = table
+        return table
+
+    def translate_page(self, virt):
+        global_offset = virt >> 20
+        l1_pte = self.global_page_table[global_offset]
+        if l1_pte is None:
+            return (None, None)
+        if (l1_pte & 3) == 1:
+            l2_offset = (virt >> 12) & 0xff
+            l2_pte = self.second_level_table(l1_pte)[l2_offset]
+            if l2_pte is None:
+                return (None, None)
+            if (l2_pte & 3) == 2 or (l2_pte & 3) == 3:
+                # 4KB small page
+                return (l2_pte & 0xfffff000, 12)
+            elif (l2_pte & 3) == 1:
+                # 64KB large page
+                return (l2_pte & 0xffff0000, 16)
+        if (l1_pte & 3) == 2:
+            # 1MB section
+            return (l1_pte & 0xfff00000, 20)
+
+        return (0, None)
+
+    def iter_mappings(self):
+        for i, l1_pte in enumerate(self.global_page_table):
             if l1_pte is None:
-                gb_i += 1
                 continue
-            if (l1_pte & 3) == 0 or (l1_pte & 3) == 3:
-                for k in range(0, 256):
-                    virt_address += 0x1000
-            elif (l1_pte & 3) == 2:
-                if ((l1_pte & 0x40000) == 0):
-                    l1_pte_counter = l1_pte & 0xFFF00000
-                    for k in range(0, 256):
-                        virt_address += 0x1000
-                        l1_pte_counter += 0x1000
-                else:
-                    gb_i += 1
-                    continue
+            virt = i << 20
+            if (l1_pte & 3) == 2:
+                # 1MB section (supersections are handled as sections
+                # here, as in translate_page)
+                yield (virt, 1 << 20, l1_pte & 0xfff00000,
+                       armv7_attrs(l1_pte >> 15, l1_pte >> 10, l1_pte >> 4,
+                                   l1_pte >> 12, l1_pte))
             elif (l1_pte & 3) == 1:
-                l2_pt_desc = l1_pte
-                l2_pt_base = l2_pt_desc & (~0x3ff)
-                for l2_pte_ptr in range(l2_pt_base, l2_pt_base + (256 * 4), 4):
-                    virt_address += 0x1000
-                    l2_pt_entry = self.ramdump.read_word(l2_pte_ptr, False)
-                    self.secondary_page_tables[gb_i][se_i] = l2_pt_entry
-                    se_i += 1
-                se_i = 0
-            gb_i += 1
+                table = self.second_level_table(l1_pte)
+                for j, l2_pte in enumerate(table):
+                    if l2_pte is None:
+                        continue
+                    page_virt = virt + (j << 12)
+                    if (l2_pte & 3) == 2 or (l2_pte & 3) == 3:
+                        # 4KB small page
+                        yield (page_virt, 1 << 12, l2_pte & 0xfffff000,
+                               armv7_attrs(l2_pte >> 9, l2_pte >> 4, l2_pte,
+                                           l2_pte >> 6, l2_pte))
+                    elif (l2_pte & 3) == 1:
+                        # 64KB large page, one 4KB piece of it
+                        yield (page_virt, 1 << 12,
+                               (l2_pte & 0xffff0000) + (page_virt & 0xffff),
+                               armv7_attrs(l2_pte >> 9, l2_pte >> 4,
+                                           l2_pte >> 15, l2_pte >> 12,
+                                           l2_pte))
 
-    def page_table_walk(self, virt):
-        global_offset = bvalsel(31, 20, virt)
-        l1_pte = self.global_page_table[global_offset]
-        bit18 = (l1_pte & 0x40000) >> 18
-        if (bvalsel(1, 0, l1_pte) == 1):
-            l2_offset = bvalsel(19, 12, virt)
-            l2_pte = self.secondary_page_tables[global_offset][l2_offset]
-            if l2_pte is None:
-                return None
-            if (bvalsel(1, 0, l2_pte) == 2) or (bvalsel(1, 0, l2_pte) == 3):
-                entry4kb = (l2_pte & bm(31, 12)) + bvalsel(11, 0, virt)
-                return entry4kb
-            elif (bvalsel(1, 0, l2_pte) == 1):
-                entry64kb = (l2_pte & bm(31, 16)) + bvalsel(15, 0, virt)
-                return entry64kb
-        if (bvalsel(1, 0, l1_pte) == 2):
-            onemb_entry = bm(31, 20) & l1_pte
-            onemb_entry += bvalsel(19, 0, virt)
-            return onemb_entry
-
-        return 0
 
-    def dump_page_tables(self, f):
-        f.write(
-            'Dumping page tables is not currently supported for Armv7MMU\n')
-        f.flush()
+class Armv7LPAEMMU(MMU):
 
+    """An MMU for ARMv7 (with LPAE)
 
-class Armv7LPAEMMU(MMU):
+    translate_page walks the tables with plain masks and shifts. Each
+    table is read with a single read the first time it's used and kept
+    by its base address. Setting `trace' makes it use
+    translate_page_trace instead, which does the walk with Register
+    objects that are easier to follow (and print) but much slower.
 
-    """An MMU for ARMv7 (with LPAE)"""
+    """
+
+    trace = False
     # Descriptor types
     DESCRIPTOR_INVALID = 0x0
     DESCRIPTOR_BLOCK = 0x1
@@ -168,12 +470,12 @@ class Armv7LPAEMMU(MMU):
 
     def do_fl_level_lookup(self, table_base_address, table_index,
                            input_addr_split):
-        return do_fl_sl_level_lookup(table_base_address, table_index,
-                                     input_addr_split, 30)
+        return self.do_fl_sl_level_lookup(table_base_address, table_index,
+                                          input_addr_split, 30)
 
     def do_sl_level_lookup(self, table_base_address, table_index):
-        return do_fl_sl_level_lookup(table_base_address, table_index,
-                                     12, 21)
+        return self.do_fl_sl_level_lookup(table_base_address, table_index,
+                                          12, 21)
 
     def do_tl_level_lookup(self, table_base_address, table_index):
         descriptor, addr = self.do_level_lookup(
@@ -208,33 +510,80 @@ class Armv7LPAEMMU(MMU):
                               dtype=(1, 0))
         return descriptor, descriptor_addr
 
-    def block_or_page_desc_2_phys(self, desc, virt_r, n):
-        phys = Register(output_address=(39, n),
-                        page_offset=(n - 1, 0))
-        phys.output_address = desc.output_address
-        virt_r.add_field('rest', (n - 1, 0))
-        phys.page_offset |= virt_r.rest
-        return phys.value
-
-    def fl_block_desc_2_phys(self, desc, virt_r):
-        """Block descriptor to physical address."""
-        return self.block_or_page_desc_2_phys(desc, virt_r, 30)
-
-    def sl_block_desc_2_phys(self, desc, virt_r):
-        """Block descriptor to physical address."""
-        return self.block_or_page_desc_2_phys(desc, virt_r, 21)
-
-    def tl_page_desc_2_phys(self, desc, virt_r):
-        """Page descriptor to physical address."""
-        return self.block_or_page_desc_2_phys(desc, virt_r, 12)
-
     def read_phys_dword(self, physaddr):
         return self.ramdump.read_dword(physaddr, virtual=False)
 
     def load_page_tables(self):
-        pass
+        self.tables = {}
+        text_offset = 0x8000
+        pg_dir_size = 0x5000    # 0x4000 for non-LPAE
+        self.ttbr = self.ramdump.phys_offset + text_offset - pg_dir_size
+        # see translate_page_trace for where these come from
+        page_offset = self.ramdump.page_offset
+        if page_offset in (0x40000000, 0x80000000):
+            t1sz = 0 if page_offset == 0x40000000 else 1
+            self.initial_table = self.ttbr
+            self.initial_level = 1
+            self.initial_shift = 30
+            self.initial_entries = 1 << (2 - t1sz)
+        elif page_offset == 0xc0000000:
+            self.initial_table = self.ttbr + 4096 * (1 + 3)
+            self.initial_level = 2
+            self.initial_shift = 21
+            self.initial_entries = 512
+        else:
+            self.initial_level = None
 
-    def page_table_walk(self, virt):
+    def read_table(self, base, entries):
+        """Returns the table at physical address `base' as an array of
+        2 * `entries' words (low word first), or None if it isn't all in
+        the dump."""
+        key = (base, entries)
+        try:
+            return self.tables[key]
+        except KeyError:
+            pass
+        table = self.ramdump.read_words(base, 2 * entries, False)
+        self.tables[key] = table
+        return table
+
+    def read_descriptor(self, base, index, entries):
+        table = self.read_table(base, entries)
+        if table is None:
+            return self.read_phys_dword(base + (index << 3))
+        return table[2 * index] | (table[2 * index + 1] << 32)
+
+    def translate_page(self, virt):
+        if self.trace:
+            return self.translate_page_trace(virt)
+        if self.initial_level is None:
+            raise Exception(
+                'Invalid phys_offset for page_table_walk: 0x%x'
+                % self.ramdump.page_offset)
+
+        shift = self.initial_shift
+        index = (virt >> shift) & (self.initial_entries - 1)
+        desc = self.read_descriptor(self.initial_table, index,
+                                    self.initial_entries)
+        level = self.initial_level
+        while True:
+            if desc is None:
+                return (None, None)
+            dtype = desc & 3
+            if level == 3:
+                if dtype != Armv7LPAEMMU.TL_DESCRIPTOR_PAGE:
+                    return (None, None)
+                return (desc & LPAE_ADDR_MASK, 12)
+            if dtype == Armv7LPAEMMU.DESCRIPTOR_BLOCK:
+                return (desc & LPAE_ADDR_MASK & ~((1 << shift) - 1), shift)
+            if dtype != Armv7LPAEMMU.DESCRIPTOR_TABLE:
+                return (None, None)
+            level += 1
+            shift -= 9
+            index = (virt >> shift) & 0x1ff
+            desc = self.read_descriptor(desc & LPAE_ADDR_MASK, index, 512)
+
+    def translate_page_trace(self, virt):
         text_offset = 0x8000
         pg_dir_size = 0x5000    # 0x4000 for non-LPAE
         swapper_pg_dir_addr = self.ramdump.phys_offset + \
@@ -286,7 +635,7 @@ class Armv7LPAEMMU(MMU):
 
             # if we got a block descriptor we're done:
             if fl_desc.dtype == Armv7LPAEMMU.DESCRIPTOR_BLOCK:
-                return self.fl_block_desc_2_phys(fl_desc, virt_r)
+                return (fl_desc.output_address << 30, 30)
 
             base = Register(base=(39, 12))
             base.base = fl_desc.next_level_base_addr_upper
@@ -307,14 +656,14 @@ class Armv7LPAEMMU(MMU):
                 sl_desc = self.do_fl_sl_level_lookup(
                     ttbr, virt_r.sl_index, input_addr_split, 21)
             except:
-                return None
+                return (None, None)
         else:
             raise Exception('Invalid initial lookup level (0x%x)' %
                             initial_lkup_level)
 
         # if we got a block descriptor we're done:
         if sl_desc.dtype == Armv7LPAEMMU.DESCRIPTOR_BLOCK:
-            return self.sl_block_desc_2_phys(sl_desc, virt_r)
+            return (sl_desc.output_address << 21, 21)
 
         base = Register(base=(39, 12))
         base.base = sl_desc.next_level_base_addr_upper
@@ -322,11 +671,40 @@ class Armv7LPAEMMU(MMU):
             tl_desc = self.do_tl_level_lookup(
                 base.value, virt_r.tl_index)
         except:
-            return None
-
-        return self.tl_page_desc_2_phys(tl_desc, virt_r)
-
-    def dump_page_tables(self, f):
-        f.write(
-            'Dumping page tables is not currently supported for Armv7LPAEMMU\n')
-        f.flush()
+            return (None, None)
+
+        return (tl_desc.output_address << 12, 12)
+
+    def iter_mappings(self):
+        if self.initial_level is None:
+            return
+        # the initial table maps the top of the address space
+        virt = (1 << 32) - (self.initial_entries << self.initial_shift)
+        for m in self.iter_table(self.initial_table, self.initial_entries,
+                                 self.initial_shift, self.initial_level,
+                                 virt):
+            yield m
+
+    def iter_table(self, base, entries, shift, level, virt):
+        table = self.read_table(base, entries)
+        for i in range(entries):
+            if table is None:
+                desc = self.read_phys_dword(base + (i << 3))
+                if desc is None:
+                    continue
+            else:
+                desc = table[2 * i] | (table[2 * i + 1] << 32)
+            entry_virt = virt + (i << shift)
+            dtype = desc & 3
+            if level == 3:
+                if dtype == Armv7LPAEMMU.TL_DESCRIPTOR_PAGE:
+                    yield (entry_virt, 1 << 12, desc & LPAE_ADDR_MASK,
+                           lpae_attrs(desc))
+            elif dtype == Armv7LPAEMMU.DESCRIPTOR_BLOCK:
+                yield (entry_virt, 1 << shift,
+                       desc & LPAE_ADDR_MASK & ~((1 << shift) - 1),
+                       lpae_attrs(desc))
+            elif dtype == Armv7LPAEMMU.DESCRIPTOR_TABLE:
+                for m in self.iter_table(desc & LPAE_ADDR_MASK, 512,
+                                         shift - 9, level + 1, entry_virt):
+                    yield m
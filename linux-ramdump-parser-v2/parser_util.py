@@ -13,21 +13,135 @@ import os
 import platform
 import glob
 import re
+import traceback
+import multiprocessing
+
+from print_out import print_out_str, print_out_section, print_out_raw, \
+    start_capture, stop_capture, flush_out
 
 _parsers = []
 
+# state handed to the worker processes of run_parsers_parallel
+_worker_dump = None
+_worker_parsers = None
+
+# The parsers under `parsers', listed here so that the command line can
+# be set up without importing any of them. A module is only imported
+# once one of its parsers is going to run. Entries are
+# (module, class name, longopt, description, shortopt, optional, needs).
+# longopt to optional have the same meaning as the arguments of
+# register_parser, which must agree with them. `needs' lists the lazily
+# built RamDump attributes (symtab, kconfig, unwind) the parser uses, so
+# run_parsers_parallel can build them once before forking.
+PARSER_MANIFEST = (
+    ('cachedump', 'CacheDump', '--print-cache-dump',
+     'Print L2 cache dump', None, True,
+     ('kconfig', 'symtab')),
+    ('cpu_state', 'CpuState', '--cpu-state',
+     "Reads register values of non-panic'ing CPUs", None, False,
+     ()),
+    ('debug_image', 'DebugImage', '--parse-debug-image',
+     'Parse the debug image and associated information', None, False,
+     ('kconfig', 'symtab', 'unwind')),
+    ('dmesg', 'Dmesg', '--dmesg', 'Print the dmesg', '-d', False,
+     ()),
+    ('gpuinfo', 'GPUinfo', '--print-gpuinfo',
+     'print gpu info like ringbuffer,snapshot and pointer addresses',
+     None, True,
+     ('kconfig',)),
+    ('iommu', 'IOMMU', '--print-iommu-pg-tables', 'Print IOMMU page tables',
+     None, False,
+     ('symtab',)),
+    ('irqstate', 'IrqParse', '--print-irqs', 'Print all the irq information',
+     '-i', False,
+     ('kconfig', 'symtab')),
+    ('kconfig', 'Kconfig', '--print-kconfig',
+     'Print saved kernel configuration', '-c', False,
+     ('kconfig',)),
+    ('page_table_dump', 'PageTableDump', '--dump-page-tables',
+     'Dumps page tables', None, False,
+     ()),
+    ('pagetracking', 'PageTracking', '--print-pagetracking',
+     'print page tracking information (if available)', None, False,
+     ('kconfig', 'symtab')),
+    ('pagetypeinfo', 'Pagetypeinfo', '--print-pagetypeinfo',
+     'Print the pagetypeinfo', None, False,
+     ()),
+    ('roareadiff', 'ROData', '--check-rodata',
+     'check rodata in dump against the static image', None, False,
+     ()),
+    ('rtb', 'RTB', '--print-rtb', 'Print RTB (if enabled)', '-r', False,
+     ('symtab',)),
+    ('runqueue', 'RunQueues', '--print-runqueues',
+     'Print the runqueue status', None, False,
+     ('symtab',)),
+    ('slabinfo', 'Slabinfo', '--slabinfo',
+     'print information about slabs', None, True,
+     ('kconfig', 'symtab')),
+    ('taskdump', 'DumpTasks', '--print-tasks',
+     'Print all the task information', '-t', False,
+     ('symtab', 'unwind')),
+    ('taskdump', 'CheckForPanic', '--check-for-panic',
+     'Check if a kernel panic occured', '-p', False,
+     ('symtab', 'unwind')),
+    ('taskdump', 'DumpFoldedStacks', '--print-folded-stacks',
+     'Write the stacks of all tasks in the folded format used by flame '
+     'graph tools', None, True,
+     ('symtab', 'unwind')),
+    ('vmalloc', 'Vmalloc', '--print-vmalloc', 'print vmalloc information',
+     None, False,
+     ('symtab',)),
+    ('vmstat', 'ZoneInfo', '--print-vmstats',
+     'Print the information similar to /proc/zoneinfo and /proc/vmstat',
+     None, False,
+     ()),
+    ('watchdog', 'TZRegDump', '--check-for-watchdog',
+     'Check for an FIQ watchdog', '-w', False,
+     ('kconfig', 'symtab', 'unwind')),
+    ('workqueue', 'Workqueues', '--print-workqueues',
+     'Print the state of the workqueues', '-q', False,
+     ('symtab',)),
+)
+
 
 class ParserConfig(object):
 
     """Class to encapsulate a RamParser its desired setup (command-line
-    options, etc)."""
+    options, etc).
+
+    `name' is the name of the parser class and `module' the module
+    that defines it. The class itself (`cls') is only imported the
+    first time it's asked for.
 
-    def __init__(self, cls, longopt, desc, shortopt, optional):
-        self.cls = cls
+    """
+
+    def __init__(self, cls, longopt, desc, shortopt, optional,
+                 module=None, name=None, needs=()):
+        self._cls = cls
         self.longopt = longopt
         self.desc = desc
         self.shortopt = shortopt
         self.optional = optional
+        self.module = module or cls.__module__
+        self.name = name or cls.__name__
+        self.needs = needs
+
+    @property
+    def cls(self):
+        if self._cls is None:
+            # registers the class with us, see register_parser
+            __import__(self.module)
+            if self._cls is None:
+                raise Exception('{0} does not define parser {1}'.format(
+                    self.module, self.name))
+        return self._cls
+
+
+def _find_parser(module, name):
+    for p in _parsers:
+        if p.module == module and p.name == name:
+            return p
+    return None
 
 
 def register_parser(longopt, desc, shortopt=None, optional=False):
@@ -45,6 +159,10 @@ def register_parser(longopt, desc, shortopt=None, optional=False):
 
       o Define a `parse' method for your class
 
+      o Add the parser to PARSER_MANIFEST. This is optional, but
+        modules that aren't listed there have to be imported every
+        time ramparse.py starts
+
     All of the command line argument handling and invoking the parse
     method of your parser will then be handled automatically.
 
@@ -64,43 +182,139 @@ def register_parser(longopt, desc, shortopt=None, optional=False):
 
     """
     def wrapper(cls):
-        if cls in [p.cls for p in _parsers]:
-            raise Exception(cls + ' is already registered!')
-        _parsers.append(ParserConfig(cls, longopt, desc, shortopt, optional))
+        p = _find_parser(cls.__module__, cls.__name__)
+        if p is None:
+            _parsers.append(
+                ParserConfig(cls, longopt, desc, shortopt, optional))
+            return cls
+        if p._cls is not None:
+            raise Exception(cls.__name__ + ' is already registered!')
+        if (p.longopt, p.shortopt, p.optional) != (longopt, shortopt, optional):
+            raise Exception(
+                'PARSER_MANIFEST entry for {0} does not match its '
+                'register_parser options'.format(cls.__name__))
+        p._cls = cls
         return cls
     return wrapper
 
 
+def _load_manifest():
+    for (module, name, longopt, desc, shortopt, optional,
+         needs) in PARSER_MANIFEST:
+        module = 'parsers.' + module
+        if _find_parser(module, name) is None:
+            _parsers.append(ParserConfig(None, longopt, desc, shortopt,
+                                         optional, module, name, needs))
+
+
 def get_parsers():
-    """Imports everyone under the `parsers' directory. It is expected that
-    the parsers under the parsers directory will be a collection of
-    classes that subclass RamParser and use the register_parser
-    decorator to register themselves with the parser
-    framework. Therefore, importing all the modules under `parsers'
-    should have the side-effect of populating the (internal to
-    parser_util) _parsers list with the discovered parsers.
+    """Returns the list of ParserConfig instances for the parsers under
+    the `parsers' directory.
 
-    Returns the list of ParserConfig instances built as a side-effect
-    of the importing.
+    The parsers listed in PARSER_MANIFEST are returned without being
+    imported; their modules are imported when something first asks
+    for their `cls'. Any other module under `parsers' is imported to
+    let the classes in it that are decorated with `register_parser'
+    add themselves to the (internal to parser_util) _parsers list.
+    Calling get_parsers more than once is cheap.
 
     """
+    _load_manifest()
+    listed = set('parsers.' + entry[0] for entry in PARSER_MANIFEST)
     parsers_dir = os.path.join(os.path.dirname(__file__), 'parsers')
-    for f in glob.glob(os.path.join(parsers_dir, '*.py')):
+    for f in sorted(glob.glob(os.path.join(parsers_dir, '*.py'))):
         modname_ext = os.path.basename(f)
         if modname_ext == '__init__.py':
             continue
         modname = 'parsers.' + os.path.splitext(modname_ext)[0]
-        # if the module contains a class (or classes) that are
-        # decorated with `register_parser' then the following import
-        # will have the side-effect of adding that class (encapsulated
-        # in a ParserConfig object) to the _parsers list. Note that
+        if modname in listed:
+            continue
         # this import is effectively a noop if the module has already
-        # been imported, so there's no harm in calling get_parsers
-        # multiple times.
+        # been imported
         __import__(modname)
     return _parsers
 
 
+def run_parser(dump, p):
+    """Runs the parser described by the ParserConfig `p' against `dump',
+    wrapping its output in a section."""
+    with print_out_section(p.name):
+        p.cls(dump).parse()
+
+
+def _init_worker():
+    _worker_dump.reopen()
+
+
+def _run_parser_checked(dump, p):
+    # a failing parser gets its traceback printed and doesn't stop the
+    # ones after it
+    try:
+        run_parser(dump, p)
+    except Exception:
+        print_out_str('!!! {0} failed:'.format(p.name))
+        print_out_str(traceback.format_exc())
+
+
+def _run_parser_in_worker(i):
+    start_capture()
+    try:
+        _run_parser_checked(_worker_dump, _worker_parsers[i])
+    finally:
+        text = stop_capture()
+        _worker_dump.flush_caches()
+    return text
+
+
+def run_parsers_parallel(dump, parsers, jobs):
+    """Runs the ParserConfigs in `parsers' against `dump' in a pool of
+    `jobs' worker processes.
+
+    The workers are forked from this process so they share its
+    mappings of the dump files, and reopen everything else (see
+    RamDump.reopen). Where there's no fork (Windows) the parsers are
+    run one after the other instead. Each parser's output is captured
+    in its worker and written out here in the order of `parsers', so
+    the result reads the same as a serial run. A parser that raises an
+    exception has the traceback printed in its section and doesn't
+    stop the others.
+
+    """
+    global _worker_dump, _worker_parsers
+    if not hasattr(os, 'fork'):
+        # spawned workers wouldn't get the dump, see _init_worker
+        for p in parsers:
+            _run_parser_checked(dump, p)
+        return
+    _worker_dump = dump
+    _worker_parsers = parsers
+    # build the tables the parsers need here, once, so the workers
+    # share them copy-on-write instead of each building its own (and
+    # the time it takes shows up in dump.timings). Parsers that aren't
+    # in PARSER_MANIFEST build whatever they use themselves.
+    needs = set()
+    for p in parsers:
+        needs.update(p.needs)
+    for name in sorted(needs):
+        getattr(dump, name)
+    # let the workers start off with everything we already know and
+    # don't let them inherit unwritten output
+    dump.flush_caches()
+    flush_out()
+    pool = multiprocessing.Pool(jobs, _init_worker)
+    try:
+        for text in pool.imap(_run_parser_in_worker, range(len(parsers))):
+            print_out_raw(text)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _worker_dump = None
+        _worker_parsers = None
+
+
 class RamParser(object):
 
     """Base class for implementing ramdump parsers. New parsers should inherit
@@ -9,8 +9,6 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
-import struct
-
 from parser_util import register_parser, RamParser
 from print_out import print_out_str
 
@@ -21,29 +19,25 @@ cache_way = 8
 def save_l1_dump(ram_dump, cache_base, size):
     with ram_dump.open_file('l1_cache_dump.bin') as cache_file:
 
-        for i in range(0, size):
-            val = ram_dump.read_byte(cache_base + i, False)
-            cache_file.write(struct.pack('<B', val))
+        data = ram_dump.read_bytes(cache_base, size, False)
+        if data is None:
+            print_out_str(
+                '!!! Could not read L1 cache dump at {0:x}'.format(cache_base))
+            return
+        cache_file.write(data)
         print_out_str('--- Wrote cache dump to l1_cache_dump.bin')
 
 
 def parse_cache_dump(ram_dump, cache_base):
 
-    magic_num_offset = ram_dump.field_offset(
-        'struct l2_cache_dump', 'magic_number')
-    version_offset = ram_dump.field_offset('struct l2_cache_dump', 'version')
-    line_size_offset = ram_dump.field_offset(
-        'struct l2_cache_dump', 'line_size')
-    total_lines_offset = ram_dump.field_offset(
-        'struct l2_cache_dump', 'total_lines')
-    cache_offset_struct = ram_dump.field_offset(
-        'struct l2_cache_dump', 'cache')
-    l2dcrtr0_offset_struct = ram_dump.field_offset(
-        'struct l2_cache_line_dump', 'l2dcrtr0_val')
-    l2dcrtr1_offset_struct = ram_dump.field_offset(
-        'struct l2_cache_line_dump', 'l2dcrtr1_val')
-    cache_line_data_offset_struct = ram_dump.field_offset(
-        'struct l2_cache_line_dump', 'cache_line_data')
+    (magic_num_offset, version_offset, line_size_offset, total_lines_offset,
+     cache_offset_struct) = ram_dump.field_offsets(
+        'struct l2_cache_dump',
+        ('magic_number', 'version', 'line_size', 'total_lines', 'cache'))
+    (l2dcrtr0_offset_struct, l2dcrtr1_offset_struct,
+     cache_line_data_offset_struct) = ram_dump.field_offsets(
+        'struct l2_cache_line_dump',
+        ('l2dcrtr0_val', 'l2dcrtr1_val', 'cache_line_data'))
     cache_line_struct_size = ram_dump.sizeof('struct l2_cache_line_dump')
 
     magic = ram_dump.read_word(cache_base + magic_num_offset, False)
@@ -67,13 +61,17 @@ def parse_cache_dump(ram_dump, cache_base):
     for i in range(0, 32):
         header_str = header_str + '{0:8} '.format('Word{0}'.format(i))
 
-    header_str = header_str + '{0:8} {1:8}\n'.format('L2DCRTR0', 'L2DCRTR0')
+    header_str = header_str + '{0:8} {1:8} {2}'.format(
+        'L2DCRTR0', 'L2DCRTR0', 'Virtual')
 
     cache_ptr = cache_base + cache_offset_struct
 
+    # the lines are written once they're all read so the addresses of
+    # the valid ones can be looked up in the page tables in one go
+    rows = []
     for i in range(0, lines):
 
-        cache_file.write(header_str)
+        rows.append((header_str, None))
 
         for j in range(0, cache_way):
             cache_line_ptr = cache_ptr + (i * cache_way + j) * line_size
@@ -94,17 +92,22 @@ def parse_cache_dump(ram_dump, cache_base):
             cache_line_data_ptr = cache_line_ptr + \
                 cache_line_data_offset_struct
 
-            for k in range(0, 32):
-                out_str = out_str + \
-                    '{0:0=8x} '.format(
-                        ram_dump.read_word(cache_line_data_ptr + 4 * k, False))
+            for word in ram_dump.read_words(cache_line_data_ptr, 32, False):
+                out_str = out_str + '{0:0=8x} '.format(word)
 
             out_str = out_str + \
-                '{0:0=8x} {1:0=8x}\n'.format(l2dcrtr0_val, l2dcrtr1_val)
+                '{0:0=8x} {1:0=8x}'.format(l2dcrtr0_val, l2dcrtr1_val)
 
-            cache_file.write(out_str)
+            rows.append((out_str, addr if valid else None))
             select = select + 0x10
 
+    addrs = [a for _, a in rows if a is not None]
+    virts = iter(ram_dump.phys_annotations(addrs))
+    for out_str, addr in rows:
+        if addr is not None:
+            out_str = out_str + ' ' + next(virts)
+        cache_file.write(out_str.rstrip() + '\n')
+
     cache_file.close()
     print_out_str('--- Wrote cache dump to l2_cache_dump.txt')
 
@@ -48,13 +48,16 @@ class CpuState(RamParser):
 
         max_len = max([len(s) for s in regs])
 
-        for cpu in self.ramdump.iter_cpus():
+        cpus = self.ramdump.percpu.present_cpus()
+        all_regs = self.ramdump.percpu.read_percpu(
+            regs_before_stop_addr, '<{0}I'.format(len(regs)), cpus)
+        for cpu, reg_vals in zip(cpus, all_regs):
             print_out_str('CPU %d' % cpu)
+            if reg_vals is None:
+                print_out_str('   Could not read the registers')
+                continue
             lines = []
-            for index, reg in enumerate(regs):
-                reg_addr = self.ramdump.array_index(
-                    regs_before_stop_addr, 'unsigned long', index)
-                reg_val = self.ramdump.read_word(reg_addr, cpu=cpu)
+            for reg, reg_val in zip(regs, reg_vals):
                 lines.append(
                     '   {0:{width}} = 0x{1:x}'.format(reg, reg_val, width=max_len))
 
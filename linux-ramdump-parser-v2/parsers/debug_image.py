@@ -137,17 +137,13 @@ class DebugImage(RamParser):
             'dump_client_type', 32)
         dump_table_ptr_offset = self.ramdump.field_offset(
             'struct msm_memory_dump', 'dump_table_ptr')
-        version_offset = self.ramdump.field_offset(
-            'struct msm_dump_table', 'version')
-        num_entries_offset = self.ramdump.field_offset(
-            'struct msm_dump_table', 'num_entries')
-        client_entries_offset = self.ramdump.field_offset(
-            'struct msm_dump_table', 'client_entries')
-        id_offset = self.ramdump.field_offset('struct msm_client_dump', 'id')
-        start_addr_offset = self.ramdump.field_offset(
-            'struct msm_client_dump', 'start_addr')
-        end_addr_offset = self.ramdump.field_offset(
-            'struct msm_client_dump', 'end_addr')
+        version_offset, num_entries_offset, client_entries_offset = \
+            self.ramdump.field_offsets(
+                'struct msm_dump_table',
+                ('version', 'num_entries', 'client_entries'))
+        id_offset, start_addr_offset, end_addr_offset = \
+            self.ramdump.field_offsets(
+                'struct msm_client_dump', ('id', 'start_addr', 'end_addr'))
         client_dump_entry_size = self.ramdump.sizeof('struct msm_client_dump')
 
         mem_dump_data = self.ramdump.addr_lookup('mem_dump_data')
@@ -183,6 +179,10 @@ class DebugImage(RamParser):
             else:
                 print_out_str(
                     'Parsing debug information for {0}'.format(client_name))
+                virts = self.ramdump.phys_range_annotation(
+                    client_start, client_end - client_start)
+                if virts:
+                    print_out_str('Client region is mapped at {0}'.format(virts))
                 func = print_table[client_name]
                 getattr(DebugImage, func)(self, client_start,
                                           client_end, client_name)
@@ -32,7 +32,7 @@ class Dmesg(RamParser):
     def extract_dmesg_flat(self, ramdump):
         addr = ramdump.addr_lookup('__log_buf')
         size = ramdump.sizeof('__log_buf')
-        dmesg = ramdump.read_physical(ramdump.virt_to_phys(addr), size)
+        dmesg = ramdump.read_bytes(addr, size)
         print_out_str(self.cleanupString(dmesg.decode('ascii', 'ignore')))
 
     def log_from_idx(self, ramdump, idx, logbuf):
@@ -67,11 +67,13 @@ class GPUinfo(RamParser):
             retired_timestamp = self.ramdump.read_word(
                 int(memstore_addr) + 8, False)
             i = 0
-            for i in range(0, int(ringbuffer_size)):
-                    data = self.ramdump.read_word(
-                        int(ringbuffer_addr) + (i * 4), False)
-                    if int(data) == int(retired_timestamp):
-                            break
+            ringbuffer = self.ramdump.read_words(
+                int(ringbuffer_addr), int(ringbuffer_size), False)
+            if ringbuffer:
+                try:
+                    i = ringbuffer.index(int(retired_timestamp))
+                except ValueError:
+                    i = len(ringbuffer) - 1
             i = i * 4
             print_out_str('Current context: {0:x}, Global eoptimestamp: {1:x} '
                           'found at Ringbuffer[{2:x}]'.format(current_context,
@@ -15,6 +15,7 @@ import rb_tree
 import linux_list as llist
 from print_out import print_out_str
 from parser_util import register_parser, RamParser
+from structview import Pointer, pointer_value
 
 IOMMU_DOMAIN_VAR = 'domain_root'
 
@@ -23,6 +24,25 @@ SZ_64K = 0x10000
 SZ_1M = 0x100000
 SZ_16M = 0x1000000
 
+CTX_DRVDATA_FIELDS = (
+    ('name', 'I'),
+    ('num', 'I'),
+)
+
+IOMMU_PRIV_FIELDS = (
+    ('client_name', 'I'),
+    ('list_attached', 'I'),
+    ('pg_table', 'I', 'pt.fl_table'),
+    ('redirect', 'I', 'pt.redirect'),
+)
+
+IOVA_DATA_FIELDS = (
+    ('domain_num', 'I'),
+    ('domain', Pointer('struct iommu_domain', (
+        ('priv', Pointer('struct msm_iommu_priv', IOMMU_PRIV_FIELDS)),
+    ))),
+)
+
 MAP_SIZE_STR = ['4K', '8K', '16K', '32K', '64K',
                 '128K', '256K', '512K', '1M', '2M',
                 '4M', '8M', '16M']
@@ -108,34 +128,12 @@ class IOMMU(RamParser):
         self.SL_CACHEABLE = (1 << 3)
         self.SL_TEX0 = (1 << 6)
         self.SL_NG = (1 << 11)
-        self.ctxdrvdata_name_offset = 0
-        self.ctxdrvdata_num_offset = 0
         self.ctx_list = []
 
         self.node_offset = self.ramdump.field_offset(
             'struct msm_iova_data', 'node')
-        self.domain_num_offset = self.ramdump.field_offset(
-            'struct msm_iova_data', 'domain_num')
-        self.domain_offset = self.ramdump.field_offset(
-            'struct msm_iova_data', 'domain')
-        self.priv_offset = self.ramdump.field_offset(
-            'struct iommu_domain', 'priv')
         self.ctxdrvdata_attached_offset = self.ramdump.field_offset(
             'struct msm_iommu_ctx_drvdata', 'attached_elm')
-        self.ctxdrvdata_name_offset = self.ramdump.field_offset(
-            'struct msm_iommu_ctx_drvdata', 'name')
-        self.ctxdrvdata_num_offset = self.ramdump.field_offset(
-            'struct msm_iommu_ctx_drvdata', 'num')
-        self.priv_pt_offset = self.ramdump.field_offset(
-            'struct msm_iommu_priv', 'pt')
-        self.list_attached_offset = self.ramdump.field_offset(
-            'struct msm_iommu_priv', 'list_attached')
-        self.client_name_offset = self.ramdump.field_offset(
-            'struct msm_iommu_priv', 'client_name')
-        self.pgtable_offset = self.ramdump.field_offset(
-            'struct msm_iommu_pt', 'fl_table')
-        self.redirect_offset = self.ramdump.field_offset(
-            'struct msm_iommu_pt', 'redirect')
 
         self.list_next_offset, self.list_prev_offset = llist.get_list_offsets(
             self.ramdump)
@@ -147,45 +145,43 @@ class IOMMU(RamParser):
         return (((va) & 0xFF000) >> 12)
 
     def list_func(self, node):
-        ctx_drvdata_name_ptr = self.ramdump.read_word(
-            node + self.ctxdrvdata_name_offset)
-        num = self.ramdump.read_word(node + self.ctxdrvdata_num_offset)
+        ctx_drvdata = self.ramdump.view('struct msm_iommu_ctx_drvdata', node,
+                                        CTX_DRVDATA_FIELDS)
+        if ctx_drvdata is None:
+            return
 
-        if ctx_drvdata_name_ptr != 0:
-            name = self.ramdump.read_cstring(ctx_drvdata_name_ptr, 100)
-            self.ctx_list.append((num, name))
+        if ctx_drvdata.name != 0:
+            name = self.ramdump.read_cstring(ctx_drvdata.name, 100)
+            self.ctx_list.append((ctx_drvdata.num, name))
 
     def iommu_domain_func(self, node):
 
-        domain_num_addr = (node - self.node_offset) + self.domain_num_offset
-        domain_num = self.ramdump.read_word(domain_num_addr)
-
-        domain_addr = (node - self.node_offset) + self.domain_offset
-        domain = self.ramdump.read_word(domain_addr)
-
-        priv_ptr = self.ramdump.read_word(domain + self.priv_offset)
+        iova_data = self.ramdump.view('struct msm_iova_data',
+                                      node - self.node_offset,
+                                      IOVA_DATA_FIELDS)
+        if iova_data is None or iova_data.domain is None:
+            return
+        domain_num = iova_data.domain_num
+        domain = iova_data.domain
+        priv = domain.priv
+        if priv is None:
+            return
+        priv_ptr = pointer_value(domain, 'priv')
 
-        if self.client_name_offset is not None:
-            client_name_ptr = self.ramdump.read_word(
-                priv_ptr + self.client_name_offset)
-            if client_name_ptr != 0:
-                client_name = self.ramdump.read_cstring(client_name_ptr, 100)
+        # fields that can't be found in this kernel read as None
+        if priv.client_name is not None:
+            if priv.client_name != 0:
+                client_name = self.ramdump.read_cstring(priv.client_name, 100)
             else:
                 client_name = '(null)'
         else:
             client_name = 'unknown'
 
-        if self.list_attached_offset is not None:
-            list_attached = self.ramdump.read_word(
-                priv_ptr + self.list_attached_offset)
-        else:
-            list_attached = None
+        list_attached = priv.list_attached
 
-        if self.priv_pt_offset is not None:
-            pg_table = self.ramdump.read_word(
-                priv_ptr + self.priv_pt_offset + self.pgtable_offset)
-            redirect = self.ramdump.read_word(
-                priv_ptr + self.priv_pt_offset + self.redirect_offset)
+        if priv.pg_table is not None:
+            pg_table = priv.pg_table
+            redirect = priv.redirect
         else:
             # On some builds we are unable to look up the offsets so hardcode
             # the offsets.
@@ -216,10 +212,19 @@ class IOMMU(RamParser):
         self.ctx_list = []
         self.domain_list.append(dom)
 
+    def read_pte_table(self, table, count, virtual=True):
+        """Reads a whole page table with one bulk read. Falls back to
+        reading entry by entry (with None for unreadable entries) if
+        the table can't be read in one go."""
+        entries = self.ramdump.read_words(table, count, virtual)
+        if entries is not None:
+            return entries
+        return [self.ramdump.read_word(table + i * 4, virtual)
+                for i in range(0, count)]
+
     def print_sl_page_table(self, pg_table):
-        sl_pte = pg_table
-        for i in range(0, self.NUM_SL_PTE):
-            phy_addr = self.ramdump.read_word(sl_pte, False)
+        sl_ptes = self.read_pte_table(pg_table, self.NUM_SL_PTE, False)
+        for i, phy_addr in enumerate(sl_ptes):
             if phy_addr is not None:  # and phy_addr & self.SL_TYPE_SMALL:
                 read_write = '[R/W]'
                 if phy_addr & self.SL_AP2:
@@ -234,13 +239,10 @@ class IOMMU(RamParser):
                 elif phy_addr != 0:
                     self.out_file.write(
                         'SL_PTE[%d] = %x NOTE: ERROR [Do not understand page table bits]\n' % (i, phy_addr))
-            sl_pte += 4
 
     def print_page_table(self, pg_table):
-        fl_pte = pg_table
-        for i in range(0, self.NUM_FL_PTE):
-        # for i in range(0,5):
-            sl_pg_table_phy_addr = self.ramdump.read_word(fl_pte)
+        fl_ptes = self.read_pte_table(pg_table, self.NUM_FL_PTE)
+        for i, sl_pg_table_phy_addr in enumerate(fl_ptes):
             if sl_pg_table_phy_addr is not None:
                 if sl_pg_table_phy_addr & self.FL_TYPE_TABLE:
                     self.out_file.write('FL_PTE[%d] = %x [4K/64K]\n' %
@@ -259,11 +261,8 @@ class IOMMU(RamParser):
             else:
                 self.out_file.write(
                     'FL_PTE[%d] NOTE: ERROR [Cannot understand first level page table entry]\n' % (i))
-            fl_pte += 4
 
-    def get_mapping_info(self, pg_table, index):
-        sl_pte = pg_table + (index * 4)
-        phy_addr = self.ramdump.read_word(sl_pte, False)
+    def get_mapping_info(self, phy_addr):
         current_phy_addr = -1
         current_page_size = SZ_4K
         current_map_type = 0
@@ -328,9 +327,8 @@ class IOMMU(RamParser):
 
     def create_flat_mapping(self, pg_table):
         tmp_mapping = {}
-        fl_pte = pg_table
-        for fl_index in range(0, self.NUM_FL_PTE):
-            fl_pg_table_entry = self.ramdump.read_word(fl_pte)
+        fl_ptes = self.read_pte_table(pg_table, self.NUM_FL_PTE)
+        for fl_index, fl_pg_table_entry in enumerate(fl_ptes):
 
             if fl_pg_table_entry is not None:
                 if fl_pg_table_entry & self.FL_TYPE_SECT:
@@ -345,11 +343,13 @@ class IOMMU(RamParser):
                             tmp_mapping = self.add_flat_mapping(
                                 tmp_mapping, fl_index, 0, -1, 0, 0, False)
                 elif fl_pg_table_entry & self.FL_TYPE_TABLE:
-                    sl_pte = fl_pg_table_entry & self.FL_BASE_MASK
+                    sl_ptes = self.read_pte_table(
+                        fl_pg_table_entry & self.FL_BASE_MASK,
+                        self.NUM_SL_PTE, False)
 
-                    for sl_index in range(0, self.NUM_SL_PTE):
+                    for sl_index, sl_pte in enumerate(sl_ptes):
                         (phy_addr, page_size, map_type,
-                         status) = self.get_mapping_info(sl_pte, sl_index)
+                         status) = self.get_mapping_info(sl_pte)
                         if status:
                             if phy_addr != -1:
                                 tmp_mapping = self.add_flat_mapping(
@@ -371,7 +371,6 @@ class IOMMU(RamParser):
             else:
                 self.out_file.write(
                     '[!] WARNING: FL_PTE[%d] NOTE: ERROR [Cannot understand first level page table entry]\n' % (fl_index))
-            fl_pte += 4
         return tmp_mapping
 
     def create_collapsed_mapping(self, flat_mapping):
@@ -420,14 +419,23 @@ class IOMMU(RamParser):
     def print_page_table_pretty(self, pg_table):
         flat_mapping = self.create_flat_mapping(pg_table)
         collapsed_mapping = self.create_collapsed_mapping(flat_mapping)
+        mappings = [collapsed_mapping[virt]
+                    for virt in sorted(collapsed_mapping.keys())]
+
+        # where the mapped memory is in the kernel, looked up in one go
+        kernel_virts = iter(self.ramdump.phys_annotations(
+            [m.phys_start for m in mappings if m.mapped]))
 
-        for virt in sorted(collapsed_mapping.keys()):
-            mapping = collapsed_mapping[virt]
+        for mapping in mappings:
             if mapping.mapped:
+                kernel_virt = next(kernel_virts)
+                if kernel_virt:
+                    kernel_virt = ' K:' + kernel_virt
                 self.out_file.write(
-                    '0x%08x--0x%08x [0x%08x] A:0x%08x--0x%08x [0x%08x] %s[%s]\n' % (mapping.virt_start, mapping.virt_end, mapping.virt_size(),
-                                                                                    mapping.phys_start, mapping.phys_end,
-                                                                                    mapping.phys_size(), mapping.mapping_type, MAP_SIZE_STR[get_order(mapping.mapping_size)]))
+                    '0x%08x--0x%08x [0x%08x] A:0x%08x--0x%08x [0x%08x] %s[%s]%s\n' % (mapping.virt_start, mapping.virt_end, mapping.virt_size(),
+                                                                                      mapping.phys_start, mapping.phys_end,
+                                                                                      mapping.phys_size(), mapping.mapping_type, MAP_SIZE_STR[get_order(mapping.mapping_size)],
+                                                                                      kernel_virt))
             else:
                 self.out_file.write('0x%08x--0x%08x [0x%08x] [UNMAPPED]\n' %
                                     (mapping.virt_start, mapping.virt_end, mapping.virt_size()))
@@ -464,7 +472,7 @@ class IOMMU(RamParser):
             self.out_file.write('IOMMU Context: %s. Domain: %s (%d) [L2 cache redirect for page tables is %s]\n' % (
                 iommu_context, d.client_name, d.domain_num, redirect))
             self.out_file.write(
-                '[VA Start -- VA End  ] [Size      ] [PA Start   -- PA End  ] [Size      ] [Read/Write][Page Table Entry Size]\n')
+                '[VA Start -- VA End  ] [Size      ] [PA Start   -- PA End  ] [Size      ] [Read/Write][Page Table Entry Size] [K:Kernel virtual address]\n')
             if d.pg_table == 0:
                 self.out_file.write(
                     'No Page Table Found. (Probably a secure domain)\n')
@@ -19,27 +19,21 @@ class IrqParse(RamParser):
     def print_irq_state_3_0(self, ram_dump):
         print_out_str(
             '=========================== IRQ STATE ===============================')
-        per_cpu_offset_addr = ram_dump.addr_lookup('__per_cpu_offset')
-        cpu_present_bits_addr = ram_dump.addr_lookup('cpu_present_bits')
-        cpu_present_bits = ram_dump.read_word(cpu_present_bits_addr)
-        cpus = bin(cpu_present_bits).count('1')
+        cpus = ram_dump.percpu.present_cpus()
         irq_desc = ram_dump.addr_lookup('irq_desc')
         foo, irq_desc_size = ram_dump.unwind_lookup(irq_desc, 1)
-        h_irq_offset = ram_dump.field_offset('struct irq_desc', 'handle_irq')
-        irq_num_offset = ram_dump.field_offset('struct irq_data', 'irq')
-        irq_data_offset = ram_dump.field_offset('struct irq_desc', 'irq_data')
-        irq_count_offset = ram_dump.field_offset(
-            'struct irq_desc', 'irq_count')
-        irq_chip_offset = ram_dump.field_offset('struct irq_data', 'chip')
-        irq_action_offset = ram_dump.field_offset('struct irq_desc', 'action')
+        (h_irq_offset, irq_data_offset, irq_count_offset, irq_action_offset,
+         kstat_irqs_offset) = ram_dump.field_offsets(
+            'struct irq_desc',
+            ('handle_irq', 'irq_data', 'irq_count', 'action', 'kstat_irqs'))
+        irq_num_offset, irq_chip_offset = ram_dump.field_offsets(
+            'struct irq_data', ('irq', 'chip'))
         action_name_offset = ram_dump.field_offset('struct irqaction', 'name')
-        kstat_irqs_offset = ram_dump.field_offset(
-            'struct irq_desc', 'kstat_irqs')
         chip_name_offset = ram_dump.field_offset('struct irq_chip', 'name')
         irq_desc_entry_size = ram_dump.sizeof('irq_desc[0]')
         cpu_str = ''
 
-        for i in range(0, cpus):
+        for i in cpus:
             cpu_str = cpu_str + '{0:10} '.format('CPU{0}'.format(i))
 
         print_out_str(
@@ -52,12 +46,8 @@ class IrqParse(RamParser):
                 irq_desc + i + kstat_irqs_offset)
             irq_stats_str = ''
 
-            for j in range(0, cpus):
-                if per_cpu_offset_addr is None:
-                    offset = 0
-                else:
-                    offset = ram_dump.read_word(per_cpu_offset_addr + 4 * j)
-                irq_statsn = ram_dump.read_word(kstat_irqs_addr + offset)
+            for irq_statsn in ram_dump.percpu.read_percpu(
+                    kstat_irqs_addr, '<I', cpus):
                 irq_stats_str = irq_stats_str + \
                     '{0:10} '.format('{0}'.format(irq_statsn))
 
@@ -74,9 +64,8 @@ class IrqParse(RamParser):
 
     def radix_tree_lookup_element(self, ram_dump, root_addr, index):
         rnode_offset = ram_dump.field_offset('struct radix_tree_root', 'rnode')
-        rnode_height_offset = ram_dump.field_offset(
-            'struct radix_tree_node', 'height')
-        slots_offset = ram_dump.field_offset('struct radix_tree_node', 'slots')
+        rnode_height_offset, slots_offset = ram_dump.field_offsets(
+            'struct radix_tree_node', ('height', 'slots'))
 
         # if CONFIG_BASE_SMALL=0: radix_tree_map_shift = 6
         radix_tree_map_shift = 6
@@ -105,23 +94,21 @@ class IrqParse(RamParser):
         return (node_addr & 0xfffffffe)
 
     def print_irq_state_sparse_irq(self, ram_dump):
-        h_irq_offset = ram_dump.field_offset('struct irq_desc', 'handle_irq')
-        irq_num_offset = ram_dump.field_offset('struct irq_data', 'irq')
-        irq_data_offset = ram_dump.field_offset('struct irq_desc', 'irq_data')
-        irq_count_offset = ram_dump.field_offset(
-            'struct irq_desc', 'irq_count')
-        irq_chip_offset = ram_dump.field_offset('struct irq_data', 'chip')
-        irq_action_offset = ram_dump.field_offset('struct irq_desc', 'action')
+        (h_irq_offset, irq_data_offset, irq_count_offset, irq_action_offset,
+         kstat_irqs_offset) = ram_dump.field_offsets(
+            'struct irq_desc',
+            ('handle_irq', 'irq_data', 'irq_count', 'action', 'kstat_irqs'))
+        irq_num_offset, irq_chip_offset = ram_dump.field_offsets(
+            'struct irq_data', ('irq', 'chip'))
         action_name_offset = ram_dump.field_offset('struct irqaction', 'name')
-        kstat_irqs_offset = ram_dump.field_offset(
-            'struct irq_desc', 'kstat_irqs')
         chip_name_offset = ram_dump.field_offset('struct irq_chip', 'name')
         cpu_str = ''
 
         irq_desc_tree = ram_dump.addr_lookup('irq_desc_tree')
         nr_irqs = ram_dump.read_word(ram_dump.addr_lookup('nr_irqs'))
 
-        for i in ram_dump.iter_cpus():
+        cpus = ram_dump.percpu.present_cpus()
+        for i in cpus:
             cpu_str = cpu_str + '{0:10} '.format('CPU{0}'.format(i))
 
         print_out_str(
@@ -137,8 +124,8 @@ class IrqParse(RamParser):
             kstat_irqs_addr = ram_dump.read_word(irq_desc + kstat_irqs_offset)
             irq_stats_str = ''
 
-            for j in ram_dump.iter_cpus():
-                irq_statsn = ram_dump.read_word(kstat_irqs_addr, cpu=j)
+            for irq_statsn in ram_dump.percpu.read_percpu(
+                    kstat_irqs_addr, '<I', cpus):
                 irq_stats_str = irq_stats_str + \
                     '{0:10} '.format('{0}'.format(irq_statsn))
 
@@ -56,26 +56,24 @@ class PageTracking(RamParser):
 
             out_tracking.write('PFN 0x{0:x} page 0x{1:x}\n'.format(pfn, page))
 
-            alloc_str = ''
-            for i in range(0, nr_trace_entries):
-                addr = self.ramdump.read_word(
-                    page + trace_entries_offset + i * 4)
-
+            trace = []
+            addrs = self.ramdump.read_words(
+                page + trace_entries_offset, nr_trace_entries)
+            if addrs is None:
+                addrs = []
+            looks = self.ramdump.unwind_lookup_many(addrs)
+            for addr, look in zip(addrs, looks):
                 if addr == 0:
                     break
-                look = self.ramdump.unwind_lookup(addr)
                 if look is None:
                     break
                 symname, offset = look
-                unwind_dat = '      [<{0:x}>] {1}+0x{2:x}\n'.format(addr,
-                                                                    symname, offset)
-                out_tracking.write(unwind_dat)
-                alloc_str = alloc_str + unwind_dat
+                trace.append('      [<{0:x}>] {1}+0x{2:x}\n'.format(
+                    addr, symname, offset))
+            out_tracking.writelines(trace)
 
-            if alloc_str in sorted_pages:
-                sorted_pages[alloc_str] = sorted_pages[alloc_str] + 1
-            else:
-                sorted_pages[alloc_str] = 1
+            trace = tuple(trace)
+            sorted_pages[trace] = sorted_pages.get(trace, 0) + 1
 
             out_tracking.write('\n')
 
@@ -83,8 +81,8 @@ class PageTracking(RamParser):
                           key=lambda(k, v): (v), reverse=True)
 
         for k, v in sortlist:
-            out_frequency.write('Allocated {0} times\n'.format(v))
-            out_frequency.write(k)
+            out_frequency.record('Allocated {0} times\n', v)
+            out_frequency.writelines(k)
             out_frequency.write('\n')
 
         out_tracking.close()
@@ -11,88 +11,136 @@
 
 import struct
 
+import elf
 from print_out import print_out_str
-from collections import namedtuple
 from parser_util import register_parser, RamParser
 
-ELF32HEADERFORMAT = '<16sHHIIIIIHHHHHH'
-ELF32HEADERSIZE = struct.calcsize(ELF32HEADERFORMAT)
-PRG32HEADERFORMAT = 'IIIIIIII'
-PRG32HEADERSIZE = struct.calcsize(PRG32HEADERFORMAT)
 PF_W = 2
 
+# bytes of the segment compared at once
+CHUNK_SIZE = 1 << 16
+# once a chunk differs, blocks of this many bytes are compared to find
+# the first differing word
+BLOCK_SIZE = 256
+# number of words printed for each difference
+WINDOW_WORDS = 64
 
-@register_parser('--check-rodata', 'check rodata in dump against the static image')
-class ROData(RamParser):
-
-    def parse(self):
-        stext = self.ramdump.addr_lookup('stext')
-        etext = self.ramdump.addr_lookup('_etext')
 
-        with self.ramdump.open_file('roareadiff.txt') as roarea_out:
+def first_difference(a, b, start, word_size):
+    """Returns the offset of the first word at or after `start' that
+    differs between the byte strings `a' and `b' (of the same length),
+    or None if they are the same from there on."""
+    end = len(a)
+    pos = start
+    while pos < end:
+        n = min(BLOCK_SIZE, end - pos)
+        if a[pos:pos + n] != b[pos:pos + n]:
+            for off in xrange(pos, pos + n, word_size):
+                if a[off:off + word_size] != b[off:off + word_size]:
+                    return off
+        pos += n
+    return None
 
-            fd = open(self.ramdump.vmlinux, 'rb')
-            if not fd:
-                print_out_str('Could not open {0}.'.format(file_path))
-                return
 
-            ElfHeader = namedtuple(
-                'ElfHeader', 'ident type machine version entry phoff shoff flags ehsize phentsize phnum shentsize shnum shstrndx')
-            raw_elfheader = fd.read(ELF32HEADERSIZE)
-            elfheader = ElfHeader._make(
-                struct.unpack(ELF32HEADERFORMAT, raw_elfheader))
-
-            PrgHeader = namedtuple(
-                'Prgheader', 'type offset vaddr paddr filesz memsz flags align')
-            for i in range(elfheader.phnum):
-                fd.seek(elfheader.phoff + i * PRG32HEADERSIZE)
-                raw_prgheader = fd.read(PRG32HEADERSIZE)
-                prgheader = PrgHeader._make(
-                    struct.unpack(PRG32HEADERFORMAT, raw_prgheader))
+@register_parser('--check-rodata', 'check rodata in dump against the static image')
+class ROData(RamParser):
 
-                if not prgheader.flags & PF_W:
-                    count = prgheader.vaddr
-                    detect = 0
-                    while count < prgheader.vaddr + prgheader.memsz:
-                        fd.seek(prgheader.offset + (count - prgheader.vaddr))
-                        ram_value = self.ramdump.read_word(count)
-                        vm_value = struct.unpack('I', fd.read(4))[0]
+    def parse(self):
+        try:
+            vmlinux = elf.ElfFile(self.ramdump.vmlinux)
+        except (elf.ElfException, EnvironmentError) as e:
+            print_out_str('Could not open {0}: {1}'.format(
+                self.ramdump.vmlinux, e))
+            return
 
-                        if detect == 0 and vm_value != ram_value:
-                            print_out_str(
-                                'Differences found! Differences written to roareadiff.txt')
-                            ddr_str = 'detect RO area differences between vmlinux and DDR at 0x{0:0>8x}\n'.format(
-                                count)
-                            ddr_str += 'from DDR:\n'
-                            ddr_str += '{0:0>8x}  *{1:0>8x}'.format(count,
-                                                                    ram_value)
-                            vmlinux_str = 'from vmlinux:\n'
-                            vmlinux_str += '{0:0>8x}  *{1:0>8x}'.format(count,
-                                                                        vm_value)
-                            detect += 1
-                        elif 0 < detect and detect < 64:
-                            if detect % 8 == 0:
-                                ddr_str += '\n{0:0>8x} '.format(count)
-                                vmlinux_str += '\n{0:0>8x} '.format(count)
-                            ddr_str += ' '
-                            vmlinux_str += ' '
-                            if vm_value != ram_value:
-                                ddr_str += '*'
-                                vmlinux_str += '*'
-                            else:
-                                ddr_str += ' '
-                                vmlinux_str += ' '
-                            ddr_str += '{0:0>8x}'.format(ram_value)
-                            vmlinux_str += '{0:0>8x}'.format(vm_value)
-                            detect += 1
-                        elif detect == 64:
-                            ddr_str += '\n\n'
-                            vmlinux_str += '\n\n'
-                            roarea_out.write(ddr_str)
-                            roarea_out.write(vmlinux_str)
-                            detect = 0
-                            continue
+        with vmlinux, self.ramdump.open_file('roareadiff.txt') as roarea_out:
+            if vmlinux.elfclass == elf.ELFCLASS64:
+                self.word_size = 8
+                self.word_format = vmlinux.endian + 'Q'
+                self.hex_format = '{0:0>16x}'
+            else:
+                self.word_size = 4
+                self.word_format = vmlinux.endian + 'I'
+                self.hex_format = '{0:0>8x}'
+            self.out = roarea_out
+            for segment in vmlinux.load_segments():
+                if segment.flags & PF_W:
+                    continue
+                self.compare_segment(segment, vmlinux.read_segment(segment))
 
-                        count += 4
+    def compare_segment(self, segment, image):
+        """Compares the dump against the file contents of `segment' one
+        CHUNK_SIZE piece at a time. Only the pieces that differ are
+        looked at word by word."""
+        length = min(segment.memsz, len(image))
+        length -= length % self.word_size
+        # number of words still owed to the window that was started in
+        # the previous chunk
+        pending = 0
+        for start in xrange(0, length, CHUNK_SIZE):
+            n = min(CHUNK_SIZE, length - start)
+            # let a window that runs past this chunk finish in it
+            n_read = min(n + WINDOW_WORDS * self.word_size, length - start)
+            vaddr = segment.vaddr + start
+            ram = self.ramdump.read_bytes(vaddr, n_read)
+            if ram is None and n_read > n:
+                ram = self.ramdump.read_bytes(vaddr, n)
+            if ram is None:
+                self.out.write(
+                    'could not read 0x{0:x}--0x{1:x} from the dump\n\n'.format(
+                        vaddr, vaddr + n))
+                pending = 0
+                continue
+            vm = image[start:start + len(ram)]
+            pos = pending * self.word_size
+            pending = 0
+            if ram[pos:n] == vm[pos:n]:
+                continue
+            ram_chunk = ram[:n]
+            vm_chunk = vm[:n]
+            while True:
+                pos = first_difference(ram_chunk, vm_chunk, pos,
+                                       self.word_size)
+                if pos is None:
+                    break
+                self.write_window(vaddr, ram, vm, pos)
+                pos += WINDOW_WORDS * self.word_size
+                if pos >= n:
+                    pending = (pos - n) // self.word_size
+                    break
 
-            fd.close()
+    def write_window(self, vaddr, ram, vm, pos):
+        """Writes WINDOW_WORDS words from the dump and vmlinux starting at
+        the differing word at offset `pos', marking the words that
+        differ with a '*'."""
+        print_out_str(
+            'Differences found! Differences written to roareadiff.txt')
+        word_size = self.word_size
+        hex_format = self.hex_format
+        end = min(pos + WINDOW_WORDS * word_size, len(ram))
+        fmt = struct.Struct(self.word_format)
+        addr = vaddr + pos
+        ddr = ['detect RO area differences between vmlinux and DDR at 0x{0}\n'.format(
+               hex_format.format(addr)),
+               'from DDR:\n']
+        vmlinux = ['from vmlinux:\n']
+        for i, off in enumerate(xrange(pos, end, word_size)):
+            ram_value = fmt.unpack_from(ram, off)[0]
+            vm_value = fmt.unpack_from(vm, off)[0]
+            addr = vaddr + off
+            if i == 0:
+                ddr.append('{0}  *{1}'.format(hex_format.format(addr),
+                                              hex_format.format(ram_value)))
+                vmlinux.append('{0}  *{1}'.format(hex_format.format(addr),
+                                                  hex_format.format(vm_value)))
+                continue
+            if i % 8 == 0:
+                ddr.append('\n{0} '.format(hex_format.format(addr)))
+                vmlinux.append('\n{0} '.format(hex_format.format(addr)))
+            mark = '*' if vm_value != ram_value else ' '
+            ddr.append(' ' + mark + hex_format.format(ram_value))
+            vmlinux.append(' ' + mark + hex_format.format(vm_value))
+        ddr.append('\n\n')
+        vmlinux.append('\n\n')
+        self.out.writelines(ddr)
+        self.out.writelines(vmlinux)
@@ -100,23 +100,20 @@ class RTB(RamParser):
             return
         self.name_lookup_table = self.ramdump.gdbmi.get_enum_lookup_table(
             'logk_event_type', 32)
-        step_size_offset = self.ramdump.field_offset(
-            'struct msm_rtb_state', 'step_size')
-        nentries_offset = self.ramdump.field_offset(
-            'struct msm_rtb_state', 'nentries')
-        rtb_entry_offset = self.ramdump.field_offset(
-            'struct msm_rtb_state', 'rtb')
-        idx_offset = self.ramdump.field_offset('struct msm_rtb_layout', 'idx')
-        caller_offset = self.ramdump.field_offset(
-            'struct msm_rtb_layout', 'caller')
-        log_type_offset = self.ramdump.field_offset(
-            'struct msm_rtb_layout', 'log_type')
-        data_offset = self.ramdump.field_offset(
-            'struct msm_rtb_layout', 'data')
+        step_size_offset, nentries_offset, rtb_entry_offset = \
+            self.ramdump.field_offsets(
+                'struct msm_rtb_state', ('step_size', 'nentries', 'rtb'))
+        idx_offset, caller_offset, log_type_offset, data_offset = \
+            self.ramdump.field_offsets(
+                'struct msm_rtb_layout',
+                ('idx', 'caller', 'log_type', 'data'))
         rtb_entry_size = self.ramdump.sizeof('struct msm_rtb_layout')
         step_size = self.ramdump.read_word(rtb + step_size_offset)
         total_entries = self.ramdump.read_word(rtb + nentries_offset)
         rtb_read_ptr = self.ramdump.read_word(rtb + rtb_entry_offset)
+        if step_size != 1:
+            cpu_idx = self.ramdump.percpu.read_percpu(
+                'msm_rtb_idx_cpu', '<I', range(step_size))
         for i in range(0, step_size):
             rtb_out = self.ramdump.open_file('msm_rtb{0}.txt'.format(i))
             gdb_cmd = NamedTemporaryFile(mode='w+t', delete=False)
@@ -126,8 +123,7 @@ class RTB(RamParser):
                 last = self.ramdump.read_word(
                     self.ramdump.addr_lookup('msm_rtb_idx'))
             else:
-                last = self.ramdump.read_word(self.ramdump.addr_lookup(
-                    'msm_rtb_idx_cpu') + self.ramdump.read_word(self.ramdump.addr_lookup('__per_cpu_offset') + 4 * i))
+                last = cpu_idx[i]
             last = last & mask
             last_ptr = 0
             next_ptr = 0
@@ -144,33 +140,25 @@ class RTB(RamParser):
                 if next_entry != last:
                     break
             stop = 0
-            rtb_logtype_offset = self.ramdump.field_offset(
-                'struct msm_rtb_layout', 'log_type')
-            rtb_idx_offset = self.ramdump.field_offset(
-                'struct msm_rtb_layout', 'idx')
-            rtb_data_offset = self.ramdump.field_offset(
-                'struct msm_rtb_layout', 'data')
-            rtb_caller_offset = self.ramdump.field_offset(
-                'struct msm_rtb_layout', 'caller')
             while True:
                 ptr = rtb_read_ptr + next_entry * rtb_entry_size
-                stamp = self.ramdump.read_word(ptr + rtb_idx_offset)
+                stamp = self.ramdump.read_word(ptr + idx_offset)
                 rtb_out.write('{0:x} '.format(stamp).encode('ascii', 'ignore'))
-                item = self.ramdump.read_byte(ptr + rtb_logtype_offset)
+                item = self.ramdump.read_byte(ptr + log_type_offset)
                 item = item & 0x7F
                 name_str = '(unknown)'
                 if item >= len(self.name_lookup_table) or item < 0:
                     self.print_none(rtb_out, ptr, name_str,
-                                    rtb_data_offset, rtb_caller_offset)
+                                    data_offset, caller_offset)
                 else:
                     name_str = self.name_lookup_table[item]
                     if name_str not in print_table:
                         self.print_none(rtb_out, ptr, name_str,
-                                        rtb_data_offset, rtb_caller_offset)
+                                        data_offset, caller_offset)
                     else:
                         func = print_table[name_str]
                         getattr(RTB, func)(self, rtb_out, ptr, name_str,
-                                           rtb_data_offset, rtb_caller_offset)
+                                           data_offset, caller_offset)
                 if next_entry == last:
                     stop = 1
                 next_entry = (next_entry + step_size) & mask
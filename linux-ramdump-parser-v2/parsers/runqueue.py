@@ -12,6 +12,16 @@
 import rb_tree
 from print_out import print_out_str
 from parser_util import register_parser, RamParser
+from tasks import read_task
+
+RQ_FIELDS = (
+    ('nr_running', 'I'),
+    ('curr', 'I'),
+    ('idle', 'I'),
+    ('stop', 'I'),
+    ('cfs_nr_running', 'I', 'cfs.nr_running'),
+    ('rt_nr_running', 'I', 'rt.rt_nr_running'),
+)
 
 
 @register_parser('--print-runqueues', 'Print the runqueue status')
@@ -38,14 +48,12 @@ class RunQueues(RamParser):
         print_out_str(string)
 
     def print_task_state(self, status, task_addr):
-        pid_offset = self.ramdump.field_offset('struct task_struct', 'pid')
-        comm_offset = self.ramdump.field_offset('struct task_struct', 'comm')
-
+        task = None
         if 0 < task_addr:
-            pid = self.ramdump.read_word(task_addr + pid_offset)
-            taskname = self.ramdump.read_cstring(task_addr + comm_offset, 16)
+            task = read_task(self.ramdump, task_addr)
+        if task is not None:
             self.print_out_str_with_tab(
-                '{0}: {1}({2})'.format(status, taskname, pid))
+                '{0}: {1}({2})'.format(status, task.comm, task.pid))
         else:
             self.print_out_str_with_tab('{0}: None(0)'.format(status))
 
@@ -78,12 +86,9 @@ class RunQueues(RamParser):
         self.print_cgroup_state('pend', task_se)
 
     def print_cfs_state(self, cfs_rq_addr):
-        tasks_timeline_offset = self.ramdump.field_offset(
-            'struct cfs_rq', 'tasks_timeline')
-        curr_offset = self.ramdump.field_offset('struct cfs_rq', 'curr')
-        next_offset = self.ramdump.field_offset('struct cfs_rq', 'next')
-        last_offset = self.ramdump.field_offset('struct cfs_rq', 'last')
-        skip_offset = self.ramdump.field_offset('struct cfs_rq', 'skip')
+        (tasks_timeline_offset, curr_offset, next_offset, last_offset,
+         skip_offset) = self.ramdump.field_offsets(
+            'struct cfs_rq', ('tasks_timeline', 'curr', 'next', 'last', 'skip'))
 
         tasks_timeline_addr = self.ramdump.read_word(
             cfs_rq_addr + tasks_timeline_offset)
@@ -154,8 +159,11 @@ class RunQueues(RamParser):
         stack_addr = self.ramdump.read_word(task_addr + stack_offset)
         print_out_str('current callstack is maybe:')
 
-        for i in range(stack_addr, stack_addr + 0x2000, 4):
-            callstack_addr = self.ramdump.read_word(i)
+        stack = self.ramdump.read_words(stack_addr, 0x2000 / 4)
+        if stack is None:
+            return
+        for n, callstack_addr in enumerate(stack):
+            i = stack_addr + n * 4
             if text_start_addr <= callstack_addr and callstack_addr < text_end_addr:
                 wname = self.ramdump.unwind_lookup(callstack_addr)
                 if wname is not None:
@@ -165,39 +173,28 @@ class RunQueues(RamParser):
         print_out_str(
             '======================= RUNQUEUE STATE ============================')
         runqueues_addr = self.ramdump.addr_lookup('runqueues')
-        nr_running_offset = self.ramdump.field_offset(
-            'struct rq', 'nr_running')
-        curr_offset = self.ramdump.field_offset('struct rq', 'curr')
-        idle_offset = self.ramdump.field_offset('struct rq', 'idle')
-        stop_offset = self.ramdump.field_offset('struct rq', 'stop')
-        cfs_rq_offset = self.ramdump.field_offset('struct rq', 'cfs')
-        rt_rq_offset = self.ramdump.field_offset('struct rq', 'rt')
-        cfs_nr_running_offset = self.ramdump.field_offset(
-            'struct cfs_rq', 'nr_running')
-        rt_nr_running_offset = self.ramdump.field_offset(
-            'struct rt_rq', 'rt_nr_running')
-
-        for i in self.ramdump.iter_cpus():
-            rq_addr = runqueues_addr + self.ramdump.per_cpu_offset(i)
-            nr_running = self.ramdump.read_word(rq_addr + nr_running_offset)
+        cfs_rq_offset, rt_rq_offset = self.ramdump.field_offsets(
+            'struct rq', ('cfs', 'rt'))
+
+        for i, rq_addr in self.ramdump.percpu.percpu_addrs(runqueues_addr):
+            rq = self.ramdump.view('struct rq', rq_addr, RQ_FIELDS)
+            if rq is None:
+                print_out_str('CPU{0} runqueue could not be read'.format(i))
+                continue
             print_out_str(
-                'CPU{0} {1} process is running'.format(i, nr_running))
-            curr_addr = self.ramdump.read_word(rq_addr + curr_offset)
+                'CPU{0} {1} process is running'.format(i, rq.nr_running))
+            curr_addr = rq.curr
             self.print_task_state('curr', curr_addr)
-            idle_addr = self.ramdump.read_word(rq_addr + idle_offset)
-            self.print_task_state('idle', idle_addr)
-            stop_addr = self.ramdump.read_word(rq_addr + stop_offset)
-            self.print_task_state('stop', stop_addr)
+            self.print_task_state('idle', rq.idle)
+            self.print_task_state('stop', rq.stop)
 
             cfs_rq_addr = rq_addr + cfs_rq_offset
-            cfs_nr_running = self.ramdump.read_word(
-                cfs_rq_addr + cfs_nr_running_offset)
-            print_out_str('CFS {0} process is pending'.format(cfs_nr_running))
+            print_out_str(
+                'CFS {0} process is pending'.format(rq.cfs_nr_running))
             self.print_cfs_state(cfs_rq_addr)
 
             rt_rq_addr = rq_addr + rt_rq_offset
-            rt_nr_running = self.ramdump.read_word(
-                rt_rq_addr + rt_nr_running_offset)
+            rt_nr_running = rq.rt_nr_running
             print_out_str('RT {0} process is pending'.format(rt_nr_running))
             self.print_rt_state(rt_rq_addr)
 
@@ -16,23 +16,30 @@ from print_out import print_out_str
 from parser_util import register_parser, RamParser
 
 
+# the fields of struct kmem_cache used below. `slab' arguments are views
+# of these.
+KMEM_CACHE_FIELDS = (
+    ('list_next', 'I', 'list.next'),
+    ('name', 'I'),
+    # actually an array but no numa
+    ('node', 'I'),
+    ('cpu_slab', 'I'),
+    ('offset', 'I'),
+    ('size', 'I'),
+    ('inuse', 'I'),
+    ('max', 'I'),
+)
+
+
 @register_parser('--slabinfo', 'print information about slabs', optional=True)
 class Slabinfo(RamParser):
 
     def get_free_pointer(self, ramdump, s, obj):
         # just like validate_slab_slab!
-        slab_offset_offset = self.ramdump.field_offset(
-            'struct kmem_cache', 'offset')
-        slab_offset = self.ramdump.read_word(s + slab_offset_offset)
-        return self.ramdump.read_word(obj + slab_offset)
+        return self.ramdump.read_word(obj + s.offset)
 
     def slab_index(self, ramdump, p, addr, slab):
-        slab_size_offset = self.ramdump.field_offset(
-            'struct kmem_cache', 'size')
-        slab_size = self.ramdump.read_word(slab + slab_size_offset)
-        if slab_size is None:
-            return -1
-        return (p - addr) / slab_size
+        return (p - addr) / slab.size
 
     def get_map(self, ramdump, slab, page, bitarray):
         freelist_offset = self.ramdump.field_offset('struct page', 'freelist')
@@ -52,16 +59,10 @@ class Slabinfo(RamParser):
 
     def get_track(self, ramdump, slab, obj, track_type):
         track_size = self.ramdump.sizeof('struct track')
-        slab_offset_offset = self.ramdump.field_offset(
-            'struct kmem_cache', 'offset')
-        slab_inuse_offset = self.ramdump.field_offset(
-            'struct kmem_cache', 'inuse')
-        slab_offset = self.ramdump.read_word(slab + slab_offset_offset)
-        slab_inuse = self.ramdump.read_word(slab + slab_inuse_offset)
-        if slab_offset != 0:
-            p = obj + slab_offset + 4
+        if slab.offset != 0:
+            p = obj + slab.offset + 4
         else:
-            p = obj + slab_inuse
+            p = obj + slab.inuse
         return p + track_type * track_size
 
     def print_track(self, ramdump, slab, obj, track_type, out_file):
@@ -108,16 +109,10 @@ class Slabinfo(RamParser):
         n_objects = self.get_nobjects(self.ramdump, page)
         if n_objects is None:
             return
-        slab_size_offset = self.ramdump.field_offset(
-            'struct kmem_cache', 'size')
-        slab_size = self.ramdump.read_word(slab + slab_size_offset)
-        if slab_size is None:
-            return
-        slab_max_offset = self.ramdump.field_offset('struct kmem_cache', 'max')
-        slab_max = self.ramdump.read_word(slab + slab_max_offset)
-        if slab_max is None:
+        slab_size = slab.size
+        if slab_size == 0:
             return
-        bitarray = [0] * slab_max
+        bitarray = [0] * slab.max
         addr = page_address(self.ramdump, page)
         self.get_map(self.ramdump, slab, page, bitarray)
         while p < slab_start + n_objects * slab_size:
@@ -143,8 +138,6 @@ class Slabinfo(RamParser):
             return
         slab_lru_offset = self.ramdump.field_offset('struct page', 'lru')
         page_flags_offset = self.ramdump.field_offset('struct page', 'flags')
-        slab_node_offset = self.ramdump.field_offset(
-            'struct kmem_cache', 'size')
         max_pfn_addr = self.ramdump.addr_lookup('max_pfn')
         max_pfn = self.ramdump.read_word(max_pfn_addr)
         max_page = pfn_to_page(ramdump, max_pfn)
@@ -177,48 +170,37 @@ class Slabinfo(RamParser):
     # in the system because the code to do that correctly is a big pain. This will
     # need to be changed if we ever do NUMA properly.
     def parse(self):
-        slab_out = self.ramdump.open_file('slabs.txt')
-        original_slab = self.ramdump.addr_lookup('slab_caches')
-        per_cpu_offset = self.ramdump.addr_lookup('__per_cpu_offset')
-        cpu_present_bits_addr = self.ramdump.addr_lookup('cpu_present_bits')
-        cpu_present_bits = self.ramdump.read_word(cpu_present_bits_addr)
-        cpus = bin(cpu_present_bits).count('1')
-        slab_list_offset = self.ramdump.field_offset(
-            'struct kmem_cache', 'list')
-        slab_name_offset = self.ramdump.field_offset(
-            'struct kmem_cache', 'name')
-        slab_node_offset = self.ramdump.field_offset(
-            'struct kmem_cache', 'node')
-        cpu_cache_page_offset = self.ramdump.field_offset(
-            'struct kmem_cache_cpu', 'page')
-        cpu_slab_offset = self.ramdump.field_offset(
-            'struct kmem_cache', 'cpu_slab')
-        slab_partial_offset = self.ramdump.field_offset(
-            'struct kmem_cache_node', 'partial')
-        slab_full_offset = self.ramdump.field_offset(
-            'struct kmem_cache_node', 'full')
-        slab = self.ramdump.read_word(original_slab)
-        while slab != original_slab:
-            slab = slab - slab_list_offset
-            slab_name_addr = self.ramdump.read_word(slab + slab_name_offset)
-            # actually an array but again, no numa
-            slab_node_addr = self.ramdump.read_word(slab + slab_node_offset)
-            slab_node = self.ramdump.read_word(slab_node_addr)
-            slab_name = self.ramdump.read_cstring(slab_name_addr, 48)
-            cpu_slab_addr = self.ramdump.read_word(slab + cpu_slab_offset)
-            print_out_str('Parsing slab {0}'.format(slab_name))
-            slab_out.write(
-                '{0:x} slab {1} {2:x}\n'.format(slab, slab_name, slab_node_addr))
-            self.print_slab_page_info(
-                self.ramdump, slab, slab_node, slab_node_addr + slab_partial_offset, slab_out)
-            self.print_slab_page_info(
-                self.ramdump, slab, slab_node, slab_node_addr + slab_full_offset, slab_out)
-
-            for i in range(0, cpus):
-                cpu_slabn_addr = cpu_slab_addr + \
-                    self.ramdump.read_word(per_cpu_offset + 4 * i)
-                self.print_per_cpu_slab_info(
-                    self.ramdump, slab, slab_node, cpu_slabn_addr + cpu_cache_page_offset, slab_out)
-
-            slab = self.ramdump.read_word(slab + slab_list_offset)
+        with self.ramdump.open_file('slabs.txt') as slab_out:
+            original_slab = self.ramdump.addr_lookup('slab_caches')
+            slab_list_offset = self.ramdump.field_offset(
+                'struct kmem_cache', 'list')
+            cpu_cache_page_offset = self.ramdump.field_offset(
+                'struct kmem_cache_cpu', 'page')
+            slab_partial_offset, slab_full_offset = self.ramdump.field_offsets(
+                'struct kmem_cache_node', ('partial', 'full'))
+            slab = self.ramdump.read_word(original_slab)
+            while slab != original_slab:
+                slab = self.ramdump.view('struct kmem_cache',
+                                         slab - slab_list_offset,
+                                         KMEM_CACHE_FIELDS)
+                if slab is None:
+                    break
+                slab_node_addr = slab.node
+                slab_node = self.ramdump.read_word(slab_node_addr)
+                slab_name = self.ramdump.read_cstring(slab.name, 48)
+                cpu_slab_addr = slab.cpu_slab
+                print_out_str('Parsing slab {0}'.format(slab_name))
+                slab_out.write(
+                    '{0:x} slab {1} {2:x}\n'.format(slab.address, slab_name, slab_node_addr))
+                self.print_slab_page_info(
+                    self.ramdump, slab, slab_node, slab_node_addr + slab_partial_offset, slab_out)
+                self.print_slab_page_info(
+                    self.ramdump, slab, slab_node, slab_node_addr + slab_full_offset, slab_out)
+
+                for i, cpu_slabn_addr in self.ramdump.percpu.percpu_addrs(
+                        cpu_slab_addr):
+                    self.print_per_cpu_slab_info(
+                        self.ramdump, slab, slab_node, cpu_slabn_addr + cpu_cache_page_offset, slab_out)
+
+                slab = slab.list_next
         print_out_str('---wrote slab information to slabs.txt')
@@ -12,6 +12,7 @@
 import string
 from print_out import print_out_str
 from parser_util import register_parser, RamParser
+from tasks import TASK_FIELDS, for_each_task, for_each_thread
 
 
 def cleanupString(str):
@@ -56,12 +57,36 @@ thread_info_fp_idx = 14
 thread_info_sp_idx = 15
 thread_info_pc_idx = 16
 
+# as shown in /proc/<pid>/status, indexed by the lowest bit set in
+# state | exit_state
+task_state_names = [
+    'S (sleeping)',
+    'D (disk sleep)',
+    'T (stopped)',
+    't (tracing stop)',
+    'Z (zombie)',
+    'X (dead)',
+]
+
+
+def task_state_name(state, exit_state):
+    state = (state | exit_state) & 0x3f
+    if state == 0:
+        return 'R (running)'
+    for bit, name in enumerate(task_state_names):
+        if state & (1 << bit):
+            return name
+
 
 def find_panic(ramdump, addr_stack, thread_task_name):
-    for i in range(addr_stack, addr_stack + 0x2000, 4):
-        pc = ramdump.read_word(i)
-        lr = ramdump.read_word(i + 4)
-        spx = ramdump.read_word(i + 8)
+    # read the whole stack (plus the two words peeked past the end) at once
+    stack = ramdump.read_words(addr_stack, 0x2000 / 4 + 2)
+    if stack is None:
+        return False
+    for n in range(0, 0x2000 / 4):
+        i = addr_stack + n * 4
+        pc = stack[n]
+        lr = stack[n + 1]
         l = ramdump.unwind_lookup(pc)
         if l is not None:
             s, offset = l
@@ -77,120 +102,134 @@ def find_panic(ramdump, addr_stack, thread_task_name):
     return False
 
 
-def dump_thread_group(ramdump, thread_group, task_out, check_for_panic=0):
-    offset_thread_group = ramdump.field_offset(
-        'struct task_struct', 'thread_group')
-    offset_comm = ramdump.field_offset('struct task_struct', 'comm')
-    offset_pid = ramdump.field_offset('struct task_struct', 'pid')
-    offset_stack = ramdump.field_offset('struct task_struct', 'stack')
-    offset_state = ramdump.field_offset('struct task_struct', 'state')
-    offset_exit_state = ramdump.field_offset(
-        'struct task_struct', 'exit_state')
-    orig_thread_group = thread_group
+def dump_thread_group(ramdump, task, entries, check_for_panic=0,
+                      folded=None, on_cycle=None):
+    """Appends (text, registers) to `entries' for each thread in the
+    group of `task', where `registers' is the (sp, fp, pc, lr) to unwind
+    the thread's stack from, or None if there's no stack to print after
+    `text'. If `folded' is given, the threads are added to that
+    FoldedStacks instead."""
     first = 0
-    seen_threads = []
-    while True:
-        next_thread_start = thread_group - offset_thread_group
-        next_thread_comm = next_thread_start + offset_comm
-        next_thread_pid = next_thread_start + offset_pid
-        next_thread_stack = next_thread_start + offset_stack
-        next_thread_state = next_thread_start + offset_state
-        next_thread_exit_state = next_thread_start + offset_exit_state
-        thread_task_name = cleanupString(
-            ramdump.read_cstring(next_thread_comm, 16))
-        if thread_task_name is None:
-            return
-        thread_task_pid = ramdump.read_word(next_thread_pid)
-        if thread_task_pid is None:
-            return
-        task_state = ramdump.read_word(next_thread_state)
-        if task_state is None:
-            return
-        task_exit_state = ramdump.read_word(next_thread_exit_state)
-        if task_exit_state is None:
-            return
-        addr_stack = ramdump.read_word(next_thread_stack)
-        if addr_stack is None:
-            return
+    for thread in for_each_thread(ramdump, task, TASK_FIELDS, on_cycle):
+        thread_task_name = cleanupString(thread.comm)
+        thread_task_pid = thread.pid
+        task_state = thread.state
+        task_exit_state = thread.exit_state
+        addr_stack = thread.stack
         threadinfo = ramdump.read_string(addr_stack, thread_info_str)
         if threadinfo is None:
             return
-        if not check_for_panic:
+        if folded is not None:
+            folded.add(thread_task_name, task_state, task_exit_state,
+                       (threadinfo[thread_info_sp_idx],
+                        threadinfo[thread_info_fp_idx],
+                        threadinfo[thread_info_pc_idx], 0))
+        elif not check_for_panic:
+            text = []
             if not first:
-                task_out.write('Process: {0}, cpu: {1} pid: {2} start: 0x{3:x}\n'.format(
-                    thread_task_name, threadinfo[thread_info_cpu_idx], thread_task_pid, next_thread_start))
-                task_out.write(
+                text.append('Process: {0}, cpu: {1} pid: {2} start: 0x{3:x}\n'.format(
+                    thread_task_name, threadinfo[thread_info_cpu_idx], thread_task_pid, thread.address))
+                text.append(
                     '=====================================================\n')
                 first = 1
-            task_out.write('    Task name: {0} pid: {1} cpu: {2}\n    state: 0x{3:x} exit_state: 0x{4:x} stack base: 0x{5:x}\n'.format(
+            text.append('    Task name: {0} pid: {1} cpu: {2}\n    state: 0x{3:x} exit_state: 0x{4:x} stack base: 0x{5:x}\n'.format(
                 thread_task_name, thread_task_pid, threadinfo[thread_info_cpu_idx], task_state, task_exit_state, addr_stack))
-            task_out.write('    Stack:')
-            ramdump.unwind.unwind_backtrace(threadinfo[thread_info_sp_idx], threadinfo[
-                                            thread_info_fp_idx], threadinfo[thread_info_pc_idx], 0, '    ', task_out)
-            task_out.write(
-                '=======================================================\n')
+            text.append('    Stack:')
+            entries.append((''.join(text), (threadinfo[thread_info_sp_idx],
+                                            threadinfo[thread_info_fp_idx],
+                                            threadinfo[thread_info_pc_idx],
+                                            0)))
         else:
             find_panic(ramdump, addr_stack, thread_task_name)
 
-        next_thr = ramdump.read_word(thread_group)
-        if (next_thr == thread_group) and (next_thr != orig_thread_group):
-            if not check_for_panic:
-                task_out.write(
-                    '!!!! Cycle in thread group! The list is corrupt!\n')
-            break
-        if (next_thr in seen_threads):
-            break
-
-        seen_threads.append(next_thr)
-        thread_group = next_thr
-        if thread_group == orig_thread_group:
-            break
-
-
-def do_dump_stacks(ramdump, check_for_panic=0):
-    offset_tasks = ramdump.field_offset('struct task_struct', 'tasks')
-    offset_comm = ramdump.field_offset('struct task_struct', 'comm')
-    offset_stack = ramdump.field_offset('struct task_struct', 'stack')
-    offset_thread_group = ramdump.field_offset(
-        'struct task_struct', 'thread_group')
-    offset_pid = ramdump.field_offset('struct task_struct', 'pid')
-    offset_state = ramdump.field_offset('struct task_struct', 'state')
-    offset_exit_state = ramdump.field_offset(
-        'struct task_struct', 'exit_state')
-    init_addr = ramdump.addr_lookup('init_task')
-    init_next_task = init_addr + offset_tasks
-    orig_init_next_task = init_next_task
-    init_thread_group = init_addr + offset_thread_group
-    seen_tasks = []
-    if check_for_panic == 0:
-        task_out = ramdump.open_file('tasks.txt')
-    else:
-        task_out = None
-    while True:
-        dump_thread_group(ramdump, init_thread_group,
-                          task_out, check_for_panic)
-        next_task = ramdump.read_word(init_next_task)
-        if next_task is None:
-            return
 
-        if (next_task == init_next_task) and (next_task != orig_init_next_task):
-            if not check_for_panic:
+def do_dump_stacks(ramdump, check_for_panic=0, folded=None):
+    entries = []
+
+    def corrupt(message):
+        if not check_for_panic and folded is None:
+            entries.append((message + '\n', None))
+
+    for task in for_each_task(ramdump, TASK_FIELDS, corrupt):
+        dump_thread_group(ramdump, task, entries, check_for_panic, folded,
+                          corrupt)
+    if folded is not None:
+        folded.write()
+    elif check_for_panic == 0:
+        write_tasks(ramdump, entries)
+
+
+def write_tasks(ramdump, entries):
+    """Writes the entries collected by dump_thread_group to tasks.txt.
+    All of the stacks are unwound together so that threads sitting in
+    the same call chain are only symbolized and formatted once."""
+    unwind = ramdump.unwind
+    traces = unwind.backtraces(
+        [regs for text, regs in entries if regs is not None])
+    stacks = iter(unwind.format_backtraces(traces, '    '))
+    with ramdump.open_file('tasks.txt') as task_out:
+        for text, regs in entries:
+            task_out.write(text)
+            if regs is not None:
+                task_out.writelines(line + '\n' for line in next(stacks))
                 task_out.write(
-                    '!!!! Cycle in task list! The list is corrupt!\n')
-            break
+                    '=======================================================\n')
+    print_out_str('---wrote tasks to tasks.txt')
+
+
+class FoldedStacks(object):
+
+    """Counts the backtraces of all the threads in the collapsed stack
+    format taken by flame graph tools: one line per distinct stack with
+    its frames from the outermost caller in, separated by semicolons,
+    followed by the number of threads in it:
 
-        if (next_task in seen_tasks):
-            break
+        ret_from_fork;kthread;worker_thread;schedule;__schedule 37
 
-        seen_tasks.append(next_task)
+    `group_by' may be 'state' or 'comm' to add the task state or name
+    as the outermost frame.
 
-        init_next_task = next_task
-        init_thread_group = init_next_task - offset_tasks + offset_thread_group
-        if init_next_task == orig_init_next_task:
-            break
-    if check_for_panic == 0:
-        task_out.close()
-        print_out_str('---wrote tasks to tasks.txt')
+    Each thread is unwound as it's added and only the count of each
+    distinct stack is kept, so memory use is independent of the number
+    of threads. The stacks are symbolized and written out by `write'.
+
+    """
+
+    def __init__(self, ramdump, out_file, group_by=None):
+        self.ramdump = ramdump
+        self.out_file = out_file
+        self.group_by = group_by
+        self.counts = {}
+
+    def add(self, comm, state, exit_state, regs):
+        if self.group_by == 'state':
+            group = task_state_name(state, exit_state)
+        elif self.group_by == 'comm':
+            group = comm
+        else:
+            group = None
+        trace = tuple(self.ramdump.unwind.walk(*regs))
+        key = (group, trace)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def write(self):
+        pcs = sorted(set(pc for group, trace in self.counts
+                         for pc in trace))
+        names = {}
+        for pc, r in zip(pcs, self.ramdump.unwind_lookup_many(pcs)):
+            names[pc] = fold_frame(r[0] if r is not None else '[unknown]')
+        lines = []
+        for (group, trace), count in self.counts.iteritems():
+            frames = [names[pc] for pc in reversed(trace)]
+            if group is not None:
+                frames.insert(0, fold_frame(group))
+            lines.append('{0} {1}\n'.format(';'.join(frames), count))
+        lines.sort()
+        self.out_file.writelines(lines)
+
+
+def fold_frame(name):
+    return name.replace(';', ':').replace('\n', ' ') or '[unknown]'
 
 
 @register_parser('--print-tasks', 'Print all the task information', shortopt='-t')
@@ -215,3 +254,14 @@ class CheckForPanic(RamParser):
             do_dump_stacks(self.ramdump, 1)
         else:
             print_out_str('No kernel panic detected')
+
+
+@register_parser('--print-folded-stacks', 'Write the stacks of all tasks in the folded format used by flame graph tools', optional=True)
+class DumpFoldedStacks(RamParser):
+
+    def parse(self):
+        group_by = getattr(self.ramdump, 'folded_stacks_group', None)
+        with self.ramdump.open_file('tasks_folded.txt') as out_file:
+            do_dump_stacks(self.ramdump, 0,
+                           FoldedStacks(self.ramdump, out_file, group_by))
+        print_out_str('---wrote folded stacks to tasks_folded.txt')
@@ -29,15 +29,12 @@ class Vmalloc(RamParser):
 
         vmalloc_out = ram_dump.open_file('vmalloc.txt')
 
-        next_offset = ram_dump.field_offset('struct vm_struct', 'next')
-        addr_offset = ram_dump.field_offset('struct vm_struct', 'addr')
-        size_offset = ram_dump.field_offset('struct vm_struct', 'size')
-        flags_offset = ram_dump.field_offset('struct vm_struct', 'flags')
-        pages_offset = ram_dump.field_offset('struct vm_struct', 'pages')
-        nr_pages_offset = ram_dump.field_offset('struct vm_struct', 'nr_pages')
-        phys_addr_offset = ram_dump.field_offset(
-            'struct vm_struct', 'phys_addr')
-        caller_offset = ram_dump.field_offset('struct vm_struct', 'caller')
+        (next_offset, addr_offset, size_offset, flags_offset, pages_offset,
+         nr_pages_offset, phys_addr_offset, caller_offset) = \
+            ram_dump.field_offsets(
+                'struct vm_struct',
+                ('next', 'addr', 'size', 'flags', 'pages', 'nr_pages',
+                 'phys_addr', 'caller'))
 
         while (vmlist is not None) and (vmlist != 0):
             addr = ram_dump.read_word(vmlist + addr_offset)
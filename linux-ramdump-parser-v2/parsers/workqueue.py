@@ -12,44 +12,31 @@
 import re
 from print_out import print_out_str
 from parser_util import register_parser, RamParser
+from tasks import task_name
 
 
 @register_parser('--print-workqueues', 'Print the state of the workqueues', shortopt='-q')
 class Workqueues(RamParser):
 
     def print_workqueue_state_3_0(self, ram_dump):
-        per_cpu_offset_addr = ram_dump.addr_lookup('__per_cpu_offset')
         global_cwq_sym_addr = ram_dump.addr_lookup('global_cwq')
         system_wq_addr = ram_dump.addr_lookup('system_long_wq')
 
-        idle_list_offset = ram_dump.field_offset(
-            'struct global_cwq', 'idle_list')
-        worklist_offset = ram_dump.field_offset(
-            'struct global_cwq', 'worklist')
-        busy_hash_offset = ram_dump.field_offset(
-            'struct global_cwq', 'busy_hash')
-        scheduled_offset = ram_dump.field_offset('struct worker', 'scheduled')
-        worker_task_offset = ram_dump.field_offset('struct worker', 'task')
-        worker_entry_offset = ram_dump.field_offset('struct worker', 'entry')
-        offset_comm = ram_dump.field_offset('struct task_struct', 'comm')
-        work_entry_offset = ram_dump.field_offset(
-            'struct work_struct', 'entry')
-        work_hentry_offset = ram_dump.field_offset('struct worker', 'hentry')
-        work_func_offset = ram_dump.field_offset('struct work_struct', 'func')
-        current_work_offset = ram_dump.field_offset(
-            'struct worker', 'current_work')
+        idle_list_offset, worklist_offset, busy_hash_offset = \
+            ram_dump.field_offsets(
+                'struct global_cwq', ('idle_list', 'worklist', 'busy_hash'))
+        (scheduled_offset, worker_task_offset, worker_entry_offset,
+         work_hentry_offset, current_work_offset) = ram_dump.field_offsets(
+            'struct worker',
+            ('scheduled', 'task', 'entry', 'hentry', 'current_work'))
+        work_entry_offset, work_func_offset = ram_dump.field_offsets(
+            'struct work_struct', ('entry', 'func'))
         cpu_wq_offset = ram_dump.field_offset(
             'struct workqueue_struct', 'cpu_wq')
         unbound_gcwq_addr = ram_dump.addr_lookup('unbound_global_cwq')
 
-        if per_cpu_offset_addr is None:
-            per_cpu_offset0 = 0
-            per_cpu_offset1 = 0
-        else:
-            per_cpu_offset0 = ram_dump.read_word(per_cpu_offset_addr)
-            per_cpu_offset1 = ram_dump.read_word(per_cpu_offset_addr + 4)
-
-        global_cwq_cpu0_addr = global_cwq_sym_addr + per_cpu_offset0
+        global_cwq_cpu0_addr = global_cwq_sym_addr + \
+            ram_dump.per_cpu_offset(0)
 
         idle_list_addr0 = ram_dump.read_word(
             global_cwq_cpu0_addr + idle_list_offset)
@@ -86,8 +73,7 @@ class Workqueues(RamParser):
                         worker_addr + worker_task_offset)
                     if worker_task_addr is None or worker_task_addr == 0:
                         break
-                    taskname = ram_dump.read_cstring(
-                        worker_task_addr + offset_comm, 16)
+                    taskname = task_name(ram_dump, worker_task_addr)
                     scheduled_addr = ram_dump.read_word(
                         worker_addr + scheduled_offset)
                     current_work_addr = ram_dump.read_word(
@@ -123,8 +109,7 @@ class Workqueues(RamParser):
                 if worker_task_addr is None or worker_task_addr == 0:
                     break
 
-                taskname = ram_dump.read_cstring(
-                    (worker_task_addr + offset_comm), 16)
+                taskname = task_name(ram_dump, worker_task_addr)
                 scheduled_addr = ram_dump.read_word(
                     worker_addr + scheduled_offset)
                 current_work_addr = ram_dump.read_word(
@@ -187,24 +172,17 @@ class Workqueues(RamParser):
                     break
 
     def print_workqueue_state_3_7(self, ram_dump):
-        per_cpu_offset_addr = ram_dump.addr_lookup('__per_cpu_offset')
         global_cwq_sym_addr = ram_dump.addr_lookup('global_cwq')
 
-        pools_offset = ram_dump.field_offset('struct global_cwq', 'pools')
-        worklist_offset = ram_dump.field_offset(
-            'struct global_cwq', 'worklist')
-        busy_hash_offset = ram_dump.field_offset(
-            'struct global_cwq', 'busy_hash')
-        scheduled_offset = ram_dump.field_offset('struct worker', 'scheduled')
-        worker_task_offset = ram_dump.field_offset('struct worker', 'task')
-        worker_entry_offset = ram_dump.field_offset('struct worker', 'entry')
-        offset_comm = ram_dump.field_offset('struct task_struct', 'comm')
-        work_entry_offset = ram_dump.field_offset(
-            'struct work_struct', 'entry')
-        work_hentry_offset = ram_dump.field_offset('struct worker', 'hentry')
-        work_func_offset = ram_dump.field_offset('struct work_struct', 'func')
-        current_work_offset = ram_dump.field_offset(
-            'struct worker', 'current_work')
+        pools_offset, worklist_offset, busy_hash_offset = \
+            ram_dump.field_offsets(
+                'struct global_cwq', ('pools', 'worklist', 'busy_hash'))
+        (scheduled_offset, worker_task_offset, worker_entry_offset,
+         work_hentry_offset, current_work_offset) = ram_dump.field_offsets(
+            'struct worker',
+            ('scheduled', 'task', 'entry', 'hentry', 'current_work'))
+        work_entry_offset, work_func_offset = ram_dump.field_offsets(
+            'struct work_struct', ('entry', 'func'))
         cpu_wq_offset = ram_dump.field_offset(
             'struct workqueue_struct', 'cpu_wq')
         pool_idle_offset = ram_dump.field_offset(
@@ -213,21 +191,14 @@ class Workqueues(RamParser):
         pending_work_offset = ram_dump.field_offset(
             'struct worker_pool', 'worklist')
         unbound_gcwq_addr = ram_dump.addr_lookup('unbound_global_cwq')
-        cpu_present_bits_addr = ram_dump.addr_lookup('cpu_present_bits')
-        cpu_present_bits = ram_dump.read_word(cpu_present_bits_addr)
-        cpus = bin(cpu_present_bits).count('1')
 
         s = '<'
         for a in range(0, 64):
             s = s + 'I'
 
-        for i in range(0, cpus):
+        for i, workqueue_i in ram_dump.percpu.percpu_addrs(
+                global_cwq_sym_addr):
             busy_hash = []
-            if per_cpu_offset_addr is None:
-                offset = 0
-            else:
-                offset = ram_dump.read_word(per_cpu_offset_addr + 4 * i)
-            workqueue_i = global_cwq_sym_addr + offset
             busy_hashi = ram_dump.read_string(
                 workqueue_i + busy_hash_offset, s)
             for a in busy_hashi:
@@ -244,8 +215,7 @@ class Workqueues(RamParser):
                             worker_addr + worker_task_offset)
                         if worker_task_addr is None or worker_task_addr == 0:
                             break
-                        taskname = ram_dump.read_cstring(
-                            worker_task_addr + offset_comm, 16)
+                        taskname = task_name(ram_dump, worker_task_addr)
                         scheduled_addr = ram_dump.read_word(
                             worker_addr + scheduled_offset)
                         current_work_addr = ram_dump.read_word(
@@ -285,8 +255,7 @@ class Workqueues(RamParser):
 
                     seen.append(worker_task_addr)
 
-                    taskname = ram_dump.read_cstring(
-                        (worker_task_addr + offset_comm), 16)
+                    taskname = task_name(ram_dump, worker_task_addr)
                     scheduled_addr = ram_dump.read_word(
                         worker_addr + scheduled_offset)
                     current_work_addr = ram_dump.read_word(
@@ -342,42 +311,29 @@ class Workqueues(RamParser):
     def print_workqueue_state_3_10(self, ram_dump):
         print_out_str(
             '======================= WORKQUEUE STATE ============================')
-        per_cpu_offset_addr = ram_dump.addr_lookup('__per_cpu_offset')
         cpu_worker_pools_addr = ram_dump.addr_lookup('cpu_worker_pools')
 
         busy_hash_offset = ram_dump.field_offset(
             'struct worker_pool', 'busy_hash')
-        scheduled_offset = ram_dump.field_offset('struct worker', 'scheduled')
-        worker_task_offset = ram_dump.field_offset('struct worker', 'task')
-        worker_entry_offset = ram_dump.field_offset('struct worker', 'entry')
-        offset_comm = ram_dump.field_offset('struct task_struct', 'comm')
-        work_entry_offset = ram_dump.field_offset(
-            'struct work_struct', 'entry')
-        work_hentry_offset = ram_dump.field_offset('struct worker', 'hentry')
-        work_func_offset = ram_dump.field_offset('struct work_struct', 'func')
-        current_work_offset = ram_dump.field_offset(
-            'struct worker', 'current_work')
+        (scheduled_offset, worker_task_offset, worker_entry_offset,
+         work_hentry_offset, current_work_offset) = ram_dump.field_offsets(
+            'struct worker',
+            ('scheduled', 'task', 'entry', 'hentry', 'current_work'))
+        work_entry_offset, work_func_offset = ram_dump.field_offsets(
+            'struct work_struct', ('entry', 'func'))
         pool_idle_offset = ram_dump.field_offset(
             'struct worker_pool', 'idle_list')
         worker_pool_size = ram_dump.sizeof('struct worker_pool')
         pending_work_offset = ram_dump.field_offset(
             'struct worker_pool', 'worklist')
-        cpu_present_bits_addr = ram_dump.addr_lookup('cpu_present_bits')
-        cpu_present_bits = ram_dump.read_word(cpu_present_bits_addr)
-        cpus = bin(cpu_present_bits).count('1')
 
         s = '<'
         for a in range(0, 64):
             s = s + 'I'
 
-        for i in range(0, cpus):
+        for i, worker_pool in ram_dump.percpu.percpu_addrs(
+                cpu_worker_pools_addr):
             busy_hash = []
-            if per_cpu_offset_addr is None:
-                offset = 0
-            else:
-                offset = ram_dump.read_word(per_cpu_offset_addr + 4 * i)
-
-            worker_pool = cpu_worker_pools_addr + offset
             # Need better way to ge the number of pools...
             for k in range(0, 2):
                 worker_pool_i = worker_pool + k * worker_pool_size
@@ -397,8 +353,7 @@ class Workqueues(RamParser):
                                 worker_addr + worker_task_offset)
                             if worker_task_addr is None or worker_task_addr == 0:
                                 break
-                            taskname = ram_dump.read_cstring(
-                                worker_task_addr + offset_comm, 16)
+                            taskname = task_name(ram_dump, worker_task_addr)
                             scheduled_addr = ram_dump.read_word(
                                 worker_addr + scheduled_offset)
                             current_work_addr = ram_dump.read_word(
@@ -433,8 +388,7 @@ class Workqueues(RamParser):
 
                     seen.append(worker_task_addr)
 
-                    taskname = ram_dump.read_cstring(
-                        (worker_task_addr + offset_comm), 16)
+                    taskname = task_name(ram_dump, worker_task_addr)
                     scheduled_addr = ram_dump.read_word(
                         worker_addr + scheduled_offset)
                     current_work_addr = ram_dump.read_word(
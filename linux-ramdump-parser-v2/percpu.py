@@ -0,0 +1,142 @@
+# Copyright (c) 2014, The Linux Foundation. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 and
+# only version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Names of the cpumasks in the kernel, old and new style
+CPU_MASK_SYMBOLS = {
+    'possible': ('cpu_possible_bits', '__cpu_possible_mask'),
+    'present': ('cpu_present_bits', '__cpu_present_mask'),
+    'online': ('cpu_online_bits', '__cpu_online_mask'),
+    'active': ('cpu_active_bits', '__cpu_active_mask'),
+}
+
+
+class PerCpu(object):
+
+    """Access to per-CPU variables.
+
+    The __per_cpu_offset array and the cpumasks are read once, on first
+    use, instead of on every per-CPU access. A per-CPU variable at
+    `addr' lives at addr + offset(cpu) for each CPU:
+
+        for cpu, addr in dump.percpu.percpu_addrs('runqueues'):
+            ...
+        nr_running = dump.percpu.read_percpu(addr, '<I')
+
+    On kernels built without SMP there is no __per_cpu_offset and every
+    offset is 0.
+
+    """
+
+    def __init__(self, ramdump):
+        self.ramdump = ramdump
+        self._offsets = None
+        self._masks = {}
+
+    def offsets(self):
+        """Returns the list of per-CPU offsets indexed by CPU number, or an
+        empty list if there is no __per_cpu_offset."""
+        if self._offsets is None:
+            self._offsets = self._load_offsets()
+        return self._offsets
+
+    def _load_offsets(self):
+        ramdump = self.ramdump
+        addr = ramdump.addr_lookup('__per_cpu_offset')
+        if addr is None:
+            return []
+        size = ramdump.sizeof('__per_cpu_offset')
+        if size is None:
+            nr_cpus = ramdump.kconfig.integer('CONFIG_NR_CPUS', 1)
+        else:
+            nr_cpus = size // 4
+        offsets = ramdump.read_words(addr, nr_cpus)
+        if offsets is None:
+            return []
+        return list(offsets)
+
+    def offset(self, cpu):
+        """Returns the per-CPU offset of `cpu'."""
+        offsets = self.offsets()
+        if cpu < len(offsets):
+            return offsets[cpu]
+        return 0
+
+    def cpu_mask(self, name):
+        """Returns the sorted list of CPUs set in cpumask `name' (one of
+        'possible', 'present', 'online' or 'active'), or None if the mask
+        can't be found."""
+        if name not in self._masks:
+            self._masks[name] = self._load_mask(name)
+        return self._masks[name]
+
+    def _load_mask(self, name):
+        ramdump = self.ramdump
+        for sym in CPU_MASK_SYMBOLS[name]:
+            addr = ramdump.addr_lookup(sym)
+            if addr is not None:
+                break
+        else:
+            return None
+        size = ramdump.sizeof(sym)
+        words = ramdump.read_words(addr, max((size or 4) // 4, 1))
+        if words is None:
+            return None
+        cpus = []
+        for i, word in enumerate(words):
+            for bit in xrange(32):
+                if word & (1 << bit):
+                    cpus.append(i * 32 + bit)
+        return cpus
+
+    def present_cpus(self):
+        """Returns the list of present CPUs ([0] if that isn't known)."""
+        return self.cpu_mask('present') or [0]
+
+    def online_cpus(self):
+        """Returns the list of online CPUs ([0] if that isn't known)."""
+        return self.cpu_mask('online') or [0]
+
+    def percpu_addrs(self, var, cpus=None):
+        """Yields (cpu, address) of the per-CPU variable `var' (a symbol
+        name or an address) for each CPU in `cpus', the present CPUs by
+        default."""
+        if isinstance(var, basestring):
+            var = self.ramdump.addr_lookup(var)
+            if var is None:
+                return
+        if cpus is None:
+            cpus = self.present_cpus()
+        for cpu in cpus:
+            yield cpu, var + self.offset(cpu)
+
+    def read_percpu(self, var, format_string, cpus=None):
+        """Reads the per-CPU variable `var' (a symbol name or an address)
+        with `format_string' on each CPU in `cpus', the present CPUs by
+        default.
+
+        Returns a list with one entry per CPU, in the order of `cpus':
+        the value for single value formats, else a tuple of values. The
+        entry is None for CPUs whose copy can't be read.
+
+        """
+        ramdump = self.ramdump
+        st = ramdump.get_struct(format_string)
+        single = len(st.unpack('\0' * st.size)) == 1
+        values = []
+        for cpu, addr in self.percpu_addrs(var, cpus):
+            s = ramdump.read_bytes(addr, st.size)
+            if s is None:
+                values.append(None)
+            elif single:
+                values.append(st.unpack(s)[0])
+            else:
+                values.append(st.unpack(s))
+        return values
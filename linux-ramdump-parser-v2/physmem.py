@@ -0,0 +1,154 @@
+# Copyright (c) 2014, The Linux Foundation. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 and
+# only version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+import mmap
+import bisect
+
+
+class MemoryRegion(object):
+
+    """A single dump file (EBI, IMEM, ...) mapped at a physical address.
+
+    The file is mmap'd read-only so that reads are plain slices of the
+    mapping instead of a seek() and read() on a file object. If the
+    file can't be mapped (e.g. a 4GB dump with a 32-bit Python) we fall
+    back to regular file reads.
+
+    """
+
+    def __init__(self, fd, start, end, path):
+        self.fd = fd
+        self.start = start
+        self.end = end
+        self.path = path
+        self.buf = None
+        self.view = None
+        try:
+            if os.fstat(fd.fileno()).st_size > 0:
+                self.buf = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, OverflowError, ValueError):
+            self.buf = None
+        if self.buf is not None:
+            try:
+                self.view = memoryview(self.buf)
+            except TypeError:
+                # mmap objects only grew the new-style buffer
+                # interface in Python 3
+                self.view = None
+
+    def read(self, offset, length):
+        if self.buf is not None:
+            return self.buf[offset:offset + length]
+        self.fd.seek(offset)
+        return self.fd.read(length)
+
+    def close(self):
+        self.view = None
+        if self.buf is not None:
+            self.buf.close()
+            self.buf = None
+
+
+class PhysicalMemory(object):
+
+    """The physical address space of the dump.
+
+    Regions are kept sorted by start address so that finding the region
+    backing a physical address is a bisect instead of a linear scan.
+
+    """
+
+    def __init__(self):
+        self.regions = []
+        self._starts = []
+
+    def add_region(self, fd, start, end, path):
+        region = MemoryRegion(fd, start, end, path)
+        i = bisect.bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self.regions.insert(i, region)
+        return region
+
+    def clear(self):
+        for r in self.regions:
+            r.close()
+        self.regions = []
+        self._starts = []
+
+    def find_region(self, addr):
+        """Returns the MemoryRegion containing `addr' or None."""
+        i = bisect.bisect_right(self._starts, addr) - 1
+        # regions may overlap (see auto_parse), so fall back to the
+        # lower regions if the closest one doesn't cover addr
+        while i >= 0:
+            region = self.regions[i]
+            if addr <= region.end:
+                return region
+            i -= 1
+        return None
+
+    def read(self, addr, length):
+        """Returns up to `length' bytes at physical address `addr' or None
+        if no region contains `addr'."""
+        region = self.find_region(addr)
+        if region is None:
+            return None
+        return region.read(addr - region.start, length)
+
+    def read_range(self, addr, length):
+        """Returns exactly `length' bytes at physical address `addr',
+        stitching together adjacent regions if needed. Returns None if
+        any part of the range isn't backed by a region."""
+        chunks = []
+        while length > 0:
+            region = self.find_region(addr)
+            if region is None:
+                return None
+            offset = addr - region.start
+            n = min(length, region.end - addr + 1)
+            s = region.read(offset, n)
+            if len(s) != n:
+                return None
+            chunks.append(s)
+            addr += n
+            length -= n
+        if len(chunks) == 1:
+            return chunks[0]
+        return b''.join(chunks)
+
+    def view(self, addr, length):
+        """Like `read' but returns a zero-copy memoryview slice where the
+        Python version supports it."""
+        region = self.find_region(addr)
+        if region is None:
+            return None
+        offset = addr - region.start
+        if region.view is not None:
+            return region.view[offset:offset + length]
+        return region.read(offset, length)
+
+    def unpack(self, st, addr):
+        """Unpacks the struct.Struct `st' at physical address `addr'
+        straight out of the mapping. Returns None if the data isn't
+        available."""
+        region = self.find_region(addr)
+        if region is None:
+            return None
+        offset = addr - region.start
+        if region.buf is not None:
+            if offset + st.size > len(region.buf):
+                return None
+            return st.unpack_from(region.buf, offset)
+        s = region.read(offset, st.size)
+        if len(s) != st.size:
+            return None
+        return st.unpack(s)
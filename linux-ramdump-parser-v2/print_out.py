@@ -9,15 +9,182 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 import sys
+import atexit
+import gzip
+import threading
+import weakref
 from contextlib import contextmanager
+from cStringIO import StringIO
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bytes of output collected by an OutputWriter before it hits the file.
+DEFAULT_FLUSH_SIZE = 1 << 16
+
+COMPRESSION_SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
 
 out_file = None
+_saved_out_file = None
+_compression = None
+_flush_size = DEFAULT_FLUSH_SIZE
+# every writer made by open_output, so close_out can finish off the
+# ones that are still open at exit
+_open_writers = weakref.WeakSet()
+
+
+class OutputWriter(object):
+
+    """Buffered writer for parser output.
+
+    Writes are collected in a list and only joined and handed to the
+    underlying file once `flush_size' bytes have piled up (or on
+    flush()/close()), so parsers can emit lots of small pieces without
+    building up big strings themselves and without a system call per
+    line. A lock serializes writers in different threads; output from
+    worker processes is captured and written out by the parent (see
+    parser_util.run_parsers_parallel), so a file only ever has one
+    process writing to it.
+
+    Besides the file-like write/writelines/flush/close, `record' and
+    `records' format records straight into the buffer:
+
+        with ramdump.open_file('foo.txt') as out:
+            out.record('{0:x} {1}\\n', addr, name)
+            out.records('{0:x} {1}\\n', pairs)
+
+    """
+
+    def __init__(self, fileobj, flush_size=DEFAULT_FLUSH_SIZE, raw=None):
+        """`fileobj' is the file to write to. `raw' is the file under
+        `fileobj' if that is a compressing wrapper, it gets closed along
+        with `fileobj'."""
+        self.fileobj = fileobj
+        self.raw = raw
+        self.flush_size = flush_size
+        self._buf = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_value, ex_traceback):
+        self.close()
+
+    def _append(self, text):
+        # called with the lock held
+        self._buf.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.flush_size:
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        # called with the lock held
+        if self._buf:
+            self.fileobj.write(''.join(self._buf))
+            self._buf = []
+            self._buffered = 0
+
+    def write(self, text):
+        with self._lock:
+            self._append(text)
+
+    def writelines(self, lines):
+        with self._lock:
+            for line in lines:
+                self._append(line)
+
+    def record(self, fmt, *args):
+        """Writes fmt.format(*args)."""
+        with self._lock:
+            self._append(fmt.format(*args))
+
+    def records(self, fmt, rows):
+        """Writes fmt.format(*row) for every tuple in `rows'."""
+        with self._lock:
+            for row in rows:
+                self._append(fmt.format(*row))
+
+    def flush(self):
+        with self._lock:
+            self._flush_buffer()
+            self.fileobj.flush()
+
+    def getvalue(self):
+        """Returns everything written so far when writing to a StringIO."""
+        with self._lock:
+            self._flush_buffer()
+            return self.fileobj.getvalue()
+
+    def close(self):
+        with self._lock:
+            if self.fileobj is None:
+                return
+            self._flush_buffer()
+            self.fileobj.close()
+            if self.raw is not None and not self.raw.closed:
+                self.raw.close()
+            self.fileobj = None
+            self.raw = None
+
+    @property
+    def closed(self):
+        return self.fileobj is None
+
+    def __del__(self):
+        # a writer that's dropped without being closed still gets its
+        # buffered output (and a compressed file's trailer) written out
+        if getattr(self, 'fileobj', None) is not None:
+            self.close()
+
+
+def configure_output(compression=None, flush_size=DEFAULT_FLUSH_SIZE):
+    """Sets the compression ('gzip', 'zstd' or None) and buffer size used
+    for the output files opened from now on."""
+    global _compression, _flush_size
+    if compression is not None and compression not in COMPRESSION_SUFFIXES:
+        raise ValueError('Unknown compression {0}'.format(compression))
+    if compression == 'zstd' and zstandard is None:
+        print_out_str('!!! zstandard module not found, output will not be compressed')
+        compression = None
+    _compression = compression
+    _flush_size = flush_size
+
+
+def open_output(path, mode='wb', compress=True):
+    """Returns an OutputWriter for `path' using the settings from
+    configure_output(). Compressed files get the usual suffix added to
+    their name. Pass compress=False for files that have to stay readable
+    by other tools."""
+    compression = _compression if compress else None
+    if compression is None:
+        writer = OutputWriter(open(path, mode), _flush_size)
+    elif compression == 'gzip':
+        path = path + COMPRESSION_SUFFIXES[compression]
+        writer = OutputWriter(gzip.open(path, mode), _flush_size)
+    else:
+        path = path + COMPRESSION_SUFFIXES[compression]
+        raw = open(path, mode)
+        try:
+            stream = zstandard.ZstdCompressor().stream_writer(raw)
+        except:
+            raw.close()
+            raise
+        writer = OutputWriter(stream, _flush_size, raw)
+    _open_writers.add(writer)
+    return writer
 
 
 def set_outfile(path):
     global out_file
     try:
-        out_file = open(path, 'wb')
+        out_file = open_output(path)
     except:
         print_out_str("could not open path {0}".format(path))
         print_out_str("Do you have write/read permissions on the path?")
@@ -31,6 +198,51 @@ def print_out_str(string):
         out_file.write((string + '\n').encode('ascii', 'ignore'))
 
 
+def print_out_raw(text):
+    """Writes `text' (e.g. output captured with `start_capture') as-is."""
+    if out_file is None:
+        sys.stdout.write(text)
+    else:
+        out_file.write(text)
+
+
+def start_capture():
+    """Collect everything printed with print_out_str in memory instead of
+    writing it out, until stop_capture is called."""
+    global out_file, _saved_out_file
+    _saved_out_file = out_file
+    out_file = OutputWriter(StringIO(), _flush_size)
+
+
+def stop_capture():
+    """Stops capturing output and returns what was captured."""
+    global out_file, _saved_out_file
+    text = out_file.getvalue()
+    out_file = _saved_out_file
+    _saved_out_file = None
+    return text
+
+
+def flush_out():
+    if out_file is None:
+        sys.stdout.flush()
+    else:
+        out_file.flush()
+
+
+@atexit.register
+def close_out():
+    """Writes out whatever is still buffered and closes the output
+    file, and any other output files that were never closed. Compressed
+    files aren't complete until this is done."""
+    global out_file
+    if out_file is not None:
+        out_file.close()
+        out_file = None
+    for writer in list(_open_writers):
+        writer.close()
+
+
 @contextmanager
 def print_out_section(header):
     begin_header_string = '{0}begin {1}{0}'.format(
@@ -9,7 +9,6 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
-import struct
 from print_out import print_out_str
 
 tmc_registers = {
@@ -281,9 +280,11 @@ class QDSSDump():
 
         if (ctl & 0x1) == 1 and (mode == 0):
             # Save the 64kb of data
-            for i in range(0, 64 * 1024):
-                val = ram_dump.read_byte(self.etf_start + i, False)
-                tmc_etf.write(struct.pack('<B', val))
+            data = ram_dump.read_bytes(self.etf_start, 64 * 1024, False)
+            if data is None:
+                print_out_str('!!! Could not read the ETF buffer!')
+            else:
+                tmc_etf.write(data)
         else:
             print_out_str('!!! ETF was not the current sink!')
 
@@ -319,18 +320,24 @@ class QDSSDump():
             rwp = ram_dump.read_word(self.tmc_etr_start + rwp_offset, False)
 
             if (sts & 0x1) == 1:
-                for i in range(rwp, dbalo + rsz):
-                    val = ram_dump.read_byte(i, False)
-                    tmc_etr.write(struct.pack('<B', val))
-
-                for i in range(dbalo, rwp):
-                    val = ram_dump.read_byte(i, False)
-                    tmc_etr.write(struct.pack('<B', val))
-
+                # the buffer wrapped, so the oldest data starts at rwp
+                chunks = [(rwp, dbalo + rsz - rwp), (dbalo, rwp - dbalo)]
             else:
-                for i in range(dbalo, dbalo + rsz):
-                    val = ram_dump.read_byte(i, False)
-                    tmc_etr.write(struct.pack('<B', val))
+                chunks = [(dbalo, rsz)]
+
+            virts = ram_dump.phys_range_annotation(dbalo, rsz)
+            if virts:
+                print_out_str('ETR buffer is mapped at {0}'.format(virts))
+
+            for start, size in chunks:
+                if size <= 0:
+                    continue
+                data = ram_dump.read_bytes(start, size, False)
+                if data is None:
+                    print_out_str(
+                        '!!! Could not read ETR buffer at {0:x}'.format(start))
+                    break
+                tmc_etr.write(data)
         else:
             print_out_str('!!! ETR was not the current sink!')
 
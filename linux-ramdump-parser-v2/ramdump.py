@@ -12,20 +12,39 @@
 import sys
 import re
 import os
+import bisect
 import struct
-import gzip
+import zlib
 import functools
-from tempfile import NamedTemporaryFile
+import array
+import time
+from collections import OrderedDict
 
 import gdbmi
-from print_out import print_out_str
+from print_out import print_out_str, open_output
 from mmu import Armv7MMU, Armv7LPAEMMU
+from physmem import PhysicalMemory
+from symcache import open_symbol_cache
+from symtab import SymbolTable
+from percpu import PerCpu
+from structview import StructLayout
+from kernelconfig import KernelConfig
+from dumpinfo import INFO_SUFFIX, inputs_fingerprint, load_dump_info, \
+    save_dump_info
 
 FP = 11
 SP = 13
 LR = 14
 PC = 15
 THREAD_SIZE = 8192
+PAGE_SIZE = 4096
+
+# operations of a compiled unwind program (see Unwinder.compile_insns)
+UNWIND_VSP = 0      # (UNWIND_VSP, n): add n to SP
+UNWIND_POP = 1      # (UNWIND_POP, regs, load_sp): pop regs from SP
+UNWIND_SET_SP = 2   # (UNWIND_SET_SP, reg): copy reg to SP
+UNWIND_FINISH = 3   # (UNWIND_FINISH,): PC = LR if PC wasn't popped
+UNWIND_FAIL = 4     # (UNWIND_FAIL,): can't unwind any further
 
 HARDWARE_ID_IDX = 0
 MEMORY_START_IDX = 1
@@ -358,7 +377,40 @@ first_mem_file_names = ['EBICS0.BIN',
 extra_mem_file_names = ['EBI1CS1.BIN', 'DDRCS1.BIN', 'ebi1_cs1.bin', 'DDRCS0_1.BIN']
 
 
-class RamDump():
+def prel31_decode(value, place):
+    """Returns the address encoded in the prel31 word `value' found at
+    address `place' (a 31-bit signed offset from `place')."""
+    offset = value & 0x7fffffff
+    if offset & 0x40000000:
+        offset -= 0x80000000
+    return (place + offset) & 0xffffffff
+
+
+class lazy_property(object):
+
+    """Like a read-only property, but the function is only called the
+    first time the attribute is read. Its result then replaces the
+    property on the instance, so it can also be assigned to directly.
+    How long the function took is recorded in the instance's `timings'.
+
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        start = time.time()
+        value = self.func(obj)
+        obj.timings[self.name] = time.time() - start
+        obj.__dict__[self.name] = value
+        return value
+
+
+class RamDump(object):
 
     class Unwinder ():
 
@@ -370,46 +422,88 @@ class RamDump():
                 self.lr = lr
                 self.pc = pc
 
+        class StackMemory(object):
+
+            """Reads words of kernel stacks a THREAD_SIZE block at a time,
+            so that unwinding a stack takes one or two reads of the dump
+            instead of one per popped register."""
+
+            def __init__(self, ramdump):
+                self.ramdump = ramdump
+                self.blocks = {}
+
+            def read_word(self, addr):
+                base = addr & ~(THREAD_SIZE - 1)
+                try:
+                    words = self.blocks[base]
+                except KeyError:
+                    words = self.ramdump.read_words(base, THREAD_SIZE // 4)
+                    self.blocks[base] = words
+                if words is None or addr & 3:
+                    return self.ramdump.read_word(addr)
+                return words[(addr - base) >> 2]
+
         class UnwindCtrlBlock ():
 
             def __init__(self):
                 self.vrs = 16 * [0]
-                self.insn = 0
-                self.entries = -1
-                self.byte = -1
-                self.index = 0
+                # the unwind instruction bytes and the next one to run
+                self.insns = ()
+                self.pos = 0
 
         def __init__(self, ramdump):
+            self.ramdump = ramdump
+            # The index is held as two columns: the first and second
+            # word of each entry. func_addrs has the address of the
+            # function each entry covers, for bisecting.
+            self.start_idx = 0
+            self.stop_idx = 0
+            self.func_words = array.array('I')
+            self.insn_words = array.array('I')
+            self.func_addrs = array.array('I')
+            self.origin = 0
+            # decoded unwind instructions and compiled programs by index
+            # entry, and the program to run for each PC seen so far
+            self._insns = {}
+            self._programs = {}
+            self._pc_programs = {}
+            self.search_idx = self.search_idx_3_4
+
             start = ramdump.addr_lookup('__start_unwind_idx')
             end = ramdump.addr_lookup('__stop_unwind_idx')
             if (start is None) or (end is None):
                 print_out_str('!!! Could not lookup unwinding information')
-                return None
+                return
             # addresses
             self.start_idx = start
             self.stop_idx = end
-            self.unwind_table = []
-            self.ramdump = ramdump
-            i = 0
-            for addr in range(start, end, 8):
-                (a, b) = ramdump.read_string(addr, '<II')
-                self.unwind_table.append((a, b, start + 8 * i))
-                i += 1
+            words = ramdump.read_words(start, (end - start) // 8 * 2)
+            if words is None:
+                print_out_str('!!! Could not read the unwind index')
+                return
+            self.func_words = words[0::2]
+            self.insn_words = words[1::2]
 
             ver = ramdump.version
             if re.search('3.0.\d', ver) is not None:
+                # these kernels turn the function offsets into absolute
+                # addresses when they boot
                 self.search_idx = self.search_idx_3_0
+                self.func_addrs = self.func_words
             else:
                 self.search_idx = self.search_idx_3_4
+                self.func_addrs = array.array('I', (
+                    prel31_decode(word, start + 8 * i)
+                    for i, word in enumerate(self.func_words)))
                 # index into the table
                 self.origin = self.unwind_find_origin()
 
         def unwind_find_origin(self):
             start = 0
-            stop = len(self.unwind_table)
+            stop = len(self.func_words)
             while (start < stop):
                 mid = start + ((stop - start) >> 1)
-                if (self.unwind_table[mid][0] >= 0x40000000):
+                if (self.func_words[mid] >= 0x40000000):
                     start = mid + 1
                 else:
                     stop = mid
@@ -455,65 +549,72 @@ class RamDump():
             walk_stackframe_generic(frame)
 
         def search_idx_3_4(self, addr):
-            start = 0
-            stop = len(self.unwind_table)
-            orig = addr
-
+            """Returns the index of the entry covering `addr', or None.
+            Functions before the index have entries before `origin' and
+            ones after it have entries from `origin' on."""
             if (addr < self.start_idx):
-                stop = self.origin
+                start, stop = 0, self.origin
             else:
-                start = self.origin
-
-            if (start >= stop):
+                start, stop = self.origin, len(self.func_addrs)
+            i = bisect.bisect_right(self.func_addrs, addr, start, stop) - 1
+            if i < start:
                 return None
+            return i
 
-            addr = (addr - self.unwind_table[start][2]) & 0x7fffffff
-
-            while (start < (stop - 1)):
-                mid = start + ((stop - start) >> 1)
-
-                dif = (self.unwind_table[mid][2]
-                       - self.unwind_table[start][2])
-                if ((addr - dif) < self.unwind_table[mid][0]):
-                    stop = mid
-                else:
-                    addr = addr - dif
-                    start = mid
-
-            if self.unwind_table[start][0] <= addr:
-                return self.unwind_table[start]
+        def search_idx_3_0(self, addr):
+            if not self.func_addrs:
+                return None
+            return max(bisect.bisect_right(self.func_addrs, addr) - 1, 0)
+
+        def unwind_insns(self, i):
+            """Returns the unwind instruction bytes of index entry `i' as
+            a tuple, or None if the function can't be unwound."""
+            try:
+                return self._insns[i]
+            except KeyError:
+                pass
+            insns = self._decode_insns(i)
+            self._insns[i] = insns
+            return insns
+
+        def _decode_insns(self, i):
+            word = self.insn_words[i]
+            entry = self.start_idx + 8 * i
+            if (word == 1):
+                # EXIDX_CANTUNWIND
+                return None
+            elif ((word & 0x80000000) == 0):
+                addr = prel31_decode(word, entry + 4)
+                val = self.ramdump.read_word(addr)
+                if val is None:
+                    return None
+            elif (word & 0xff000000) == 0x80000000:
+                addr = entry + 4
+                val = word
             else:
+                print_out_str('not supported')
                 return None
 
-        def search_idx_3_0(self, addr):
-            first = 0
-            last = len(self.unwind_table)
-            while (first < last - 1):
-                mid = first + ((last - first + 1) >> 1)
-                if (addr < self.unwind_table[mid][0]):
-                    last = mid
-                else:
-                    first = mid
-
-            return self.unwind_table[first]
+            if ((val & 0xff000000) == 0x80000000):
+                return ((val >> 16) & 0xff, (val >> 8) & 0xff, val & 0xff)
+            elif ((val & 0xff000000) == 0x81000000):
+                insns = [(val >> 8) & 0xff, val & 0xff]
+                words = self.ramdump.read_words(addr + 4, (val >> 16) & 0xff)
+                if words is None:
+                    return None
+                for w in words:
+                    insns.extend(((w >> 24) & 0xff, (w >> 16) & 0xff,
+                                  (w >> 8) & 0xff, w & 0xff))
+                return tuple(insns)
+            else:
+                return None
 
         def unwind_get_byte(self, ctrl):
-
-            if (ctrl.entries <= 0):
+            if (ctrl.pos >= len(ctrl.insns)):
                 print_out_str('unwind: Corrupt unwind table')
                 return 0
-
-            val = self.ramdump.read_word(ctrl.insn)
-
-            ret = (val >> (ctrl.byte * 8)) & 0xff
-
-            if (ctrl.byte == 0):
-                ctrl.insn += 4
-                ctrl.entries -= 1
-                ctrl.byte = 3
-            else:
-                ctrl.byte -= 1
-
+            ret = ctrl.insns[ctrl.pos]
+            ctrl.pos += 1
             return ret
 
         def unwind_exec_insn(self, ctrl, trace=False):
@@ -573,7 +674,7 @@ class RamDump():
                     if ctrl.vrs[reg] is None:
                         return -1
                     vsp += 4
-                if (insn & 0x80):
+                if (insn & 0x08):
                     if trace:
                         print_out_str('    set LR from the stack')
                     ctrl.vrs[14] = self.ramdump.read_word(vsp)
@@ -586,7 +687,7 @@ class RamDump():
                     print_out_str('    set pc = lr')
                 if (ctrl.vrs[PC] == 0):
                     ctrl.vrs[PC] = ctrl.vrs[LR]
-                ctrl.entries = 0
+                ctrl.pos = len(ctrl.insns)
             elif (insn == 0xb1):
                 mask = self.unwind_get_byte(ctrl)
                 vsp = ctrl.vrs[SP]
@@ -622,22 +723,150 @@ class RamDump():
 
             return 0
 
-        def prel31_to_addr(self, addr):
-            value = self.ramdump.read_word(addr)
-            # offset = (value << 1) >> 1
-            # C wants this sign extended. Python doesn't do that.
-            # Sign extend manually.
-            if (value & 0x40000000):
-                offset = value | 0x80000000
+        def compile_insns(self, insns):
+            """Turns the unwind instructions `insns' of a function into a
+            tuple of UNWIND_* operations. Errors in the instructions are
+            reported here, once, and end the program with UNWIND_FAIL."""
+            ops = []
+            pos = 0
+            while pos < len(insns):
+                insn = insns[pos]
+                pos += 1
+                if ((insn & 0xc0) == 0x00):
+                    ops.append((UNWIND_VSP, ((insn & 0x3f) << 2) + 4))
+                elif ((insn & 0xc0) == 0x40):
+                    ops.append((UNWIND_VSP, -(((insn & 0x3f) << 2) + 4)))
+                elif ((insn & 0xf0) == 0x80):
+                    insn = (insn << 8) | self._insn_byte(insns, pos)
+                    pos += 1
+                    mask = insn & 0x0fff
+                    if (mask == 0):
+                        print_out_str("unwind: 'Refuse to unwind' instruction")
+                        ops.append((UNWIND_FAIL,))
+                        break
+                    # pop R4-R15 according to mask
+                    regs = tuple(4 + i for i in range(12) if mask & (1 << i))
+                    ops.append((UNWIND_POP, regs, SP in regs))
+                elif ((insn & 0xf0) == 0x90 and (insn & 0x0d) != 0x0d):
+                    ops.append((UNWIND_SET_SP, insn & 0x0f))
+                elif ((insn & 0xf0) == 0xa0):
+                    # pop R4-R[4+bbb], and LR for 0xa8-0xaf
+                    regs = list(range(4, 5 + (insn & 7)))
+                    if (insn & 0x08):
+                        regs.append(LR)
+                    ops.append((UNWIND_POP, tuple(regs), False))
+                elif (insn == 0xb0):
+                    ops.append((UNWIND_FINISH,))
+                    break
+                elif (insn == 0xb1):
+                    mask = self._insn_byte(insns, pos)
+                    pos += 1
+                    if (mask == 0 or mask & 0xf0):
+                        print_out_str('unwind: Spare encoding')
+                        ops.append((UNWIND_FAIL,))
+                        break
+                    # pop R0-R3 according to mask
+                    regs = tuple(i for i in range(4) if mask & (1 << i))
+                    ops.append((UNWIND_POP, regs, False))
+                elif (insn == 0xb2):
+                    uleb128 = self._insn_byte(insns, pos)
+                    pos += 1
+                    ops.append((UNWIND_VSP, 0x204 + (uleb128 << 2)))
+                else:
+                    print_out_str('unwind: Unhandled instruction')
+                    ops.append((UNWIND_FAIL,))
+                    break
+            return tuple(ops)
+
+        def _insn_byte(self, insns, pos):
+            if pos >= len(insns):
+                print_out_str('unwind: Corrupt unwind table')
+                return 0
+            return insns[pos]
+
+        def frame_program(self, pc):
+            """Returns the compiled unwind program for a frame stopped at
+            `pc', or None if it can't be unwound."""
+            try:
+                return self._pc_programs[pc]
+            except KeyError:
+                pass
+            idx = self.search_idx(pc)
+            if idx is None:
+                program = None
             else:
-                offset = value
+                try:
+                    program = self._programs[idx]
+                except KeyError:
+                    insns = self.unwind_insns(idx)
+                    if insns is None:
+                        program = None
+                    else:
+                        program = self.compile_insns(insns)
+                    self._programs[idx] = program
+            self._pc_programs[pc] = program
+            return program
+
+        def unwind_frame(self, frame, trace=False, stack=None):
+            """Moves `frame' to its caller. Returns 0 on success, or -1
+            if there's nothing more to unwind. With `trace' each unwind
+            instruction is interpreted and printed as it's run. `stack'
+            is where to read the stack from (a StackMemory, say)."""
+            if trace:
+                return self.unwind_frame_trace(frame, trace)
+            low = frame.sp
+            high = ((low + (THREAD_SIZE - 1)) & ~(THREAD_SIZE - 1)) + \
+                THREAD_SIZE
+            program = self.frame_program(frame.pc)
+            if program is None:
+                return -1
+            if stack is None:
+                stack = self.ramdump
+            read_word = stack.read_word
+
+            vrs = 16 * [0]
+            vrs[FP] = frame.fp
+            vrs[SP] = frame.sp
+            vrs[LR] = frame.lr
+            for op in program:
+                kind = op[0]
+                if kind == UNWIND_VSP:
+                    vrs[SP] += op[1]
+                elif kind == UNWIND_POP:
+                    vsp = vrs[SP]
+                    for reg in op[1]:
+                        value = read_word(vsp)
+                        if value is None:
+                            return -1
+                        vrs[reg] = value
+                        vsp += 4
+                    if not op[2]:
+                        vrs[SP] = vsp
+                elif kind == UNWIND_SET_SP:
+                    vrs[SP] = vrs[op[1]]
+                elif kind == UNWIND_FINISH:
+                    if (vrs[PC] == 0):
+                        vrs[PC] = vrs[LR]
+                else:
+                    return -1
+                if (vrs[SP] < low or vrs[SP] >= high):
+                    return -1
+
+            if (vrs[PC] == 0):
+                vrs[PC] = vrs[LR]
+
+            # check for infinite loop */
+            if (frame.pc == vrs[PC]):
+                return -1
+
+            frame.fp = vrs[FP]
+            frame.sp = vrs[SP]
+            frame.lr = vrs[LR]
+            frame.pc = vrs[PC]
 
-            # This addition relies on integer overflow
-            # Emulate this behavior
-            temp = addr + offset
-            return (temp & 0xffffffff) + ((temp >> 32) & 0xffffffff)
+            return 0
 
-        def unwind_frame(self, frame, trace=False):
+        def unwind_frame_trace(self, frame, trace=True):
             low = frame.sp
             high = ((low + (THREAD_SIZE - 1)) & ~(THREAD_SIZE - 1)) + \
                 THREAD_SIZE
@@ -648,36 +877,18 @@ class RamDump():
                     print_out_str("can't find %x" % frame.pc)
                 return -1
 
+            insns = self.unwind_insns(idx)
+            if insns is None:
+                return -1
+
             ctrl = self.UnwindCtrlBlock()
             ctrl.vrs[FP] = frame.fp
             ctrl.vrs[SP] = frame.sp
             ctrl.vrs[LR] = frame.lr
             ctrl.vrs[PC] = 0
+            ctrl.insns = insns
 
-            if (idx[1] == 1):
-                return -1
-
-            elif ((idx[1] & 0x80000000) == 0):
-                ctrl.insn = self.prel31_to_addr(idx[2] + 4)
-
-            elif (idx[1] & 0xff000000) == 0x80000000:
-                ctrl.insn = idx[2] + 4
-            else:
-                print_out_str('not supported')
-                return -1
-
-            val = self.ramdump.read_word(ctrl.insn)
-
-            if ((val & 0xff000000) == 0x80000000):
-                ctrl.byte = 2
-                ctrl.entries = 1
-            elif ((val & 0xff000000) == 0x81000000):
-                ctrl.byte = 1
-                ctrl.entries = 1 + ((val & 0x00ff0000) >> 16)
-            else:
-                return -1
-
-            while (ctrl.entries > 0):
+            while (ctrl.pos < len(insns)):
                 urc = self.unwind_exec_insn(ctrl, trace)
                 if (urc < 0):
                     return urc
@@ -698,7 +909,64 @@ class RamDump():
 
             return 0
 
+        def walk(self, sp, fp, pc, lr, stack=None):
+            """Yields the PC of each frame of the backtrace starting from
+            the given registers."""
+            if stack is None:
+                stack = self.StackMemory(self.ramdump)
+            frame = self.Stackframe(fp, sp, lr, pc)
+            while True:
+                yield frame.pc
+                if self.unwind_frame(frame, stack=stack) < 0:
+                    break
+
+        def backtraces(self, states):
+            """Unwinds many stacks at once. `states' is a sequence of
+            (sp, fp, pc, lr) tuples, one per stack. Returns a list with
+            a tuple of frame PCs for each stack, in the same order.
+            Identical backtraces are returned as the same tuple, so they
+            can be told apart (and printed) once per distinct trace."""
+            traces = []
+            distinct = {}
+            for sp, fp, pc, lr in states:
+                trace = tuple(self.walk(sp, fp, pc, lr))
+                traces.append(distinct.setdefault(trace, trace))
+            return traces
+
+        def format_backtraces(self, traces, extra_str=''):
+            """Returns the lines to print for each backtrace in `traces'
+            (as returned by backtraces). Every distinct PC is looked up
+            once and every distinct backtrace is formatted once."""
+            distinct = set(traces)
+            pcs = sorted(set(pc for trace in distinct for pc in trace))
+            symbols = dict(zip(pcs, self.ramdump.unwind_lookup_many(pcs)))
+            formatted = {}
+            for trace in distinct:
+                lines = []
+                for pc in trace:
+                    r = symbols[pc]
+                    if r is None:
+                        symname, offset = 'UNKNOWN', 0
+                    else:
+                        symname, offset = r
+                    lines.append(extra_str + '[<{0:x}>] {1}+0x{2:x}'.format(
+                        pc, symname, offset))
+                formatted[trace] = lines
+            return [formatted[trace] for trace in traces]
+
         def unwind_backtrace(self, sp, fp, pc, lr, extra_str='', out_file=None, trace=False):
+            if trace:
+                return self.unwind_backtrace_trace(sp, fp, pc, lr, extra_str,
+                                                   out_file)
+            frames = tuple(self.walk(sp, fp, pc, lr))
+            lines = self.format_backtraces([frames], extra_str)[0]
+            if out_file:
+                out_file.writelines(line + '\n' for line in lines)
+            else:
+                for line in lines:
+                    print_out_str(line)
+
+        def unwind_backtrace_trace(self, sp, fp, pc, lr, extra_str='', out_file=None, trace=True):
             offset = 0
             frame = self.Stackframe(fp, sp, lr, pc)
             frame.fp = fp
@@ -723,12 +991,16 @@ class RamDump():
                 else:
                     print_out_str(pstring)
 
-                urc = self.unwind_frame(frame, trace)
+                urc = self.unwind_frame_trace(frame, trace)
                 if urc < 0:
                     break
 
-    def __init__(self, vmlinux_path, nm_path, gdb_path, ebi, file_path, phys_offset, outdir, hw_id=None, hw_version=None):
+    def __init__(self, vmlinux_path, nm_path, gdb_path, ebi, file_path, phys_offset, outdir, hw_id=None, hw_version=None, cache_dir=None):
+        self.timings = OrderedDict()
         self.ebi_files = []
+        self.physmem = PhysicalMemory()
+        self._structs = {}
+        self._layouts = {}
         self.phys_offset = None
         self.tz_start = 0
         self.ebi_start = 0
@@ -741,8 +1013,69 @@ class RamDump():
         self.gdb_path = gdb_path
         self.outdir = outdir
         self.imem_fname = None
-        self.gdbmi = gdbmi.GdbMI(self.gdb_path, self.vmlinux)
+        self.banner = None
+        self.cache_dir = cache_dir
+        self.symcache = None
+        if cache_dir is not None:
+            self.symcache = open_symbol_cache(self.vmlinux, cache_dir)
+        self.gdbmi = gdbmi.GdbMI(self.gdb_path, self.vmlinux, self.symcache)
         self.gdbmi.open()
+        start = time.time()
+        self.info_path = None
+        self.info = None
+        info = None
+        if cache_dir is not None:
+            self.info_path, self.info_fingerprint = self.dump_info_key(
+                ebi, file_path, phys_offset)
+        if self.info_path is not None:
+            info = load_dump_info(self.info_path, self.info_fingerprint)
+        if info is not None:
+            print_out_str('Using dump information saved in {0}'.format(
+                self.info_path))
+            self.restore_dump_info(info)
+        else:
+            self.discover_layout(ebi, file_path, phys_offset)
+        self.page_offset = 0xc0000000
+        self.percpu = PerCpu(self)
+        self.timings['layout'] = time.time() - start
+
+        start = time.time()
+        if info is not None:
+            lpae = info['mmu'] == 'lpae'
+        else:
+            lpae = self.detect_lpae()
+        if lpae:
+            print_out_str('Using LPAE MMU')
+            self.mmu = Armv7LPAEMMU(self)
+        else:
+            print_out_str('Using non-LPAE MMU')
+            self.mmu = Armv7MMU(self)
+        self.timings['mmu'] = time.time() - start
+
+        if info is not None:
+            self.version = info['linux_version']
+            print_out_str('Linux Banner: ' + info['linux_banner'])
+            print_out_str('version = {0}'.format(self.version))
+        elif not self.get_version():
+            print_out_str('!!! Could not get the Linux version!')
+            print_out_str(
+                '!!! Your vmlinux is probably wrong for these dumps')
+            print_out_str('!!! Exiting now')
+            sys.exit(1)
+        if info is not None and info['kconfig'] is not None:
+            self.kconfig = KernelConfig(info['kconfig'])
+        # the symbol table, the kernel configuration (unless it came
+        # from the sidecar) and the unwind tables are only loaded once
+        # something needs them, see the lazy_properties below. The
+        # kernel configuration is added to the sidecar when it is.
+        if info is None and self.info_path is not None:
+            info = self.dump_info()
+            save_dump_info(self.info_path, self.info_fingerprint, info)
+        self.info = info
+
+    def discover_layout(self, ebi, file_path, phys_offset):
+        """Works out the memory layout and the hardware of the dump (what
+        the sidecar saves us from doing on later runs)."""
         if ebi is not None:
             # TODO sanity check to make sure the memory regions don't overlap
             for file_path, start, end in ebi:
@@ -751,7 +1084,7 @@ class RamDump():
                     print_out_str(
                         'Could not open {0}. Will not be part of dump'.format(file_path))
                     continue
-                self.ebi_files.append((fd, start, end, file_path))
+                self.add_ebi_file(fd, start, end, file_path)
         else:
             if not self.auto_parse(file_path):
                 return None
@@ -763,11 +1096,8 @@ class RamDump():
             print_out_str(
                 '[!!!] Phys offset was set to {0:x}'.format(phys_offset))
             self.phys_offset = phys_offset
-        self.lookup_table = []
-        self.page_offset = 0xc0000000
-        self.config = []
-        self.setup_symbol_tables()
 
+    def detect_lpae(self):
         # The address of swapper_pg_dir can be used to determine
         # whether or not we're running with LPAE enabled since an
         # extra 4k is needed for LPAE. If it's 0x5000 below
@@ -778,11 +1108,9 @@ class RamDump():
         pg_dir_size = kernel_text_offset - \
             (swapper_pg_dir_addr - self.page_offset)
         if pg_dir_size == 0x4000:
-            print_out_str('Using non-LPAE MMU')
-            self.mmu = Armv7MMU(self)
+            return False
         elif pg_dir_size == 0x5000:
-            print_out_str('Using LPAE MMU')
-            self.mmu = Armv7LPAEMMU(self)
+            return True
         else:
             print_out_str(
                 "!!! Couldn't determine whether or not we're using LPAE!")
@@ -790,65 +1118,140 @@ class RamDump():
                 '!!! This is a BUG in the parser and should be reported.')
             sys.exit(1)
 
-        if not self.get_version():
-            print_out_str('!!! Could not get the Linux version!')
-            print_out_str(
-                '!!! Your vmlinux is probably wrong for these dumps')
-            print_out_str('!!! Exiting now')
-            sys.exit(1)
-        if not self.get_config():
-            print_out_str('!!! Could not get saved configuration')
-            print_out_str(
-                '!!! This is really bad and probably indicates RAM corruption')
-            print_out_str('!!! Some features may be disabled!')
-        self.unwind = self.Unwinder(self)
+    def dump_info_key(self, ebi, file_path, phys_offset):
+        """Returns the path of the dump information sidecar and the
+        fingerprint of everything that goes into it, or (None, None) if
+        there's no dump file to put it next to."""
+        if ebi is not None:
+            paths = [path for path, start, end in ebi]
+            extra = [(start, end) for path, start, end in ebi]
+        else:
+            names = first_mem_file_names + extra_mem_file_names + \
+                sorted(set(a[IMEM_FILENAME] for a in hw_ids
+                           if a[IMEM_FILENAME] is not None))
+            paths = [os.path.join(file_path, name) for name in names]
+            paths = [path for path in paths if os.path.exists(path)]
+            extra = []
+        if not paths:
+            return None, None
+        extra.extend([phys_offset, self.hw_id, self.hw_version])
+        fingerprint = inputs_fingerprint(paths + [self.vmlinux], extra)
+        return paths[0] + INFO_SUFFIX, fingerprint
+
+    def dump_info(self):
+        """Returns what should go in the dump information sidecar."""
+        return {
+            'regions': [[path, start, end]
+                        for fd, start, end, path in self.ebi_files],
+            'hw_id': self.hw_id,
+            'cpu_type': self.cpu_type,
+            'phys_offset': self.phys_offset,
+            'tz_addr': getattr(self, 'tz_addr', None),
+            'tz_start': self.tz_start,
+            'ebi_start': self.ebi_start,
+            'imem_fname': self.imem_fname,
+            'mmu': 'lpae' if isinstance(self.mmu, Armv7LPAEMMU) else 'armv7',
+            'ttbr': self.mmu.ttbr,
+            'linux_version': self.version,
+            'linux_banner': self.banner,
+            'kconfig': None,
+        }
+
+    def restore_dump_info(self, info):
+        """Sets up the memory layout and hardware from a sidecar loaded
+        with load_dump_info."""
+        for path, start, end in info['regions']:
+            self.add_ebi_file(open(path, 'rb'), start, end, path)
+        self.hw_id = info['hw_id']
+        self.cpu_type = info['cpu_type']
+        self.phys_offset = info['phys_offset']
+        if info['tz_addr'] is not None:
+            self.tz_addr = info['tz_addr']
+        self.tz_start = info['tz_start']
+        self.ebi_start = info['ebi_start']
+        self.imem_fname = info['imem_fname']
+        self.banner = info['linux_banner']
+        print_out_str('Hardware match: {0}'.format(self.hw_id))
+        print_out_str('phys_offset = {0:x}'.format(self.phys_offset))
 
     def __del__(self):
         self.gdbmi.close()
+        if self.symcache is not None:
+            self.symcache.close()
+
+    def reopen(self):
+        """Reopens the dump files, the symbol cache and the connection to
+        gdb. What gdbmi has already looked up is kept.
+
+        This is for processes forked from the one that created this
+        RamDump (see parser_util.run_parsers_parallel): they can't share
+        file offsets, sqlite connections or the gdb pipe with their
+        parent. The dump files are mapped again read-only, so the pages
+        are still shared through the page cache.
+
+        """
+        ebi_files = self.ebi_files
+        self.ebi_files = []
+        self.physmem = PhysicalMemory()
+        for fd, start, end, path in ebi_files:
+            self.add_ebi_file(open(path, 'rb'), start, end, path)
+        if self.cache_dir is not None:
+            self.symcache = open_symbol_cache(self.vmlinux, self.cache_dir)
+        self.gdbmi.reopen(self.symcache)
+
+    def flush_caches(self):
+        """Writes out anything the persistent symbol cache hasn't saved
+        yet."""
+        if self.symcache is not None:
+            self.symcache.flush()
+
+    def add_ebi_file(self, fd, start, end, path):
+        self.ebi_files.append((fd, start, end, path))
+        self.physmem.add_region(fd, start, end, path)
+
+    def clear_ebi_files(self):
+        self.ebi_files = []
+        self.physmem.clear()
 
     def open_file(self, file_name, mode='wb'):
+        """Returns a buffered OutputWriter for `file_name' in the output
+        directory. Text reports are compressed if output compression is
+        enabled; everything else (T32 scripts, binary images) is left
+        alone so other tools can load it."""
         file_path = os.path.join(self.outdir, file_name)
         f = None
         try:
-            f = open(file_path, mode)
+            f = open_output(file_path, mode, file_name.endswith('.txt'))
         except:
             print_out_str('Could not open path {0}'.format(file_path))
             print_out_str('Do you have write/read permissions on the path?')
             sys.exit(1)
         return f
 
-    def get_config(self):
+    def read_config(self):
+        """Returns the KernelConfig saved in the kernel image in memory
+        (CONFIG_IKCONFIG), or None if it's not there or can't be
+        decompressed."""
         kconfig_addr = self.addr_lookup('kernel_config_data')
         if kconfig_addr is None:
-            return
+            return None
         kconfig_size = self.sizeof('kernel_config_data')
         # size includes magic, offset from it
         kconfig_size = kconfig_size - 16 - 1
-        zconfig = NamedTemporaryFile(mode='wb', delete=False)
         # kconfig data starts with magic 8 byte string, go past that
         s = self.read_cstring(kconfig_addr, 8)
         if s != 'IKCFG_ST':
-            return
-        kconfig_addr = kconfig_addr + 8
-        for i in range(0, kconfig_size):
-            val = self.read_byte(kconfig_addr + i)
-            zconfig.write(struct.pack('<B', val))
-
-        zconfig.close()
-        zconfig_in = gzip.open(zconfig.name, 'rb')
+            return None
+        data = self.read_bytes(kconfig_addr + 8, kconfig_size)
+        if data is None:
+            return None
         try:
-            t = zconfig_in.readlines()
-        except:
-            return False
-        zconfig_in.close()
-        os.remove(zconfig.name)
-        for l in t:
-            self.config.append(l.rstrip().decode('ascii', 'ignore'))
-        return True
+            return KernelConfig.from_gzip(data)
+        except zlib.error:
+            return None
 
     def is_config_defined(self, config):
-        s = config + '=y'
-        return s in self.config
+        return self.kconfig.is_defined(config)
 
     def get_version(self):
         banner_addr = self.addr_lookup('linux_banner')
@@ -864,6 +1267,7 @@ class RamDump():
                 print_out_str('!!! Could not match version! {0}'.format(b))
                 return False
             self.version = v.group(1)
+            self.banner = b.rstrip()
             print_out_str('Linux Banner: ' + b.rstrip())
             print_out_str('version = {0}'.format(self.version))
             return True
@@ -900,12 +1304,13 @@ class RamDump():
 
         first_mem = open(first_mem_path, 'rb')
         # put some dummy data in for now
-        self.ebi_files = [(first_mem, 0, 0xffff0000, first_mem_path)]
+        self.add_ebi_file(first_mem, 0, 0xffff0000, first_mem_path)
         if not self.get_hw_id():
             return False
         first_mem_end = self.ebi_start + os.path.getsize(first_mem_path) - 1
-        self.ebi_files = [
-            (first_mem, self.ebi_start, first_mem_end, first_mem_path)]
+        self.clear_ebi_files()
+        self.add_ebi_file(first_mem, self.ebi_start, first_mem_end,
+                          first_mem_path)
         print_out_str(
             'Adding {0} {1:x}--{2:x}'.format(first_mem_path, self.ebi_start, first_mem_end))
 
@@ -918,8 +1323,7 @@ class RamDump():
                 extra_end = extra_start + os.path.getsize(extra_path) - 1
                 print_out_str(
                     'Adding {0} {1:x}--{2:x}'.format(extra_path, extra_start, extra_end))
-                self.ebi_files.append(
-                    (extra, extra_start, extra_end, extra_path))
+                self.add_ebi_file(extra, extra_start, extra_end, extra_path)
 
         if self.imem_fname is not None:
             imemc_path = file_path + '/' + self.imem_fname
@@ -929,8 +1333,7 @@ class RamDump():
                 imemc_end = imemc_start + os.path.getsize(imemc_path) - 1
                 print_out_str(
                     'Adding {0} {1:x}--{2:x}'.format(imemc_path, imemc_start, imemc_end))
-                self.ebi_files.append(
-                    (imemc, imemc_start, imemc_end, imemc_path))
+                self.add_ebi_file(imemc, imemc_start, imemc_end, imemc_path)
         return True
 
     # TODO support linux launcher, for when linux T32 actually happens
@@ -1098,14 +1501,94 @@ class RamDump():
     def virt_to_phys(self, virt):
         return self.mmu.virt_to_phys(virt)
 
-    def setup_symbol_tables(self):
-        stream = os.popen(self.nm_path + ' -n ' + self.vmlinux)
-        symbols = stream.readlines()
-        for line in symbols:
-            s = line.split(' ')
-            if len(s) == 3:
-                self.lookup_table.append((int(s[0], 16), s[2].rstrip()))
-        stream.close()
+    def phys_to_virt(self, phys):
+        """Returns the sorted list of virtual addresses the physical
+        address `phys' is mapped at in the kernel page tables (empty if
+        it isn't mapped). The page tables are only walked once, on first
+        use."""
+        return self.mmu.phys_to_virt(phys)
+
+    def phys_to_virt_many(self, phys_addrs):
+        """Like `phys_to_virt' for every address in `phys_addrs'."""
+        return self.mmu.phys_to_virt_many(phys_addrs)
+
+    def phys_range_to_virt(self, phys, size):
+        """Returns the sorted list of (virt, phys, size) for the mapped
+        parts of [phys, phys + size)."""
+        return self.mmu.phys_range_to_virt(phys, size)
+
+    def _describe_virts(self, virts):
+        syms = self.unwind_lookup_many(virts)
+        desc = []
+        for virt, sym in zip(virts, syms):
+            if sym is None or virt < self.page_offset:
+                desc.append('{0:x}'.format(virt))
+            else:
+                desc.append('{0:x} <{1}+0x{2:x}>'.format(virt, sym[0], sym[1]))
+        return desc
+
+    def phys_annotations(self, phys_addrs):
+        """Returns a string for each address in `phys_addrs' listing the
+        virtual addresses it's mapped at, with the symbol each is in
+        (e.g. 'c0e01000 <log_buf+0x0>'), or '' if it isn't mapped. All of
+        the addresses are translated and symbolized in bulk."""
+        aliases = self.phys_to_virt_many(phys_addrs)
+        flat = [virt for virts in aliases for virt in virts]
+        desc = iter(self._describe_virts(flat))
+        return [', '.join([next(desc) for virt in virts])
+                for virts in aliases]
+
+    def phys_range_annotation(self, phys, size):
+        """Returns a string listing where the mapped parts of [phys,
+        phys + size) are in the kernel's virtual address space, or '' if
+        no part of it is mapped."""
+        pieces = self.phys_range_to_virt(phys, size)
+        desc = self._describe_virts([virt for virt, p, s in pieces])
+        return ', '.join('{0:x}--{1:x} = {2}'.format(p, p + s, d)
+                         for (virt, p, s), d in zip(pieces, desc))
+
+    @lazy_property
+    def symtab(self):
+        """The SymbolTable made from `nm -n' of the vmlinux."""
+        return self.load_symbol_table()
+
+    @lazy_property
+    def kconfig(self):
+        """The KernelConfig saved in the dump (empty if it can't be
+        read)."""
+        config = self.read_config()
+        if config is None:
+            print_out_str('!!! Could not get saved configuration')
+            print_out_str(
+                '!!! This is really bad and probably indicates RAM corruption')
+            print_out_str('!!! Some features may be disabled!')
+            config = KernelConfig()
+        elif self.info is not None and self.info_path is not None:
+            self.info['kconfig'] = config.lines
+            save_dump_info(self.info_path, self.info_fingerprint, self.info)
+        return config
+
+    @lazy_property
+    def config(self):
+        """The lines of the saved kernel configuration."""
+        return self.kconfig.lines
+
+    @lazy_property
+    def unwind(self):
+        """The Unwinder for kernel backtraces."""
+        return self.Unwinder(self)
+
+    def load_symbol_table(self):
+        symbols = None
+        if self.symcache is not None:
+            symbols = self.symcache.get_blob('nm')
+        if symbols is None:
+            stream = os.popen(self.nm_path + ' -n ' + self.vmlinux)
+            symbols = stream.read()
+            stream.close()
+            if self.symcache is not None:
+                self.symcache.put_blob('nm', symbols)
+        return SymbolTable.from_nm(symbols)
 
     def addr_lookup(self, symbol):
         try:
@@ -1153,6 +1636,43 @@ class RamDump():
         except gdbmi.GdbMIException:
             pass
 
+    def field_offsets(self, the_type, fields):
+        """Returns a list with the offsets of `fields' in `the_type',
+        looked up in a single batch. Like `field_offset' a field that
+        can't be found gives None.
+
+        I.e.:
+
+            list_offset, name_offset = dump.field_offsets(
+                'struct kmem_cache', ('list', 'name'))
+
+        """
+        return self.gdbmi.field_offsets(the_type, fields)
+
+    def struct_layout(self, the_type, fields):
+        """Returns the (cached) StructLayout for `fields' of `the_type'.
+        See structview.StructLayout for the format of `fields'."""
+        key = (the_type, tuple(tuple(f) for f in fields))
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = StructLayout(self, the_type, key[1])
+            self._layouts[key] = layout
+        return layout
+
+    def view(self, the_type, address, fields):
+        """Reads the struct `the_type' at `address' in one go and returns
+        a view of it with `fields' decoded as attributes, or None if it
+        can't be read.
+
+        I.e.:
+
+            task = dump.view('struct task_struct', addr,
+                             (('pid', 'I'), ('comm', '16s')))
+            print task.comm, task.pid
+
+        """
+        return self.struct_layout(the_type, fields).view(address)
+
     def unwind_lookup(self, addr, symbol_size=0):
         if (addr is None):
             return ('(Invalid address)', 0x0)
@@ -1162,57 +1682,135 @@ class RamDump():
         if (addr < self.page_offset):
             return ('(No symbol for address {0:x})'.format(addr), 0x0)
 
-        low = 0
-        high = len(self.lookup_table)
-        # Python now complains about division producing floats
-        mid = (low + high) >> 1
-        premid = 0
+        return self.symtab.lookup(addr, symbol_size)
+
+    def unwind_lookup_many(self, addrs, symbol_size=0):
+        """Like `unwind_lookup' for every address in `addrs', returning a
+        list of the results. Much faster than calling `unwind_lookup' in
+        a loop when symbolizing a lot of addresses."""
+        results = [None] * len(addrs)
+        kernel = []
+        for i, addr in enumerate(addrs):
+            if addr is None or addr < self.page_offset:
+                results[i] = self.unwind_lookup(addr, symbol_size)
+            else:
+                kernel.append(i)
+        found = self.symtab.lookup_many([addrs[i] for i in kernel],
+                                        symbol_size)
+        for i, r in zip(kernel, found):
+            results[i] = r
+        return results
 
-        while(not(addr >= self.lookup_table[mid][0] and addr < self.lookup_table[mid + 1][0])):
+    def read_physical(self, addr, length, trace=False):
+        if trace:
+            region = self.physmem.find_region(addr)
+            if region is None:
+                return None
+            print_out_str('reading from {0}'.format(region.path))
+            print_out_str('start = {0:x}'.format(region.start))
+            print_out_str('end = {0:x}'.format(region.end))
+            print_out_str('length = {0:x}'.format(length))
+            print_out_str('offset = {0:x}'.format(addr - region.start))
+        a = self.physmem.read(addr, length)
+        if trace and a is not None:
+            print_out_str('result = {0}'.format(a))
+            print_out_str('lenght = {0}'.format(len(a)))
+        return a
 
-            if(addr < self.lookup_table[mid][0]):
-                high = mid - 1
+    def get_struct(self, format_string):
+        """Returns a (cached) compiled struct.Struct for `format_string'."""
+        st = self._structs.get(format_string)
+        if st is None:
+            st = struct.Struct(format_string)
+            self._structs[format_string] = st
+        return st
 
-            if(addr > self.lookup_table[mid][0]):
-                low = mid + 1
+    def phys_runs(self, address, length, virtual=True):
+        """Splits the range [address, address + length) into physically
+        contiguous runs. Translation is done a page at a time and
+        neighbouring pages that are also contiguous in physical memory
+        are merged.
 
-            mid = (high + low) >> 1
+        Returns a list of (phys_addr, length) tuples, or None if part of
+        the range can't be translated.
 
-            if(mid == premid):
+        """
+        if not virtual:
+            return [(address, length)]
+        runs = []
+        run_phys = None
+        run_len = 0
+        end = address + length
+        while address < end:
+            page_end = (address | (PAGE_SIZE - 1)) + 1
+            n = min(page_end, end) - address
+            phys = self.virt_to_phys(address)
+            if phys is None:
                 return None
-            if (mid + 1) >= len(self.lookup_table) or mid < 0:
+            if run_phys is not None and run_phys + run_len == phys:
+                run_len += n
+            else:
+                if run_phys is not None:
+                    runs.append((run_phys, run_len))
+                run_phys = phys
+                run_len = n
+            address += n
+        if run_phys is not None:
+            runs.append((run_phys, run_len))
+        return runs
+
+    def read_bytes(self, address, length, virtual=True, cpu=None):
+        """Reads `length' bytes starting at `address' with one read per
+        physically contiguous run.
+
+        Returns a byte string, or None if any part of the range can't be
+        read.
+
+        """
+        if address is None:
+            return None
+        if virtual and cpu is not None:
+            address += self.per_cpu_offset(cpu)
+        runs = self.phys_runs(address, length, virtual)
+        if runs is None:
+            return None
+        chunks = []
+        for phys, n in runs:
+            s = self.physmem.read_range(phys, n)
+            if s is None:
                 return None
+            chunks.append(s)
+        if len(chunks) == 1:
+            return chunks[0]
+        return b''.join(chunks)
 
-            premid = mid
+    def read_words(self, address, count, virtual=True, cpu=None):
+        """Reads `count' consecutive 32-bit words starting at `address'.
 
-        if symbol_size == 0:
-            return (self.lookup_table[mid][1], addr - self.lookup_table[mid][0])
-        else:
-            return (self.lookup_table[mid][1], self.lookup_table[mid + 1][0] - self.lookup_table[mid][0])
+        Returns an array('I'), or None if the range can't be read.
 
-    def read_physical(self, addr, length, trace=False):
-        ebi = (-1, -1, -1)
-        for a in self.ebi_files:
-            fd, start, end, path = a
-            if addr >= start and addr <= end:
-                ebi = a
-                break
-        if ebi[0] is -1:
+        """
+        s = self.read_bytes(address, count * 4, virtual, cpu)
+        if s is None:
             return None
-        if trace:
-            print_out_str('reading from {0}'.format(ebi[0]))
-            print_out_str('start = {0:x}'.format(ebi[1]))
-            print_out_str('end = {0:x}'.format(ebi[2]))
-            print_out_str('length = {0:x}'.format(length))
-        offset = addr - ebi[1]
-        if trace:
-            print_out_str('offset = {0:x}'.format(offset))
-        ebi[0].seek(offset)
-        a = ebi[0].read(length)
-        if trace:
-            print_out_str('result = {0}'.format(a))
-            print_out_str('lenght = {0}'.format(len(a)))
-        return a
+        words = array.array('I')
+        words.fromstring(s)
+        if sys.byteorder != 'little':
+            words.byteswap()
+        return words
+
+    def read_array(self, address, format_string, count, virtual=True, cpu=None):
+        """Reads `count' consecutive elements described by
+        `format_string' (as for read_string) starting at `address'.
+
+        Returns a list of tuples, or None if the range can't be read.
+
+        """
+        st = self.get_struct(format_string)
+        s = self.read_bytes(address, st.size * count, virtual, cpu)
+        if s is None:
+            return None
+        return [st.unpack_from(s, i * st.size) for i in xrange(count)]
 
     def read_dword(self, address, virtual=True, trace=False, cpu=None):
         if trace:
@@ -1256,7 +1854,7 @@ class RamDump():
         addr = address
         if virtual:
             if cpu is not None:
-                address += pcpu_offset + self.per_cpu_offset(cpu)
+                address += self.per_cpu_offset(cpu)
             addr = self.virt_to_phys(address)
         s = self.read_physical(addr, max_length)
         if s is not None:
@@ -1276,29 +1874,24 @@ class RamDump():
                 address += pcpu_offset
                 per_cpu_string = ' with per-cpu offset of ' + hex(pcpu_offset)
             addr = self.virt_to_phys(address)
+        if addr is None:
+            return None
         if trace:
             print_out_str('reading from phys {0:x}{1}'.format(addr,
                                                               per_cpu_string))
-        s = self.read_physical(addr, struct.calcsize(format_string), trace)
-        if (s is None) or (s == ''):
+        s = self.physmem.unpack(self.get_struct(format_string), addr)
+        if s is None:
             if trace:
                 print_out_str(
                     'address {0:x} failed hard core (v {1} t{2})'.format(addr, virtual, trace))
             return None
-        return struct.unpack(format_string, s)
+        return s
 
     def per_cpu_offset(self, cpu):
-        per_cpu_offset_addr = self.addr_lookup('__per_cpu_offset')
-        if per_cpu_offset_addr is None:
-            return 0
-        per_cpu_offset_addr_indexed = self.array_index(
-            per_cpu_offset_addr, 'unsigned long', cpu)
-        return self.read_word(per_cpu_offset_addr_indexed)
+        return self.percpu.offset(cpu)
 
     def get_num_cpus(self):
-        cpu_present_bits_addr = self.addr_lookup('cpu_present_bits')
-        cpu_present_bits = self.read_word(cpu_present_bits_addr)
-        return bin(cpu_present_bits).count('1')
+        return len(self.percpu.present_cpus())
 
     def iter_cpus(self):
-        return xrange(self.get_num_cpus())
+        return iter(self.percpu.present_cpus())
@@ -17,7 +17,9 @@ from optparse import OptionParser
 
 import parser_util
 from ramdump import RamDump
-from print_out import print_out_str, set_outfile, print_out_section
+from print_out import print_out_str, set_outfile, configure_output, \
+    DEFAULT_FLUSH_SIZE
+from symcache import DEFAULT_CACHE_DIR
 
 # Please update version when something is changed!'
 VERSION = '2.0'
@@ -72,11 +74,30 @@ if __name__ == '__main__':
         help='Force the hardware detection to a specific hardware version')
     parser.add_option('', '--parse-qdss', action='store_true',
                       dest='qdss', help='Parse QDSS (deprecated)')
-
-    for p in parser_util.get_parsers():
+    parser.add_option('', '--cache-dir', dest='cache_dir',
+                      help='Directory for the persistent symbol cache (default {0})'.format(DEFAULT_CACHE_DIR),
+                      default=DEFAULT_CACHE_DIR)
+    parser.add_option('', '--no-cache', action='store_true',
+                      dest='no_cache', help='Do not use the persistent symbol cache', default=False)
+    parser.add_option('', '--compress-output', type='choice',
+                      choices=['gzip', 'zstd'], dest='compress_output',
+                      help='Compress the output file and text reports (gzip or zstd)')
+    parser.add_option('', '--output-buffer-size', type='int',
+                      dest='output_buffer_size', default=DEFAULT_FLUSH_SIZE,
+                      help='Bytes of output to buffer before writing (default {0})'.format(DEFAULT_FLUSH_SIZE))
+    parser.add_option('', '--timings', action='store_true', dest='timings',
+                      help='Print how long loading each part of the dump took', default=False)
+    parser.add_option('', '--folded-stacks-group', type='choice',
+                      choices=['state', 'comm'], dest='folded_stacks_group',
+                      help='Group the stacks written by --print-folded-stacks by task state or comm')
+    parser.add_option('-j', '--jobs', type='int', dest='jobs', default=1,
+                      help='Number of parsers to run in parallel (default 1)')
+
+    parser_configs = parser_util.get_parsers()
+    for p in parser_configs:
         parser.add_option(p.shortopt or '',
                           p.longopt,
-                          dest=p.cls.__name__,
+                          dest=p.name,
                           help=p.desc,
                           action='store_true')
 
@@ -94,6 +115,8 @@ if __name__ == '__main__':
         # sometime in the future
         options.outfile = 'dmesg_TZ.txt'
 
+    configure_output(options.compress_output, options.output_buffer_size)
+
     if not options.stdout:
         set_outfile(options.outdir + '/' + options.outfile)
 
@@ -186,9 +209,18 @@ if __name__ == '__main__':
         print_out_str("!!! If this tool is being run from a shared location, contact the maintainer")
         sys.exit(1)
 
+    if options.no_cache:
+        cache_dir = None
+    else:
+        cache_dir = options.cache_dir
+        print_out_str('Using symbol cache in {0}'.format(cache_dir))
+
     dump = RamDump(options.vmlinux, nm_path, gdb_path, options.ram_addr,
                    options.autodump, options.phys_offset, options.outdir,
-                   options.force_hardware, options.force_hardware_version)
+                   options.force_hardware, options.force_hardware_version,
+                   cache_dir)
+
+    dump.folded_stacks_group = options.folded_stacks_group
 
     if not dump.print_command_line():
         print_out_str('!!! Error printing saved command line.')
@@ -206,13 +238,24 @@ if __name__ == '__main__':
         get_wdog_timing(dump)
         print_out_str('---------- end watchdog time-----')
 
-    for p in parser_util.get_parsers():
-        # we called parser.add_option with dest=p.cls.__name__ above,
-        # so if the user passed that option then `options' will have a
-        # p.cls.__name__ attribute.
-        if getattr(options, p.cls.__name__) or (options.everything and not p.optional):
-            with print_out_section(p.cls.__name__):
-                p.cls(dump).parse()
+    # we called parser.add_option with dest=p.name above, so if the
+    # user passed that option then `options' will have a p.name
+    # attribute. Only the parsers picked here get imported.
+    parsers = [p for p in parser_configs
+               if getattr(options, p.name) or
+               (options.everything and not p.optional)]
+
+    if options.jobs > 1 and len(parsers) > 1:
+        parser_util.run_parsers_parallel(dump, parsers, options.jobs)
+    else:
+        for p in parsers:
+            parser_util.run_parser(dump, p)
 
     if options.t32launcher or options.everything:
         dump.create_t32_launcher()
+
+    if options.timings:
+        print_out_str('\n--------- timings -------')
+        for name, seconds in dump.timings.iteritems():
+            print_out_str('{0:20} {1:.3f}s'.format(name, seconds))
+        print_out_str('---------- end timings -----')
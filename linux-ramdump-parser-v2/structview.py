@@ -0,0 +1,199 @@
+# Copyright (c) 2014, The Linux Foundation. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 and
+# only version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import re
+import struct
+
+_FIELD_FORMAT_RE = re.compile(r'^(\d*)([bBhHiIlLqQs])$')
+
+
+class Pointer(object):
+
+    """Field format for a pointer to another struct. Accessing the field
+    reads the struct it points to (only the first time) and returns a
+    view of it, or None for a NULL pointer. `fields' is the list of
+    fields of the target struct to decode, as for StructLayout."""
+
+    format_char = 'I'
+
+    def __init__(self, the_type, fields):
+        self.the_type = the_type
+        self.fields = tuple(fields)
+
+    def __eq__(self, other):
+        return (isinstance(other, Pointer) and
+                (self.the_type, self.fields) == (other.the_type, other.fields))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.the_type, self.fields))
+
+
+class StructView(object):
+
+    """Base class of the view classes made by StructLayout. A view has an
+    `address' attribute plus one attribute per field."""
+
+    __slots__ = ('address',)
+
+    def __repr__(self):
+        return '<{0} at 0x{1:x}>'.format(self._layout.the_type, self.address)
+
+
+class StructLayout(object):
+
+    """Decoder for (some of) the fields of a struct.
+
+    `fields' lists (attribute, format) or (attribute, format, member)
+    tuples. `member' is a field path as taken by RamDump.field_offset
+    (e.g. 'se.on_rq') and defaults to `attribute'. `format' is a single
+    struct module format code ('I', 'H', 'B', 'Q', 'i', ...), 'Ns' for
+    a char array that is returned up to its first NUL, or a Pointer.
+
+    The member offsets and the size of the struct are looked up once
+    when the layout is made. A view then reads the whole struct with a
+    single read and decodes every field with one precompiled
+    struct.Struct into the `__slots__' of a class made for the layout:
+
+        layout = StructLayout(dump, 'struct task_struct',
+                              (('pid', 'I'), ('comm', '16s')))
+        task = layout.view(addr)
+        print task.pid, task.comm
+
+    Fields that don't exist in this kernel read as None.
+
+    """
+
+    def __init__(self, ramdump, the_type, fields):
+        self.ramdump = ramdump
+        self.the_type = the_type
+        self.fields = tuple(fields)
+        attrs = [f[0] for f in self.fields]
+        members = [f[2] if len(f) > 2 else f[0] for f in self.fields]
+        formats = [f[1] for f in self.fields]
+        offsets = ramdump.field_offsets(the_type, members)
+        size = ramdump.sizeof(the_type) or 0
+
+        self.missing = []
+        self.strings = []
+        self.pointers = {}
+        placed = []
+        for attr, fmt, offset in zip(attrs, formats, offsets):
+            if offset is None:
+                self.missing.append(attr)
+                continue
+            if isinstance(fmt, Pointer):
+                self.pointers[attr] = fmt
+                fmt = Pointer.format_char
+            elif _FIELD_FORMAT_RE.match(fmt) is None:
+                raise ValueError('Bad format {0} for field {1}'.format(
+                    fmt, attr))
+            elif fmt.endswith('s'):
+                self.strings.append(attr)
+            placed.append((offset, attr, fmt))
+        placed.sort()
+
+        # one Struct for all of the fields, skipping over the bytes in
+        # between, as long as they don't overlap (e.g. members of a
+        # union); otherwise one Struct per field
+        fmt = ['<']
+        end = 0
+        for offset, attr, field_fmt in placed:
+            if offset < end:
+                fmt = None
+                break
+            if offset > end:
+                fmt.append('{0}x'.format(offset - end))
+            fmt.append(field_fmt)
+            end = offset + struct.calcsize('<' + field_fmt)
+        if fmt is not None:
+            self.struct = struct.Struct(''.join(fmt))
+            self.field_structs = None
+        else:
+            self.struct = None
+            self.field_structs = [(struct.Struct('<' + f), o)
+                                  for o, a, f in placed]
+            end = max(o + s.size for s, o in self.field_structs)
+        self.slot_names = [attr for o, attr, f in placed]
+        self.size = max(size, end)
+        self.view_class = self._make_class()
+
+    def _make_class(self):
+        slots = []
+        namespace = {'_layout': self}
+        for attr in self.slot_names:
+            if attr in self.pointers:
+                slots.append('_raw_' + attr)
+                slots.append('_view_' + attr)
+                namespace[attr] = _pointer_property(attr, self.pointers[attr])
+            else:
+                slots.append(attr)
+        namespace['__slots__'] = tuple(slots)
+        for attr in self.missing:
+            namespace[attr] = None
+        name = re.sub(r'\W', '_', self.the_type.replace('struct ', ''))
+        return type(name + '_view', (StructView,), namespace)
+
+    def decode(self, address, data):
+        """Returns a view of the struct at `address' from its bytes."""
+        if self.struct is not None:
+            values = self.struct.unpack_from(data)
+        else:
+            values = [st.unpack_from(data, offset)[0]
+                      for st, offset in self.field_structs]
+        view = self.view_class()
+        view.address = address
+        for attr, value in zip(self.slot_names, values):
+            if attr in self.pointers:
+                setattr(view, '_raw_' + attr, value)
+                setattr(view, '_view_' + attr, None)
+            else:
+                setattr(view, attr, value)
+        for attr in self.strings:
+            value = getattr(view, attr)
+            setattr(view, attr, value.split('\0', 1)[0])
+        return view
+
+    def view(self, address):
+        """Returns a view of the struct at `address', or None if it can't
+        be read."""
+        if address is None:
+            return None
+        data = self.ramdump.read_bytes(address, self.size)
+        if data is None:
+            return None
+        return self.decode(address, data)
+
+
+def _pointer_property(attr, pointer):
+    raw_slot = '_raw_' + attr
+    view_slot = '_view_' + attr
+
+    def get(self):
+        target = getattr(self, view_slot)
+        if target is None:
+            address = getattr(self, raw_slot)
+            if not address:
+                return None
+            target = self._layout.ramdump.view(
+                pointer.the_type, address, pointer.fields)
+            setattr(self, view_slot, target)
+        return target
+
+    return property(get, doc='View of what {0} points to'.format(attr))
+
+
+def pointer_value(view, attr):
+    """Returns the address stored in Pointer field `attr' of `view'
+    without following it."""
+    return getattr(view, '_raw_' + attr, None)
@@ -0,0 +1,133 @@
+# Copyright (c) 2014, The Linux Foundation. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 and
+# only version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import os
+import sqlite3
+
+from elf import elf_identity
+from print_out import print_out_str
+
+# Bump this whenever the layout of the cache or the meaning of what's
+# stored in it changes. Caches with a different version are thrown away.
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join('~', '.ramdump_parser_cache')
+
+
+class SymbolCache(object):
+
+    """Persistent per-vmlinux cache of symbol and type information.
+
+    The cache lives in an sqlite database named after the vmlinux
+    identity (its build-id, or a hash of its contents if it doesn't
+    have one), so it is shared by every dump parsed against the same
+    kernel. Two kinds of data are stored:
+
+    - gdb command results (field offsets, sizeofs, symbol addresses,
+      enum values, ...). Failed lookups are stored too so that they
+      don't need gdb on the next run either.
+
+    - named blobs, such as the output of `nm -n'.
+
+    Writes are batched and committed on flush() or close().
+
+    """
+
+    def __init__(self, vmlinux, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = DEFAULT_CACHE_DIR
+        cache_dir = os.path.expanduser(cache_dir)
+        self.key = elf_identity(vmlinux)
+        self.path = os.path.join(cache_dir, self.key + '.db')
+        self._dirty = False
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self._db = sqlite3.connect(self.path, timeout=30)
+        self._db.text_factory = str
+        self._setup()
+
+    def _setup(self):
+        db = self._db
+        db.execute('CREATE TABLE IF NOT EXISTS meta '
+                   '(name TEXT PRIMARY KEY, value TEXT)')
+        row = db.execute(
+            "SELECT value FROM meta WHERE name = 'version'").fetchone()
+        if row is not None and row[0] != str(CACHE_VERSION):
+            db.execute('DROP TABLE IF EXISTS gdb')
+            db.execute('DROP TABLE IF EXISTS blobs')
+        db.execute('CREATE TABLE IF NOT EXISTS gdb '
+                   '(cmd TEXT PRIMARY KEY, lines TEXT, oob_lines TEXT)')
+        db.execute('CREATE TABLE IF NOT EXISTS blobs '
+                   '(name TEXT PRIMARY KEY, data BLOB)')
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                   (str(CACHE_VERSION),))
+        db.commit()
+
+    def get_gdb(self, cmd):
+        """Returns the (lines, oob_lines) gdb printed for `cmd' or None if
+        `cmd' isn't cached."""
+        row = self._db.execute(
+            'SELECT lines, oob_lines FROM gdb WHERE cmd = ?', (cmd,)).fetchone()
+        if row is None:
+            return None
+        return (_split_lines(row[0]), _split_lines(row[1]))
+
+    def put_gdb(self, cmd, lines, oob_lines):
+        self._db.execute('INSERT OR REPLACE INTO gdb VALUES (?, ?, ?)',
+                         (cmd, _join_lines(lines), _join_lines(oob_lines)))
+        self._dirty = True
+
+    def get_blob(self, name):
+        row = self._db.execute(
+            'SELECT data FROM blobs WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        return str(row[0])
+
+    def put_blob(self, name, data):
+        self._db.execute('INSERT OR REPLACE INTO blobs VALUES (?, ?)',
+                         (name, sqlite3.Binary(data)))
+        self._dirty = True
+
+    def flush(self):
+        if self._dirty:
+            self._db.commit()
+            self._dirty = False
+
+    def close(self):
+        if self._db is None:
+            return
+        self.flush()
+        self._db.close()
+        self._db = None
+
+
+def _join_lines(lines):
+    # None (rather than '') marks an empty list so that [''] round-trips
+    if not lines:
+        return None
+    return '\n'.join(lines)
+
+
+def _split_lines(s):
+    if s is None:
+        return []
+    return s.split('\n')
+
+
+def open_symbol_cache(vmlinux, cache_dir=None):
+    """Returns a SymbolCache for `vmlinux' or None if the cache can't be
+    used (e.g. the cache directory isn't writable)."""
+    try:
+        return SymbolCache(vmlinux, cache_dir)
+    except (EnvironmentError, sqlite3.Error) as e:
+        print_out_str('!!! Symbol cache disabled: {0}'.format(e))
+        return None
@@ -0,0 +1,90 @@
+# Copyright (c) 2014, The Linux Foundation. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 and
+# only version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import bisect
+from array import array
+
+
+class SymbolTable(object):
+
+    """Address to symbol lookups over a sorted symbol list (e.g. the
+    output of `nm -n').
+
+    The addresses are kept in an array('L') with the (interned) names in
+    a parallel list, so a lookup is a bisect over a compact array.
+
+    """
+
+    def __init__(self, symbols=()):
+        """`symbols' is a list of (address, name) tuples sorted by
+        address."""
+        self.addrs = array('L')
+        self.names = []
+        for addr, name in symbols:
+            self.addrs.append(addr)
+            self.names.append(intern(name))
+
+    @classmethod
+    def from_nm(cls, text):
+        """Builds a SymbolTable from the output of `nm -n'."""
+        table = cls()
+        addrs = table.addrs
+        names = table.names
+        for line in text.splitlines():
+            s = line.split(' ')
+            if len(s) == 3:
+                addrs.append(int(s[0], 16))
+                names.append(intern(s[2].rstrip()))
+        return table
+
+    def __len__(self):
+        return len(self.addrs)
+
+    def _index(self, addr):
+        """Returns the index of the symbol containing `addr' or -1. An
+        address past the last symbol isn't considered to be in any
+        symbol since we don't know where that symbol ends."""
+        i = bisect.bisect_right(self.addrs, addr) - 1
+        if i + 1 >= len(self.addrs):
+            return -1
+        return i
+
+    def _result(self, i, addr, symbol_size):
+        if i < 0:
+            return None
+        if symbol_size == 0:
+            return (self.names[i], addr - self.addrs[i])
+        return (self.names[i], self.addrs[i + 1] - self.addrs[i])
+
+    def lookup(self, addr, symbol_size=0):
+        """Returns (name, offset into the symbol) for `addr', or (name,
+        size of the symbol) if symbol_size is non-zero. Returns None if
+        `addr' isn't in any symbol."""
+        return self._result(self._index(addr), addr, symbol_size)
+
+    def lookup_many(self, addrs, symbol_size=0):
+        """Like `lookup' for every address in `addrs'. Returns a list of
+        the results in the same order.
+
+        The distinct addresses are sorted and resolved in one pass, each
+        bisect starting where the previous one ended.
+
+        """
+        found = {}
+        table = self.addrs
+        last = len(table) - 1
+        lo = 0
+        for addr in sorted(set(addrs)):
+            i = bisect.bisect_right(table, addr, lo) - 1
+            lo = max(i, 0)
+            found[addr] = i if i < last else -1
+        return [self._result(found[addr], addr, symbol_size)
+                for addr in addrs]
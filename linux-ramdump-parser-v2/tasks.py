@@ -0,0 +1,118 @@
+# Copyright (c) 2014, The Linux Foundation. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 and
+# only version 2 as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Walkers for the kernel's task lists. The tasks are returned as views
+# of struct task_struct (see structview.py) so each task is read with a
+# single read:
+#
+#     for task in for_each_task(dump, TASK_FIELDS):
+#         for thread in for_each_thread(dump, task, TASK_FIELDS):
+#             print thread.comm, thread.pid
+#
+# Visited tasks are kept in a set, so a corrupt (cyclic) list is
+# noticed in time linear in its length.
+
+# the fields of struct task_struct most users want
+TASK_FIELDS = (
+    ('comm', '16s'),
+    ('pid', 'I'),
+    ('state', 'I'),
+    ('exit_state', 'I'),
+    ('stack', 'I'),
+)
+
+# the fields needed to name a task
+TASK_NAME_FIELDS = (
+    ('comm', '16s'),
+    ('pid', 'I'),
+)
+
+# the list links, which the walkers add to the fields asked for
+_LINK_FIELDS = (
+    ('tasks_next', 'I', 'tasks.next'),
+    ('thread_group_next', 'I', 'thread_group.next'),
+)
+
+
+def _with_links(fields):
+    names = set(f[0] for f in fields)
+    return tuple(fields) + tuple(f for f in _LINK_FIELDS if f[0] not in names)
+
+
+def _walk_tasks(ramdump, first, member, link, fields, on_cycle, what,
+                task=None):
+    # `task', if given, is the view of `first' already read
+    offset = ramdump.field_offset('struct task_struct', member)
+    if offset is None:
+        return
+    seen = set()
+    addr = first
+    while True:
+        if task is None:
+            task = ramdump.view('struct task_struct', addr, fields)
+            if task is None:
+                return
+        yield task
+        seen.add(addr)
+        next_node = getattr(task, link)
+        task = None
+        if not next_node:
+            return
+        addr = next_node - offset
+        if addr == first:
+            return
+        if addr in seen:
+            if on_cycle is not None:
+                on_cycle('!!!! Cycle in {0}! The list is corrupt!'.format(what))
+            return
+
+
+def for_each_task(ramdump, fields=TASK_FIELDS, on_cycle=None):
+    """Yields a view of every process (thread group leader), starting
+    with init_task, with the given fields (as for StructLayout) plus
+    `tasks_next' and `thread_group_next'.
+
+    If the list turns out to be cyclic the walk stops and `on_cycle',
+    if given, is called with a message saying so.
+
+    """
+    init_task = ramdump.addr_lookup('init_task')
+    if init_task is None:
+        return
+    for task in _walk_tasks(ramdump, init_task, 'tasks', 'tasks_next',
+                            _with_links(fields), on_cycle, 'task list'):
+        yield task
+
+
+def for_each_thread(ramdump, task, fields=TASK_FIELDS, on_cycle=None):
+    """Yields a view of every thread in the thread group of `task' (a
+    view returned by for_each_task), starting with `task' itself. The
+    views have the same fields as for for_each_task."""
+    for thread in _walk_tasks(ramdump, task.address, 'thread_group',
+                              'thread_group_next', _with_links(fields),
+                              on_cycle, 'thread group', task):
+        yield thread
+
+
+def read_task(ramdump, addr, fields=TASK_NAME_FIELDS):
+    """Returns a view of the task_struct at `addr', or None if it can't
+    be read."""
+    if not addr:
+        return None
+    return ramdump.view('struct task_struct', addr, fields)
+
+
+def task_name(ramdump, addr):
+    """Returns the comm of the task_struct at `addr', or None."""
+    task = read_task(ramdump, addr)
+    if task is None:
+        return None
+    return task.comm